@@ -1,12 +1,9 @@
 from app.agents.base_agent import BaseAgent
+from app.core.llm.prompts import register_prompt
 from app.agents.models import UserContext, IntentAnalysis
 import json
 
-class AIResponseAgent(BaseAgent):
-    """专门负责生成标准化AI回答的Agent"""
-    def __init__(self):
-        super().__init__()
-        self.system_prompt = """你是一个专业的企业培训和工作顾问，负责根据用户的问题提供专业、准确、实用的回答。请生成回答，并返回以下格式的 JSON 响应：
+AI_RESPONSE_PROMPT = register_prompt("ai_response", "v1", """你是一个专业的企业培训和工作顾问，负责根据用户的问题提供专业、准确、实用的回答。请生成回答，并返回以下格式的 JSON 响应：
 {
     "response": {
         "main_answer": "主要回答内容",
@@ -34,12 +31,18 @@ class AIResponseAgent(BaseAgent):
 5. 常见问题应该具有代表性
 6. 最佳实践应该符合企业场景
 7. 相关资源应该有助于深入学习
-8. 返回的必须是合法的 JSON 格式"""
+8. 返回的必须是合法的 JSON 格式""")
+
+class AIResponseAgent(BaseAgent):
+    """专门负责生成标准化AI回答的Agent"""
+    agent_name = "ai_response"
 
     async def generate_response(self, context: UserContext, intent_analysis: IntentAnalysis) -> dict:
         """生成标准化的AI回答"""
         messages = [
-            {"role": "system", "content": self.system_prompt},
+            {"role": "system", "content": AI_RESPONSE_PROMPT.system},
+            # 会话摘要和之前的轮次放在系统提示词之后，固定前缀仍然可以命中上游缓存
+            *context.messages[:-1],
             {"role": "user", "content": f"""请根据以下信息生成专业的回答：
 
 用户意图：{intent_analysis.intent}
@@ -80,7 +83,9 @@ class AIResponseAgent(BaseAgent):
     async def generate_response_stream(self, context: UserContext, intent_analysis: IntentAnalysis):
         """流式生成标准化的AI回答"""
         messages = [
-            {"role": "system", "content": self.system_prompt},
+            {"role": "system", "content": AI_RESPONSE_PROMPT.system},
+            # 会话摘要和之前的轮次放在系统提示词之后，固定前缀仍然可以命中上游缓存
+            *context.messages[:-1],
             {"role": "user", "content": f"""请根据以下信息生成专业的回答：
 
 用户意图：{intent_analysis.intent}
@@ -93,17 +98,9 @@ class AIResponseAgent(BaseAgent):
         # print(f"\n=== AI回答生成请求消息 ===")
         # print(f"Messages: {json.dumps(messages, ensure_ascii=False, indent=2)}")
 
-        processing_steps = [
-            "正在分析问题...",
-            "生成主要回答...",
-            "整理关键信息...",
-            "准备实际案例...",
-            "完善实施步骤...",
-            "总结最佳实践..."
-        ]
-
-        async for result in self._handle_stream_response(messages, temperature=0.7, processing_steps=processing_steps):
-            if "error" in result:
+        # 先按路径逐字段产出 JSONDelta，最后产出完整的回答
+        async for result in self._handle_stream_response(messages, temperature=0.7, partial=True, stage="chat_response"):
+            if isinstance(result, dict) and "error" in result:
                 yield {
                     "error": result["error"],
                     "response": {
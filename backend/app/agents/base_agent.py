@@ -1,65 +1,65 @@
 from app.core.llm.service import LLMService
 from app.agents.models import UserContext
-import json
-import asyncio
-import time
+from app.agents.json_stream import JSONStreamScanner, PartialJSONScanner, delta_content, loads_json_object
+from app.agents.progress import StageProgress
 from typing import AsyncGenerator, Any, Dict, Optional
 
 class BaseAgent:
     """所有 Agent 的基类，提供共同的功能和接口"""
-    def __init__(self):
-        self.llm_service = LLMService()
+    agent_name: Optional[str] = None  # 子类覆盖，用于按 agent 选择 LLM 提供商
+
+    def __init__(self, llm_service: Optional[LLMService] = None):
+        self.llm_service = llm_service or LLMService(agent=self.agent_name)
 
     async def _process_json_response(self, content: str) -> Dict[str, Any]:
         """处理 JSON 响应，包括处理 Markdown 代码块"""
-        content = content.strip()
-        if content.startswith("```json"):
-            content = content[7:]
-        if content.endswith("```"):
-            content = content[:-3]
-        content = content.strip()
-        return json.loads(content)
+        return loads_json_object(content)
 
     async def _handle_stream_response(
         self,
         messages: list,
         temperature: float = 0.3,
-        processing_steps: Optional[list] = None
+        partial: bool = False,
+        stage: Optional[str] = None
     ) -> AsyncGenerator[Any, None]:
-        """处理流式响应的通用方法"""
-        if processing_steps:
-            for step in processing_steps:
-                yield step
-                await asyncio.sleep(1)
+        """
+        处理流式响应的通用方法
 
-        current_json = ""
-        json_started = False
-        json_completed = False
+        在请求模型、收到首个 token、完成和出错时产出 ProgressEvent；
+        partial: 为 True 时在完整结果之前先产出 JSONDelta，调用方可以边生成边展示
+        stage: 进度事件中的阶段名，默认为 agent_name
+        """
+        progress = StageProgress(stage or self.agent_name or "agent")
+        yield progress.started("请求模型")
 
+        scanner = PartialJSONScanner() if partial else JSONStreamScanner()
+        stream = self.llm_service.create_chat_completion_stream(
+            messages=messages,
+            temperature=temperature
+        )
         try:
-            async for chunk in self.llm_service.create_chat_completion_stream(
-                messages=messages,
-                temperature=temperature
-            ):
-                if chunk and "choices" in chunk and chunk["choices"]:
-                    content = chunk["choices"][0].get("delta", {}).get("content", "")
-                    if content:
-                        current_json += content
-
-                        if not json_started and '{' in content:
-                            json_started = True
-
-                        if json_started and not json_completed:
-                            try:
-                                result = await self._process_json_response(current_json)
-                                yield result
-                                json_completed = True
-                            except json.JSONDecodeError:
-                                # JSON 还不完整，继续等待
-                                continue
+            async for chunk in stream:
+                content = delta_content(chunk)
+                if content:
+                    first = progress.first_token()
+                    if first is not None:
+                        yield first
+                results = scanner.feed(content)
+                if partial:
+                    for delta in scanner.drain():
+                        yield delta
+                if results:
+                    # 拿到完整的 JSON 后立即关闭上游流，不再读取剩余输出
+                    await stream.aclose()
+                    yield progress.completed()
+                    yield results[0]
+                    break
 
         except Exception as e:
+            yield progress.failed(str(e))
             yield {"error": str(e)}
+        finally:
+            await stream.aclose()
 
     async def _handle_completion_response(
         self,
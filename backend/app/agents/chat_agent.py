@@ -1,11 +1,11 @@
-from typing import AsyncGenerator
+from typing import AsyncGenerator, Optional
 from app.core.llm.service import LLMService
 import json
 
 class ChatAgent:
     """专门负责对话功能的Agent"""
-    def __init__(self):
-        self.llm_service = LLMService()
+    def __init__(self, llm_service: Optional[LLMService] = None):
+        self.llm_service = llm_service or LLMService(agent="chat")
 
     async def get_response(self, message: str) -> str:
         """
@@ -36,11 +36,12 @@ class ChatAgent:
         获取LLM对用户消息的流式回复
         """
         messages = [{"role": "user", "content": message}]
+        stream = self.llm_service.create_chat_completion_stream(
+            messages=messages,
+            temperature=0.7
+        )
         try:
-            async for chunk in self.llm_service.create_chat_completion_stream(
-                messages=messages,
-                temperature=0.7
-            ):
+            async for chunk in stream:
                 try:
                     if isinstance(chunk, str):
                         # 尝试解析JSON字符串
@@ -54,11 +55,15 @@ class ChatAgent:
                             # 如果不是JSON，直接输出
                             yield chunk
                     elif isinstance(chunk, dict):
-                        if "choices" in chunk and len(chunk["choices"]) > 0:
+                        if "error" in chunk:
+                            yield f"[ERROR] {chunk['error'].get('message', '未知错误')}"
+                        elif "choices" in chunk and len(chunk["choices"]) > 0:
                             content = chunk["choices"][0].get("delta", {}).get("content")
                             if content:
                                 yield content
                 except Exception:
                     continue
         except Exception:
-            yield "[ERROR] Stream ended unexpectedly" 
\ No newline at end of file
+            yield "[ERROR] Stream ended unexpectedly"
+        finally:
+            await stream.aclose() 
\ No newline at end of file
@@ -1,13 +1,14 @@
 from app.core.llm.service import LLMService
 from app.agents.models import IntentAnalysis
+from app.agents.json_stream import JSONStreamScanner, delta_content, first_matching, loads_json_object
+from app.agents.progress import StageProgress
+from typing import Optional
 import json
-import asyncio
-import time
 
 class CollectionStrategyAgent:
     """专门负责催收策略分析的Agent"""
-    def __init__(self):
-        self.llm_service = LLMService()
+    def __init__(self, llm_service: Optional[LLMService] = None):
+        self.llm_service = llm_service or LLMService(agent="collection_strategy")
 
     async def analyze_strategy(self, intent_analysis: IntentAnalysis) -> dict:
         """
@@ -60,16 +61,8 @@ class CollectionStrategyAgent:
                 print(f"\n=== 解析内容 ===")
                 print(f"Content: {content}")
                 
-                # 处理可能包含 Markdown 代码块的情况
-                content = content.strip()
-                if content.startswith("```json"):
-                    content = content[7:]
-                if content.endswith("```"):
-                    content = content[:-3]
-                content = content.strip()
-                
-                # 解析 JSON 响应
-                result = json.loads(content)
+                # 兼容 Markdown 代码块和前后的说明文字
+                result = loads_json_object(content)
                 print(f"\n=== 解析结果 ===")
                 print(f"Result: {json.dumps(result, ensure_ascii=False, indent=2)}")
                 
@@ -96,11 +89,7 @@ class CollectionStrategyAgent:
         """
         流式分析催收策略，返回中间结果和最终结果
         """
-        start_time = time.time()
-        current_time = time.strftime('%H:%M:%S')
-        print(f"\n=== 催收策略分析开始: {current_time} ===")
-        yield f"=== 催收策略分析开始: {current_time} ==="
-        await asyncio.sleep(1)  # 等待1秒
+        progress = StageProgress("collection_strategy")
 
         # 构建系统提示
         system_prompt = """你是一个专业的催收策略分析助手。请根据用户的意图分析结果，生成合适的催收策略。
@@ -135,93 +124,50 @@ class CollectionStrategyAgent:
             {"role": "user", "content": user_message}
         ]
 
-        # 发送处理步骤并等待
-        processing_steps = [
-            "开始分析催收策略...",
-            "正在分析用户意图...",
-            "评估风险等级...",
-            "制定催收策略...",
-            "确定执行优先级...",
-            "生成执行建议..."
-        ]
-
-        for step in processing_steps:
-            yield step
-            await asyncio.sleep(1)  # 每个步骤等待1秒
+        yield progress.started("请求模型")
 
-        # 使用流式响应进行分析
-        current_json = ""
+        # 使用流式响应进行分析，增量扫描输出中的 JSON 对象
+        scanner = JSONStreamScanner()
         last_valid_json = None
-        brace_count = 0
-        in_json = False
 
-        async for chunk in self.llm_service.create_chat_completion_stream(
+        stream = self.llm_service.create_chat_completion_stream(
             messages=messages,
             temperature=0.3
-        ):
-            if chunk and "choices" in chunk and chunk["choices"]:
-                content = chunk["choices"][0].get("delta", {}).get("content", "")
+        )
+        try:
+            async for chunk in stream:
+                content = delta_content(chunk)
                 if content:
-                    current_json += content
-                    
-                    # 计算大括号数量
-                    for char in content:
-                        if char == '{':
-                            brace_count += 1
-                            in_json = True
-                        elif char == '}':
-                            brace_count -= 1
-                            if brace_count == 0 and in_json:
-                                try:
-                                    # 清理和解析 JSON
-                                    json_str = current_json.strip()
-                                    if json_str.startswith("```json"):
-                                        json_str = json_str[7:]
-                                    if json_str.startswith("```"):
-                                        json_str = json_str[3:]
-                                    if json_str.endswith("```"):
-                                        json_str = json_str[:-3]
-                                    json_str = json_str.strip()
-                                    
-                                    # 尝试解析 JSON
-                                    result = json.loads(json_str)
-                                    last_valid_json = result
-                                    
-                                    # 发送部分结果并等待
-                                    yield {
-                                        "partial_strategy": result.get("strategy", "分析中..."),
-                                        "partial_priority": result.get("priority", "medium"),
-                                        "partial_timeline": result.get("timeline", "待定"),
-                                        "partial_approach": result.get("approach", "分析中..."),
-                                        "partial_risk_level": result.get("risk_level", "medium"),
-                                        "partial_notes": result.get("notes", "分析中...")
-                                    }
-                                    await asyncio.sleep(1)  # 每个部分结果等待1秒
-                                    
-                                    # 重置状态
-                                    current_json = ""
-                                    in_json = False
-                                except json.JSONDecodeError:
-                                    # JSON 解析失败，继续累积
-                                    pass
-                                except Exception as e:
-                                    # 其他错误，继续累积
-                                    pass
+                    first = progress.first_token()
+                    if first is not None:
+                        yield first
+                result = first_matching(scanner.feed(content))
+                if result is not None:
+                    last_valid_json = result
+
+                    yield {
+                        "partial_strategy": result.get("strategy", "分析中..."),
+                        "partial_priority": result.get("priority", "medium"),
+                        "partial_timeline": result.get("timeline", "待定"),
+                        "partial_approach": result.get("approach", "分析中..."),
+                        "partial_risk_level": result.get("risk_level", "medium"),
+                        "partial_notes": result.get("notes", "分析中...")
+                    }
+                    # 已解析出完整的 JSON 对象，不再读取上游剩余的输出
+                    break
+        finally:
+            # 提前结束时立即关闭上游流，释放连接和限流器名额
+            await stream.aclose()
 
         try:
             # 返回最后一个有效的 JSON 结果
             if last_valid_json:
-                end_time = time.time()
-                current_time = time.strftime('%H:%M:%S')
-                print(f"=== 催收策略分析完成: {current_time} (耗时: {end_time - start_time:.1f}秒) ===")
-                yield f"=== 催收策略分析完成: {current_time} (耗时: {end_time - start_time:.1f}秒) ==="
-                await asyncio.sleep(1)  # 等待1秒
+                yield progress.completed("催收策略分析完成")
                 yield last_valid_json
             else:
                 raise ValueError("未能获取有效的分析结果")
         except Exception as e:
-            yield "催收策略分析出错"
-            await asyncio.sleep(1)  # 等待1秒
+            yield progress.failed(f"催收策略分析出错: {str(e)}")
             yield {
                 "strategy": "分析错误",
                 "priority": "medium",
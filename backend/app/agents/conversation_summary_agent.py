@@ -0,0 +1,34 @@
+from typing import Dict, List, Optional
+from app.core.llm.prompts import register_prompt
+from app.core.llm.service import LLMService
+
+CONVERSATION_SUMMARY_PROMPT = register_prompt("conversation_summary", "v1", """你是一个对话记录整理助手。请把已有摘要和新增的对话合并成一段新的摘要，供后续对话参考。
+
+请确保：
+1. 保留用户的背景、目标、已经讨论过的问题和得到的主要结论
+2. 保留后续回答需要用到的具体信息（如团队规模、岗位、时间要求）
+3. 删除寒暄和重复内容，不要编造对话中没有的信息
+4. 使用第三人称陈述，不超过 300 字
+5. 只返回摘要正文，不要添加标题或说明""")
+
+_ROLE_NAMES = {"user": "用户", "assistant": "助手", "system": "系统"}
+
+
+class ConversationSummaryAgent:
+    """把超出窗口的对话轮次压缩进滚动摘要"""
+    def __init__(self, llm_service: Optional[LLMService] = None):
+        self.llm_service = llm_service or LLMService(agent="conversation_summary")
+
+    async def summarize(self, summary: str, turns: List[Dict[str, str]]) -> str:
+        dialogue = "\n".join(f"{_ROLE_NAMES.get(turn['role'], turn['role'])}：{turn['content']}" for turn in turns)
+        messages = [
+            {"role": "system", "content": CONVERSATION_SUMMARY_PROMPT.system},
+            {"role": "user", "content": f"""已有摘要：{summary or "无"}
+
+新增对话：
+{dialogue}"""}
+        ]
+        response = await self.llm_service.create_chat_completion(messages=messages, temperature=0.2)
+        if "error" in response:
+            raise ValueError(f"生成会话摘要失败: {response['error']}")
+        return response["choices"][0]["message"]["content"].strip()
@@ -1,13 +1,17 @@
 from app.core.llm.service import LLMService
+from app.core.llm.prompts import register_prompt
+from app.core.llm.prompt_budget import estimate_tokens, get_agent_budget, truncate_text
+from app.core.metrics import COURSE_INDEX_LOAD_DURATION
 from app.agents.models import UserContext, IntentAnalysis
+from app.agents.json_stream import loads_json_object
 import json
 import asyncio
+import hashlib
 import os
 from pathlib import Path
 import time
-from typing import List, Dict, AsyncGenerator
+from typing import List, Dict, AsyncGenerator, Awaitable, Optional, Tuple
 import PyPDF2
-import re
 from collections import defaultdict
 import logging
 
@@ -15,23 +19,110 @@ import logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+COURSE_ANALYSIS_PROMPT = register_prompt("course_recommendation.analysis", "v1", """你是一个专业的课程内容分析助手。请分析给定的课程内容，提取关键信息并按照以下结构返回JSON格式的数据：
+{
+    "title": "课程标题",
+    "description": "课程简介",
+    "background": "课程背景",
+    "objectives": ["课程目标1", "课程目标2", ...],
+    "outline": ["课程大纲1", "课程大纲2", ...],
+    "requirements": ["课程要求1", "课程要求2", ...],
+    "target_audience": "适合人群",
+    "duration": "课程时长",
+    "level": "课程级别",
+    "key_points": ["关键要点1", "关键要点2", ...],
+    "practical_examples": ["实践案例1", "实践案例2", ...],
+    "expected_outcomes": ["预期收获1", "预期收获2", ...],
+    "prerequisites": ["前置知识1", "前置知识2", ...],
+    "teaching_methods": ["教学方法1", "教学方法2", ...],
+    "assessment_methods": ["考核方式1", "考核方式2", ...],
+    "resources": ["学习资源1", "学习资源2", ...],
+    "instructor_info": {
+        "name": "讲师姓名（必填，如果找不到则返回'未知'）",
+        "title": "讲师职称（如：教授、副教授、讲师等）",
+        "background": "讲师背景（包括教育背景、工作经历等）",
+        "expertise": ["专业领域1", "专业领域2", ...],
+        "brief_intro": "一句话简介（如果有）",
+        "achievements": ["主要成就1", "主要成就2", ...],
+        "teaching_experience": "教学经验描述",
+        "research_focus": "研究方向（如果有）"
+    }
+}
+
+请确保：
+1. 提取的信息准确且完整
+2. 对于列表类型的字段，每个项目都应该是独立的要点
+3. 如果某些信息在原文中没有明确提到，对应字段可以留空
+4. 保持专业性和准确性
+5. 去除任何特殊字符和格式问题
+6. 对于讲师信息：
+   - 必须提取讲师姓名，如果找不到则返回"未知"
+   - 从工作背景、课程背景等描述中提取讲师信息
+   - 提取讲师的一句话简介（如果有）
+   - 提取讲师的专业领域和成就
+   - 提取讲师的教学经验和研究方向
+7. 确保所有提取的内容都经过适当的格式化和清理
+8. 直接返回JSON数据，不要包含任何markdown标记""")
+
+COURSE_ENHANCEMENT_PROMPT = register_prompt("course_recommendation.enhancement", "v1", """你是一个专业的课程内容优化助手。请基于给定的结构化课程信息，进行以下优化：
+1. 补充缺失的关键信息
+2. 优化描述的专业性和准确性
+3. 确保内容的完整性和连贯性
+4. 添加相关的实践建议和案例
+5. 优化内容的表达方式
+
+请返回优化后的完整JSON数据，保持原有的数据结构。""")
+
+COURSE_SPLIT_PROMPT = register_prompt("course_recommendation.split", "v1", """你是一个专业的课程内容分析助手。请分析给定的文本内容，识别其中的课程信息。
+请返回JSON格式：
+{
+    "courses": [
+        {
+            "title": "课程标题",
+            "content": "课程内容",
+            "pages": [页码列表]
+        }
+    ]
+}
+
+请确保：
+1. 准确识别课程标题（通常以《》或特殊格式标记）
+2. 保持内容的完整性和连贯性
+3. 去除任何特殊字符和格式问题
+4. 正确记录每个课程对应的页码""")
+
+COURSE_RELEVANCE_PROMPT = register_prompt("course_recommendation.relevance", "v1", """你是一个专业的文本相关性评估助手。请评估查询文本与目标文本的相关性，并返回一个0-1之间的分数。
+分数说明：
+- 1.0: 完全相关
+- 0.8-0.9: 高度相关
+- 0.6-0.7: 中度相关
+- 0.4-0.5: 低度相关
+- 0.0-0.3: 几乎不相关
+
+请只返回分数，不要包含任何其他文字。""")
+
 class CourseRecommendationAgent:
-    _instance = None
-    _is_initialized = False
-
-    def __new__(cls):
-        if cls._instance is None:
-            cls._instance = super(CourseRecommendationAgent, cls).__new__(cls)
-        return cls._instance
-
-    def __init__(self):
-        if not self._is_initialized:
-            self.llm_service = LLMService()
-            self.pdf_dir = os.path.join(os.path.dirname(__file__), "../data/courses")
-            self.course_contents = {}  # 存储课程内容
-            self.course_summaries = []  # 存储课程摘要
-            logger.info(f"初始化课程推荐代理，PDF目录: {self.pdf_dir}")
-            self._is_initialized = True
+    """课程推荐；应用内只创建一个实例（见 app/container.py），课程索引在所有请求间共享"""
+
+    def __init__(self, llm_service: Optional[LLMService] = None):
+        self.llm_service = llm_service or LLMService(agent="course_recommendation")
+        self.pdf_dir = os.path.join(os.path.dirname(__file__), "../data/courses")
+        self.course_contents = {}  # 存储课程内容
+        self.course_summaries = []  # 存储课程摘要
+        self._loaded = False
+        # 课程索引只由一个任务加载，所有请求通过 shield 等待它；等待的请求被取消（客户端断开、
+        # 投机检索被丢弃）不会中断加载，加载完成前其他请求也不会读到只加载了一部分的课程
+        self._load_task: Optional[asyncio.Task] = None
+        logger.info(f"初始化课程推荐代理，PDF目录: {self.pdf_dir}")
+
+    def catalog_version(self) -> str:
+        """课程目录的版本号：PDF 文件名、大小和修改时间的哈希，目录变化时随之改变"""
+        digest = hashlib.sha256()
+        if os.path.isdir(self.pdf_dir):
+            for pdf_file in sorted(Path(self.pdf_dir).glob("*.pdf")):
+                stat = pdf_file.stat()
+                digest.update(f"{pdf_file.name}:{stat.st_size}:{stat.st_mtime_ns}\n".encode("utf-8"))
+        return digest.hexdigest()[:16]
 
     def _structure_content(self, content: str) -> Dict:
         """将内容结构化处理"""
@@ -95,122 +186,87 @@ class CourseRecommendationAgent:
         
         return structured_data
 
-    async def _analyze_content_with_llm(self, content: str) -> Dict:
-        """使用LLM分析课程内容，提取结构化信息"""
+    def _analysis_request(self, content: str) -> Dict:
+        """构造结构化分析课程内容的 LLM 请求参数"""
         messages = [
-            {"role": "system", "content": """你是一个专业的课程内容分析助手。请分析给定的课程内容，提取关键信息并按照以下结构返回JSON格式的数据：
-{
-    "title": "课程标题",
-    "description": "课程简介",
-    "background": "课程背景",
-    "objectives": ["课程目标1", "课程目标2", ...],
-    "outline": ["课程大纲1", "课程大纲2", ...],
-    "requirements": ["课程要求1", "课程要求2", ...],
-    "target_audience": "适合人群",
-    "duration": "课程时长",
-    "level": "课程级别",
-    "key_points": ["关键要点1", "关键要点2", ...],
-    "practical_examples": ["实践案例1", "实践案例2", ...],
-    "expected_outcomes": ["预期收获1", "预期收获2", ...],
-    "prerequisites": ["前置知识1", "前置知识2", ...],
-    "teaching_methods": ["教学方法1", "教学方法2", ...],
-    "assessment_methods": ["考核方式1", "考核方式2", ...],
-    "resources": ["学习资源1", "学习资源2", ...],
-    "instructor_info": {
-        "name": "讲师姓名（必填，如果找不到则返回'未知'）",
-        "title": "讲师职称（如：教授、副教授、讲师等）",
-        "background": "讲师背景（包括教育背景、工作经历等）",
-        "expertise": ["专业领域1", "专业领域2", ...],
-        "brief_intro": "一句话简介（如果有）",
-        "achievements": ["主要成就1", "主要成就2", ...],
-        "teaching_experience": "教学经验描述",
-        "research_focus": "研究方向（如果有）"
-    }
-}
-
-请确保：
-1. 提取的信息准确且完整
-2. 对于列表类型的字段，每个项目都应该是独立的要点
-3. 如果某些信息在原文中没有明确提到，对应字段可以留空
-4. 保持专业性和准确性
-5. 去除任何特殊字符和格式问题
-6. 对于讲师信息：
-   - 必须提取讲师姓名，如果找不到则返回"未知"
-   - 从工作背景、课程背景等描述中提取讲师信息
-   - 提取讲师的一句话简介（如果有）
-   - 提取讲师的专业领域和成就
-   - 提取讲师的教学经验和研究方向
-7. 确保所有提取的内容都经过适当的格式化和清理
-8. 直接返回JSON数据，不要包含任何markdown标记"""},
+            {"role": "system", "content": COURSE_ANALYSIS_PROMPT.system},
             {"role": "user", "content": content}
         ]
+        return {
+            "messages": messages,
+            "temperature": 0.3,  # 使用较低的温度以获得更稳定的结果
+            "cache": True  # 相同的课程内容和查询在重启后也会重复出现
+        }
+
+    def _parse_analysis(self, response: Dict, content: str) -> Dict:
+        """解析结构化分析的响应，失败时回退到基础结构化方法"""
+        if "error" in response:
+            logger.error(f"LLM分析内容时出错: {response['error']}")
+            return self._structure_content(content)
 
+        content = response["choices"][0]["message"]["content"].strip()
         try:
-            response = await self.llm_service.create_chat_completion(
-                messages=messages,
-                temperature=0.3  # 使用较低的温度以获得更稳定的结果
-            )
-            
-            if "error" in response:
-                logger.error(f"LLM分析内容时出错: {response['error']}")
-                return self._structure_content(content)  # 如果LLM失败，回退到基础结构化方法
-                
-            content = response["choices"][0]["message"]["content"].strip()
-            try:
-                # 移除可能的markdown代码块标记
-                content = re.sub(r'^```(?:json)?\s*', '', content)
-                content = re.sub(r'\s*```$', '', content)
-                
-                # 尝试解析JSON响应
-                structured_data = json.loads(content)
-                # 添加原始内容
-                structured_data["raw_content"] = content
-                return structured_data
-            except json.JSONDecodeError:
-                logger.error(f"无法解析LLM响应为JSON: {content}")
-                return self._structure_content(content)  # 如果JSON解析失败，回退到基础结构化方法
-                
+            # 兼容 Markdown 代码块和前后的说明文字
+            structured_data = loads_json_object(content)
+            # 添加原始内容
+            structured_data["raw_content"] = content
+            return structured_data
+        except json.JSONDecodeError:
+            logger.error(f"无法解析LLM响应为JSON: {content}")
+            return self._structure_content(content)
+
+    async def _analyze_content_with_llm(self, content: str) -> Dict:
+        """使用LLM分析课程内容，提取结构化信息"""
+        try:
+            response = await self.llm_service.create_chat_completion(**self._analysis_request(content))
         except Exception as e:
             logger.error(f"LLM分析内容时发生异常: {str(e)}")
             return self._structure_content(content)  # 如果发生异常，回退到基础结构化方法
+        return self._parse_analysis(response, content)
 
-    async def _enhance_content_with_llm(self, structured_data: Dict) -> Dict:
-        """使用LLM增强课程内容的结构化信息"""
+    def _enhancement_request(self, structured_data: Dict) -> Dict:
+        """构造优化结构化课程信息的 LLM 请求参数"""
         messages = [
-            {"role": "system", "content": """你是一个专业的课程内容优化助手。请基于给定的结构化课程信息，进行以下优化：
-1. 补充缺失的关键信息
-2. 优化描述的专业性和准确性
-3. 确保内容的完整性和连贯性
-4. 添加相关的实践建议和案例
-5. 优化内容的表达方式
-
-请返回优化后的完整JSON数据，保持原有的数据结构。"""},
+            {"role": "system", "content": COURSE_ENHANCEMENT_PROMPT.system},
             {"role": "user", "content": json.dumps(structured_data, ensure_ascii=False, indent=2)}
         ]
+        return {
+            "messages": messages,
+            "temperature": 0.2,  # 使用较低的温度以获得更稳定的结果
+            "cache": True
+        }
 
+    def _parse_enhancement(self, response: Dict, structured_data: Dict) -> Dict:
+        """解析优化后的课程信息，失败时保留优化前的数据"""
+        if "error" in response:
+            logger.error(f"LLM优化内容时出错: {response['error']}")
+            return structured_data
+
+        content = response["choices"][0]["message"]["content"].strip()
         try:
-            response = await self.llm_service.create_chat_completion(
-                messages=messages,
-                temperature=0.2  # 使用较低的温度以获得更稳定的结果
-            )
-            
-            if "error" in response:
-                logger.error(f"LLM优化内容时出错: {response['error']}")
-                return structured_data
-                
-            content = response["choices"][0]["message"]["content"].strip()
-            try:
-                enhanced_data = json.loads(content)
-                # 保留原始内容
-                enhanced_data["raw_content"] = structured_data.get("raw_content", "")
-                return enhanced_data
-            except json.JSONDecodeError:
-                logger.error(f"无法解析LLM优化响应为JSON: {content}")
-                return structured_data
-                
+            enhanced_data = loads_json_object(content)
+            # 保留原始内容
+            enhanced_data["raw_content"] = structured_data.get("raw_content", "")
+            return enhanced_data
+        except json.JSONDecodeError:
+            logger.error(f"无法解析LLM优化响应为JSON: {content}")
+            return structured_data
+
+    async def _enhance_content_with_llm(self, structured_data: Dict) -> Dict:
+        """使用LLM增强课程内容的结构化信息"""
+        try:
+            response = await self.llm_service.create_chat_completion(**self._enhancement_request(structured_data))
         except Exception as e:
             logger.error(f"LLM优化内容时发生异常: {str(e)}")
             return structured_data
+        return self._parse_enhancement(response, structured_data)
+
+    async def _run_batch(self, requests: List[Dict], parse) -> List:
+        """并发执行一批 LLM 请求，parse(index, response) 的结果按输入顺序返回"""
+        results: List = [None] * len(requests)
+        async for item in self.llm_service.create_chat_completions_batch(requests):
+            results[item.index] = parse(item.index, item.response)
+        return results
 
     async def _extract_text_from_pdf(self, pdf_path: str) -> List[Dict]:
         """从PDF文件中提取文本内容，并识别不同的课程"""
@@ -232,44 +288,39 @@ class CourseRecommendationAgent:
                     if text.strip():
                         all_text += text + "\n"
                 
-                # 使用LLM一次性分析整个文档
+                # 使用LLM一次性分析整个文档，超出输入预算的部分截掉，避免超过上下文窗口
+                budget = get_agent_budget("course_recommendation")
+                prompt_text = truncate_text(all_text, budget.max_input_tokens - 1000)
+                if len(prompt_text) < len(all_text):
+                    logger.warning(f"{pdf_path} 内容过长，约 {estimate_tokens(all_text)} tokens，已截断后再分析")
                 messages = [
-                    {"role": "system", "content": """你是一个专业的课程内容分析助手。请分析给定的文本内容，识别其中的课程信息。
-请返回JSON格式：
-{
-    "courses": [
-        {
-            "title": "课程标题",
-            "content": "课程内容",
-            "pages": [页码列表]
-        }
-    ]
-}
-
-请确保：
-1. 准确识别课程标题（通常以《》或特殊格式标记）
-2. 保持内容的完整性和连贯性
-3. 去除任何特殊字符和格式问题
-4. 正确记录每个课程对应的页码"""},
-                    {"role": "user", "content": all_text}
+                    {"role": "system", "content": COURSE_SPLIT_PROMPT.system},
+                    {"role": "user", "content": prompt_text}
                 ]
 
                 try:
                     response = await self.llm_service.create_chat_completion(
                         messages=messages,
-                        temperature=0.1
+                        temperature=0.1,
+                        cache=True
                     )
                     
                     if "error" not in response:
                         content = response["choices"][0]["message"]["content"].strip()
                         try:
-                            analysis = json.loads(content)
+                            analysis = loads_json_object(content)
                             courses = analysis.get("courses", [])
                             
-                            # 对每个课程进行结构化分析
-                            for course in courses:
-                                structured_content = await self._analyze_content_with_llm(course["content"])
-                                enhanced_content = await self._enhance_content_with_llm(structured_content)
+                            # 并发地对所有课程做结构化分析，再并发优化
+                            structured_contents = await self._run_batch(
+                                [self._analysis_request(course["content"]) for course in courses],
+                                lambda i, r: self._parse_analysis(r, courses[i]["content"])
+                            )
+                            enhanced_contents = await self._run_batch(
+                                [self._enhancement_request(data) for data in structured_contents],
+                                lambda i, r: self._parse_enhancement(r, structured_contents[i])
+                            )
+                            for course, enhanced_content in zip(courses, enhanced_contents):
                                 course.update(enhanced_content)
                                 
                         except json.JSONDecodeError:
@@ -308,8 +359,30 @@ class CourseRecommendationAgent:
             logger.error(f"Error extracting text from {pdf_path}: {str(e)}")
             return []
 
+    def start_loading(self) -> "asyncio.Task":
+        """启动（或返回进行中的）课程索引加载任务；加载失败或没有找到课程时下次调用重新加载"""
+        if self._load_task is None or (self._load_task.done() and not self._loaded):
+            self._load_task = asyncio.ensure_future(self._load())
+        return self._load_task
+
+    async def _load(self) -> None:
+        await self._load_course_contents()
+        self._loaded = bool(self.course_contents)
+
+    async def _ensure_course_contents(self) -> None:
+        if self._loaded:
+            return
+        await asyncio.shield(self.start_loading())
+
+    async def close(self) -> None:
+        """应用关闭时取消未完成的加载"""
+        if self._load_task is not None and not self._load_task.done():
+            self._load_task.cancel()
+            await asyncio.gather(self._load_task, return_exceptions=True)
+
     async def _load_course_contents(self):
         """加载所有课程内容"""
+        self.course_contents = {}
         self.course_summaries = []
         if not os.path.exists(self.pdf_dir):
             logger.warning(f"PDF目录不存在，创建目录: {self.pdf_dir}")
@@ -377,48 +450,99 @@ class CourseRecommendationAgent:
 
         return "\n".join(loading_info)
 
-    async def _calculate_relevance(self, query: str, text: str) -> float:
-        """使用LLM计算文本与查询的相关度分数"""
+    def _relevance_request(self, query: str, text: str) -> Dict:
+        """构造相关度评分的 LLM 请求参数"""
+        # 课程内容在前、查询在后：同一门课的不同查询也能命中上游的前缀缓存
         messages = [
-            {"role": "system", "content": """你是一个专业的文本相关性评估助手。请评估查询文本与目标文本的相关性，并返回一个0-1之间的分数。
-分数说明：
-- 1.0: 完全相关
-- 0.8-0.9: 高度相关
-- 0.6-0.7: 中度相关
-- 0.4-0.5: 低度相关
-- 0.0-0.3: 几乎不相关
-
-请只返回分数，不要包含任何其他文字。"""},
-            {"role": "user", "content": f"""查询文本：{query}
-目标文本：{text}
+            {"role": "system", "content": COURSE_RELEVANCE_PROMPT.system},
+            {"role": "user", "content": f"""目标文本：{text}
+查询文本：{query}
 
 请评估这两个文本的相关性，并返回一个0-1之间的分数。"""}
         ]
+        return {
+            "messages": messages,
+            "temperature": 0.1,  # 使用较低的温度以获得更稳定的结果
+            "cache": True
+        }
 
+    def _parse_relevance(self, response: Dict) -> float:
+        """把相关度评分响应解析成 0-1 之间的分数，失败时返回 0"""
+        if "error" in response:
+            logger.error(f"LLM计算相关度时出错: {response['error']}")
+            return 0.0
+
+        content = response["choices"][0]["message"]["content"].strip()
         try:
-            response = await self.llm_service.create_chat_completion(
-                messages=messages,
-                temperature=0.1  # 使用较低的温度以获得更稳定的结果
-            )
-            
-            if "error" in response:
-                logger.error(f"LLM计算相关度时出错: {response['error']}")
-                return 0.0
-                
-            content = response["choices"][0]["message"]["content"].strip()
-            try:
-                score = float(content)
-                return max(0.0, min(1.0, score))  # 确保分数在0-1之间
-            except ValueError:
-                logger.error(f"无法将LLM响应转换为分数: {content}")
-                return 0.0
-                
+            score = float(content)
+            return max(0.0, min(1.0, score))  # 确保分数在0-1之间
+        except ValueError:
+            logger.error(f"无法将LLM响应转换为分数: {content}")
+            return 0.0
+
+    async def _calculate_relevance(self, query: str, text: str) -> float:
+        """使用LLM计算文本与查询的相关度分数"""
+        try:
+            response = await self.llm_service.create_chat_completion(**self._relevance_request(query, text))
         except Exception as e:
             logger.error(f"LLM计算相关度时发生异常: {str(e)}")
             return 0.0
+        return self._parse_relevance(response)
+
+    async def search_courses(self, query: str) -> Tuple[List[Dict], List[str]]:
+        """
+        按用户问题检索相关课程，返回按相关度排序的结果和检索日志
+
+        只依赖原始问题，不需要意图分析结果，/analyze-intent 在请求到达时就投机地开始检索
+        """
+        logs = ["开始搜索相关课程..."]
+
+        # 如果课程内容未加载，先加载
+        if not self._loaded:
+            logs.append("加载课程内容...")
+            with COURSE_INDEX_LOAD_DURATION.time():
+                await self._ensure_course_contents()
+
+        # 并发计算所有课程的相关度
+        search_results = []
+        courses = list(self.course_contents.items())
+        for course_title, _ in courses:
+            logs.append(f"正在分析课程: {course_title}")
+        scores = await self._run_batch(
+            [self._relevance_request(query, course_info["content"]) for _, course_info in courses],
+            lambda i, r: self._parse_relevance(r)
+        )
+        for (course_title, course_info), relevance in zip(courses, scores):
+            if relevance > 0.05:
+                message = f"找到相关内容 - 课程: {course_title}, 相关度: {relevance:.2f}"
+                logs.append(message)
+                # 获取结构化数据
+                structured_data = course_info.get("structured_data", {})
+                search_results.append({
+                    "title": course_info["title"],
+                    "relevance_score": relevance,
+                    "content": course_info["content"][:500] + "...",
+                    "source": course_info["title"],
+                    "pages": course_info["pages"],
+                    "structured_data": structured_data
+                })
 
-    async def recommend_courses_stream(self, context: UserContext, intent_analysis: IntentAnalysis):
-        """基于用户意图和问题分析推荐相关课程"""
+        # 按相关度排序
+        search_results.sort(key=lambda x: x["relevance_score"], reverse=True)
+        logs.append(f"搜索完成，找到 {len(search_results)} 个相关课程")
+        return search_results, logs
+
+    async def recommend_courses_stream(
+        self,
+        context: UserContext,
+        intent_analysis: IntentAnalysis,
+        retrieval: Optional[Awaitable[Tuple[List[Dict], List[str]]]] = None
+    ):
+        """
+        基于用户意图和问题分析推荐相关课程
+
+        retrieval: 已经提前开始的 search_courses，传入时直接等待其结果，不再重新检索
+        """
         start_time = time.time()
         current_time = time.strftime('%H:%M:%S')
         logs = [f"\n=== 课程推荐开始: {current_time} ==="]
@@ -426,37 +550,10 @@ class CourseRecommendationAgent:
 
         try:
             # 首先进行相似度搜索
-            query = context.messages[0]['content']
-            logs.append("开始搜索相关课程...")
-            
-            # 如果课程内容未加载，先加载
-            if not hasattr(self, 'course_contents') or not self.course_contents:
-                logs.append("加载课程内容...")
-                await self._load_course_contents()
-            
-            # 一次性计算所有课程的相关度
-            search_results = []
-            for course_title, course_info in self.course_contents.items():
-                logs.append(f"正在分析课程: {course_title}")
-                relevance = await self._calculate_relevance(query, course_info["content"])
-                
-                if relevance > 0.05:
-                    message = f"找到相关内容 - 课程: {course_title}, 相关度: {relevance:.2f}"
-                    logs.append(message)
-                    # 获取结构化数据
-                    structured_data = course_info.get("structured_data", {})
-                    search_results.append({
-                        "title": course_info["title"],
-                        "relevance_score": relevance,
-                        "content": course_info["content"][:500] + "...",
-                        "source": course_info["title"],
-                        "pages": course_info["pages"],
-                        "structured_data": structured_data
-                    })
-            
-            # 按相关度排序
-            search_results.sort(key=lambda x: x["relevance_score"], reverse=True)
-            logs.append(f"搜索完成，找到 {len(search_results)} 个相关课程")
+            if retrieval is None:
+                retrieval = self.search_courses(context.messages[-1]['content'])
+            search_results, search_logs = await retrieval
+            logs.extend(search_logs)
 
             # 构建最终响应
             response = {
@@ -503,7 +600,7 @@ class CourseRecommendationAgent:
         except Exception as e:
             error_message = f"课程推荐过程中出错: {str(e)}"
             logger.error(f"完整错误信息: {error_message}")
-            logger.error(f"上下文信息: {context.messages[0]['content']}")
+            logger.error(f"上下文信息: {context.messages[-1]['content']}")
             logs.append(f"\n=== 课程推荐错误 ===\n{error_message}")
             
             # 只有在未发送过响应的情况下才发送错误响应
@@ -1,19 +1,14 @@
+from app.core.llm.prompts import register_prompt
 from app.core.llm.service import LLMService
 from app.agents.models import UserContext, IntentAnalysis
-import json
+from app.agents.json_stream import JSONStreamScanner, delta_content, first_matching, loads_json_object
+from app.agents.progress import StageProgress
+from app.agents.intent_classifier import LocalIntent, get_intent_classifier, get_intent_log
 import asyncio
-import time
-
-class IntentAnalysisAgent:
-    """专门负责意图分析的Agent"""
-    def __init__(self):
-        self.llm_service = LLMService()
+import json
+from typing import Optional, Set
 
-    async def analyze(self, context: UserContext) -> IntentAnalysis:
-        """
-        分析用户意图
-        """
-        system_prompt = """你是一个专业的意图分析助手，负责分析用户是否在咨询企业培训课程或企业工作相关的内容。请分析用户的输入，并返回以下格式的 JSON 响应：
+INTENT_PROMPT = register_prompt("intent", "v1", """你是一个专业的意图分析助手，负责分析用户是否在咨询企业培训课程或企业工作相关的内容。请分析用户的输入，并返回以下格式的 JSON 响应：
 {
     "intent": "用户的主要意图（例如：工作方法咨询、工作效率提升、时间管理、任务管理、项目管理、团队协作、沟通技巧、职业发展、企业培训课程咨询等企业工作相关主题）",
     "confidence": 0.0-1.0 之间的置信度分数,
@@ -37,10 +32,41 @@ class IntentAnalysisAgent:
 4. 返回的必须是合法的 JSON 格式
 5. 对于非企业培训课程和非企业工作相关的咨询，intent 应设置为 "非企业相关咨询" 并给出较低的置信度
 6. 实体信息要尽可能完整，但不要过度推测，对于未明确提到的信息使用空字符串或空数组
-7. is_work_method 字段应该准确反映是否是工作方法相关的咨询"""
+7. is_work_method 字段应该准确反映是否是工作方法相关的咨询""")
+
+class IntentAnalysisAgent:
+    """专门负责意图分析的Agent"""
+    def __init__(self, llm_service: Optional[LLMService] = None):
+        self.llm_service = llm_service or LLMService(agent="intent")
+        self.classifier = get_intent_classifier()
+        self.intent_log = get_intent_log()
+        # 写日志的后台任务，持有引用避免被提前回收
+        self._pending_records: Set["asyncio.Future[None]"] = set()
+
+    def _classify_locally(self, context: UserContext) -> Optional[LocalIntent]:
+        """本地分类有把握时直接返回，省掉一次 LLM 调用"""
+        if self.classifier is None:
+            return None
+        return self.classifier.classify(context.messages[-1]["content"])
+
+    def _record(self, context: UserContext, analysis: IntentAnalysis) -> None:
+        """记录 LLM 的分析结果，供离线训练本地分类器；文件追加放到工作线程，不阻塞事件循环"""
+        if self.intent_log is None:
+            return
+        task = asyncio.ensure_future(asyncio.to_thread(self.intent_log.record, context.messages[-1]["content"], analysis))
+        self._pending_records.add(task)
+        task.add_done_callback(self._pending_records.discard)
+
+    async def analyze(self, context: UserContext) -> IntentAnalysis:
+        """
+        分析用户意图
+        """
+        local = self._classify_locally(context)
+        if local is not None:
+            return local.to_analysis()
 
         messages = [
-            {"role": "system", "content": system_prompt},
+            {"role": "system", "content": INTENT_PROMPT.system},
             *context.messages
         ]
         
@@ -53,22 +79,16 @@ class IntentAnalysisAgent:
             if isinstance(response, dict) and "choices" in response:
                 content = response["choices"][0]["message"]["content"]
                 
-                # 处理可能包含 Markdown 代码块的情况
-                content = content.strip()
-                if content.startswith("```json"):
-                    content = content[7:]  # 移除 ```json
-                if content.endswith("```"):
-                    content = content[:-3]  # 移除 ```
-                content = content.strip()
-                
-                # 尝试解析 JSON 响应
-                result = json.loads(content)
+                # 兼容 Markdown 代码块和前后的说明文字
+                result = loads_json_object(content)
                 
-                return IntentAnalysis(
+                analysis = IntentAnalysis(
                     intent=result.get("intent", "未知意图"),
                     confidence=float(result.get("confidence", 0.0)),
                     entities=result.get("entities", {})
                 )
+                self._record(context, analysis)
+                return analysis
             else:
                 raise ValueError("Invalid response format")
         except (json.JSONDecodeError, KeyError, ValueError) as e:
@@ -82,165 +102,80 @@ class IntentAnalysisAgent:
         """
         流式分析用户意图，返回中间结果和最终结果
         """
-        start_time = time.time()
-        current_time = time.strftime('%H:%M:%S')
-        yield f"=== 意图分析开始: {current_time} ==="
-        await asyncio.sleep(1)  # 增加等待时间
+        progress = StageProgress("intent_analysis")
+        local = self._classify_locally(context)
+        if local is not None:
+            yield progress.completed(f"本地分类命中（{local.source}）")
+            yield local.to_analysis()
+            return
 
-        try:
-            system_prompt = """你是一个专业的意图分析助手，负责分析用户是否在咨询企业培训课程或企业工作相关的内容。请分析用户的输入，并返回以下格式的 JSON 响应：
-{
-    "intent": "用户的主要意图（例如：工作方法咨询、工作效率提升、时间管理、任务管理、项目管理、团队协作、沟通技巧、职业发展、企业培训课程咨询等企业工作相关主题）",
-    "confidence": 0.0-1.0 之间的置信度分数,
-    "entities": {
-        "topic": "具体咨询主题",
-        "level": "咨询难度级别（如：入门、进阶、高级）",
-        "format": "期望的咨询形式（如：线上咨询、线下咨询、工作坊）",
-        "target_audience": "目标受众（如：新员工、管理者、普通员工）",
-        "key_points": ["关键知识点1", "关键知识点2"],
-        "practical_examples": ["实际案例1", "实际案例2"],
-        "expected_outcome": "期望达到的效果",
-        "urgency": "紧急程度（如：立即、近期、长期）",
-        "is_work_method": "是否是工作方法相关咨询（true/false）"
-    }
-}
-
-请确保：
-1. intent 应该明确表示是否是咨询企业培训课程或企业工作相关的内容
-2. confidence 应该是 0-1 之间的浮点数，表示判断的置信度
-3. entities 应该包含从用户输入中提取的关键信息，如具体咨询主题、难度级别等
-4. 返回的必须是合法的 JSON 格式
-5. 对于非企业培训课程和非企业工作相关的咨询，intent 应设置为 "非企业相关咨询" 并给出较低的置信度
-6. 实体信息要尽可能完整，但不要过度推测，对于未明确提到的信息使用空字符串或空数组
-7. is_work_method 字段应该准确反映是否是工作方法相关的咨询"""
+        yield progress.started("请求模型")
 
+        try:
             messages = [
-                {"role": "system", "content": system_prompt},
+                {"role": "system", "content": INTENT_PROMPT.system},
                 *context.messages
             ]
 
-            # 发送处理步骤并等待
-            processing_steps = [
-                "正在分析用户输入...",
-                "提取关键信息...",
-                "识别用户意图...",
-                "计算置信度...",
-                "整理分析结果..."
-            ]
-
-            for step in processing_steps:
-                yield step
-                await asyncio.sleep(1)  # 每个步骤等待1秒
-
-            # 使用流式响应进行分析
-            current_json = ""
+            # 使用流式响应进行分析，增量扫描输出中的 JSON 对象
+            scanner = JSONStreamScanner()
             last_valid_json = None
-            brace_count = 0
-            in_json = False
-            json_started = False
-            json_completed = False
 
+            stream = self.llm_service.create_chat_completion_stream(
+                messages=messages,
+                temperature=0.3
+            )
             try:
-                async for chunk in self.llm_service.create_chat_completion_stream(
-                    messages=messages,
-                    temperature=0.3
-                ):
-                    if chunk and "choices" in chunk and chunk["choices"]:
-                        content = chunk["choices"][0].get("delta", {}).get("content", "")
-                        if content:
-                            current_json += content
-                            
-                            # 检查是否开始接收JSON
-                            if not json_started and '{' in content:
-                                json_started = True
-                            
-                            # 计算大括号数量
-                            for char in content:
-                                if char == '{':
-                                    brace_count += 1
-                                    in_json = True
-                                elif char == '}':
-                                    brace_count -= 1
-                                    if brace_count == 0 and in_json:
-                                        json_completed = True
-                                        try:
-                                            # 清理和解析 JSON
-                                            json_str = current_json.strip()
-                                            if json_str.startswith("```json"):
-                                                json_str = json_str[7:]
-                                            if json_str.startswith("```"):
-                                                json_str = json_str[3:]
-                                            if json_str.endswith("```"):
-                                                json_str = json_str[:-3]
-                                            json_str = json_str.strip()
-                                            
-                                            # 尝试解析 JSON
-                                            result = json.loads(json_str)
-                                            
-                                            # 验证结果格式
-                                            if not isinstance(result, dict):
-                                                raise ValueError("结果不是有效的JSON对象")
-                                            
-                                            if "intent" not in result:
-                                                raise ValueError("结果中缺少intent字段")
-                                            
-                                            if "confidence" not in result:
-                                                raise ValueError("结果中缺少confidence字段")
-                                            
-                                            if "entities" not in result:
-                                                raise ValueError("结果中缺少entities字段")
-                                            
-                                            last_valid_json = result
-                                            
-                                            # 发送部分结果并等待
-                                            yield {
-                                                "intent": result.get("intent", "分析中..."),
-                                                "confidence": result.get("confidence", 0.0),
-                                                "entities": result.get("entities", {})
-                                            }
-                                            await asyncio.sleep(1)  # 每个部分结果等待1秒
-                                            
-                                            # 重置状态
-                                            current_json = ""
-                                            in_json = False
-                                        except json.JSONDecodeError:
-                                            # JSON 解析失败，继续累积
-                                            pass
-                                        except Exception:
-                                            # 其他错误，继续累积
-                                            pass
+                async for chunk in stream:
+                    content = delta_content(chunk)
+                    if content:
+                        first = progress.first_token()
+                        if first is not None:
+                            yield first
+                    # 缺少必需字段的对象跳过，继续等待下一个
+                    result = first_matching(scanner.feed(content), ["intent", "confidence", "entities"])
+                    if result is not None:
+                        last_valid_json = result
+                        yield {
+                            "intent": result.get("intent", "分析中..."),
+                            "confidence": result.get("confidence", 0.0),
+                            "entities": result.get("entities", {})
+                        }
+                        # 已解析出完整的 JSON 对象，不再读取上游剩余的输出
+                        break
+                # 提前结束时立即关闭上游流，释放连接和限流器名额
+                await stream.aclose()
 
                 # 检查是否成功获取到有效结果
-                if not json_started:
+                if not scanner.started:
                     raise ValueError("未收到任何JSON数据")
-                
-                if not json_completed:
+
+                if not scanner.completed:
                     raise ValueError("JSON数据不完整")
 
                 # 返回最后一个有效的 JSON 结果
                 if last_valid_json:
-                    end_time = time.time()
-                    current_time = time.strftime('%H:%M:%S')
-                    yield f"=== 意图分析完成: {current_time} (耗时: {end_time - start_time:.1f}秒) ==="
-                    await asyncio.sleep(1)  # 等待1秒
-                    yield IntentAnalysis(
+                    analysis = IntentAnalysis(
                         intent=last_valid_json.get("intent", "未知意图"),
                         confidence=float(last_valid_json.get("confidence", 0.0)),
                         entities=last_valid_json.get("entities", {})
                     )
+                    self._record(context, analysis)
+                    yield progress.completed("意图分析完成")
+                    yield analysis
                 else:
                     raise ValueError("未能获取有效的分析结果")
             except Exception as e:
-                yield "意图分析出错"
-                await asyncio.sleep(1)  # 等待1秒
+                yield progress.failed(f"意图分析出错: {str(e)}")
                 yield IntentAnalysis(
                     intent="解析错误",
                     confidence=0.0,
                     entities={"error": str(e)}
                 )
+            finally:
+                await stream.aclose()
         except Exception as e:
-            yield "意图分析过程出错"
-            await asyncio.sleep(1)  # 等待1秒
+            yield progress.failed(f"意图分析过程出错: {str(e)}")
             yield IntentAnalysis(
                 intent="解析错误",
                 confidence=0.0,
@@ -0,0 +1,263 @@
+"""
+本地意图分类
+
+在调用意图分析 LLM 之前先在本地判断一次，常见的问题直接给出结果，省掉一次完整的 LLM 往返：
+
+1. 关键词规则：只命中一类意图时直接返回；同时命中多类视为有歧义，交给下一层
+2. 最近质心：字符 1-2 gram 哈希成稀疏向量，和离线训练的各意图质心比较余弦相似度，
+   最高分达到阈值且与第二名拉开差距时返回
+
+都不满足时返回 None，由 LLM 分析。纯 CPU 计算，不访问网络，单次分类在 1 毫秒以内。
+本地命中时不会有 LLM 抽取的实体，所以默认关闭（INTENT_CLASSIFIER_ENABLED）。
+LLM 的分析结果可以记录到 JSONL（INTENT_LOG_PATH），用 scripts/train_intent_classifier.py 离线训练质心。
+"""
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import json
+import logging
+import math
+import os
+import re
+import threading
+import zlib
+
+from app.agents.models import IntentAnalysis
+from app.core.config import get_settings
+from app.core.metrics import INTENT_CLASSIFIER_DECISIONS
+
+logger = logging.getLogger(__name__)
+
+FEATURE_DIM = 1 << 16  # 哈希特征空间大小
+RULE_CONFIDENCE = 0.9
+# 与意图分析提示词第 5 条一致：非企业相关的咨询不需要课程推荐
+NON_ENTERPRISE_INTENT = "非企业相关咨询"
+# 提到课程或培训时需要 LLM 判断是咨询课程还是咨询方法，规则不处理
+_COURSE_WORDS = re.compile(r"课程|培训|讲师|报名")
+_PUNCTUATION = re.compile(r"[\s，。！？、；：,.!?;:~～…]+")
+
+
+@dataclass(frozen=True)
+class IntentRule:
+    intent: str
+    is_work_method: bool
+    pattern: "re.Pattern"
+
+
+def _rule(intent: str, is_work_method: bool, pattern: str) -> IntentRule:
+    return IntentRule(intent, is_work_method, re.compile(pattern))
+
+
+# 只收录含义明确的说法；意图名称取自意图分析提示词中的示例
+DEFAULT_RULES: Tuple[IntentRule, ...] = (
+    _rule("时间管理", True, r"时间管理|拖延|番茄工作法|时间不够用"),
+    _rule("任务管理", True, r"任务管理|待办事项|任务优先级|事情太多"),
+    _rule("项目管理", True, r"项目管理|项目进度|项目延期|里程碑|甘特图"),
+    _rule("团队协作", True, r"团队协作|团队合作|跨部门协作|协同办公"),
+    _rule("沟通技巧", True, r"沟通技巧|向上沟通|跨部门沟通|汇报工作|表达能力"),
+    _rule("工作效率提升", True, r"工作效率|提高效率|提升效率|效率低"),
+    _rule("职业发展", False, r"职业规划|职业发展|升职|晋升|跳槽"),
+    _rule(NON_ENTERPRISE_INTENT, False, r"^(你好|您好|hi|hello|谢谢|再见|在吗)$"),
+)
+
+
+@dataclass
+class LocalIntent:
+    """本地分类结果；source 为 rule 或 centroid"""
+    intent: str
+    confidence: float
+    is_work_method: bool
+    source: str
+    topic: str = ""
+
+    def to_analysis(self) -> IntentAnalysis:
+        return IntentAnalysis(
+            intent=self.intent,
+            confidence=self.confidence,
+            entities={
+                "topic": self.topic or self.intent,
+                "is_work_method": self.is_work_method,
+                "classified_by": self.source,
+            }
+        )
+
+
+def features(text: str) -> Dict[int, float]:
+    """字符 1-gram 和 2-gram 的哈希稀疏向量（L2 归一化）；用 crc32 保证跨进程稳定"""
+    text = _PUNCTUATION.sub(" ", text.lower()).strip()
+    counts: Dict[int, float] = {}
+    for n in (1, 2):
+        for i in range(len(text) - n + 1):
+            gram = text[i:i + n]
+            if gram.isspace():
+                continue
+            index = zlib.crc32(gram.encode("utf-8")) % FEATURE_DIM
+            counts[index] = counts.get(index, 0.0) + 1.0
+    norm = math.sqrt(sum(v * v for v in counts.values()))
+    if norm:
+        for index in counts:
+            counts[index] /= norm
+    return counts
+
+
+@dataclass
+class Centroid:
+    intent: str
+    vector: Dict[int, float]
+    work_method_ratio: float  # 训练样本中 is_work_method 为 true 的比例
+    samples: int
+
+
+def train_centroids(records: Iterable[Dict[str, Any]], min_samples: int = 5,
+                    min_confidence: float = 0.8, prune: float = 1e-3) -> List[Centroid]:
+    """
+    由记录的 LLM 分析结果训练各意图的质心
+
+    records: {"message", "intent", "confidence", "is_work_method"}；低置信度的样本和样本数不足的意图会被丢弃
+    """
+    sums: Dict[str, Dict[int, float]] = {}
+    work: Dict[str, int] = {}
+    counts: Dict[str, int] = {}
+    for record in records:
+        if float(record.get("confidence", 0.0)) < min_confidence:
+            continue
+        intent = record["intent"]
+        vector = sums.setdefault(intent, {})
+        for index, value in features(record["message"]).items():
+            vector[index] = vector.get(index, 0.0) + value
+        counts[intent] = counts.get(intent, 0) + 1
+        work[intent] = work.get(intent, 0) + bool(record.get("is_work_method"))
+
+    centroids = []
+    for intent, vector in sums.items():
+        if counts[intent] < min_samples:
+            continue
+        norm = math.sqrt(sum(v * v for v in vector.values()))
+        normalized = {index: value / norm for index, value in vector.items() if value / norm >= prune}
+        centroids.append(Centroid(intent, normalized, work[intent] / counts[intent], counts[intent]))
+    return centroids
+
+
+def save_centroids(centroids: List[Centroid], path: str) -> None:
+    data = {
+        "feature_dim": FEATURE_DIM,
+        "centroids": [
+            {
+                "intent": c.intent,
+                "work_method_ratio": c.work_method_ratio,
+                "samples": c.samples,
+                "vector": {str(index): round(value, 6) for index, value in c.vector.items()},
+            }
+            for c in centroids
+        ],
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+
+
+def load_centroids(path: str) -> List[Centroid]:
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    if data.get("feature_dim") != FEATURE_DIM:
+        raise ValueError(f"质心模型的特征维度 {data.get('feature_dim')} 与当前 {FEATURE_DIM} 不一致")
+    return [
+        Centroid(
+            item["intent"],
+            {int(index): value for index, value in item["vector"].items()},
+            item["work_method_ratio"],
+            item["samples"],
+        )
+        for item in data["centroids"]
+    ]
+
+
+class IntentClassifier:
+    """关键词规则 + 最近质心；没有把握时返回 None"""
+
+    def __init__(self, rules: Iterable[IntentRule] = DEFAULT_RULES, centroids: Optional[List[Centroid]] = None,
+                 threshold: float = 0.85, margin: float = 0.05):
+        self.rules = tuple(rules)
+        self.centroids = centroids or []
+        self.threshold = threshold
+        self.margin = margin
+
+    def _by_rules(self, text: str) -> Optional[LocalIntent]:
+        if _COURSE_WORDS.search(text):
+            return None
+        matched: Dict[str, Tuple[IntentRule, str]] = {}
+        for rule in self.rules:
+            match = rule.pattern.search(text)
+            if match:
+                matched.setdefault(rule.intent, (rule, match.group(0)))
+        if len(matched) != 1:
+            return None
+        rule, keyword = next(iter(matched.values()))
+        return LocalIntent(rule.intent, RULE_CONFIDENCE, rule.is_work_method, "rule", keyword)
+
+    def _by_centroids(self, text: str) -> Optional[LocalIntent]:
+        if not self.centroids:
+            return None
+        query = features(text)
+        scored = sorted(
+            ((sum(value * c.vector.get(index, 0.0) for index, value in query.items()), c) for c in self.centroids),
+            key=lambda item: item[0],
+            reverse=True
+        )
+        best, centroid = scored[0]
+        runner_up = scored[1][0] if len(scored) > 1 else 0.0
+        if best < self.threshold or best - runner_up < self.margin:
+            return None
+        return LocalIntent(centroid.intent, round(best, 4), centroid.work_method_ratio >= 0.5, "centroid")
+
+    def classify(self, text: str) -> Optional[LocalIntent]:
+        result = self._by_rules(_PUNCTUATION.sub("", text.lower())) or self._by_centroids(text)
+        INTENT_CLASSIFIER_DECISIONS.labels(result.source if result else "fallback").inc()
+        return result
+
+
+class IntentLog:
+    """把 LLM 的意图分析结果追加到 JSONL，作为离线训练质心的样本"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def record(self, message: str, analysis: IntentAnalysis) -> None:
+        line = json.dumps({
+            "message": message,
+            "intent": analysis.intent,
+            "confidence": analysis.confidence,
+            "is_work_method": analysis.entities.get("is_work_method") in (True, "true"),
+        }, ensure_ascii=False)
+        try:
+            with self._lock, open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+        except OSError as e:
+            logger.warning(f"记录意图分析结果失败: {str(e)}")
+
+
+@lru_cache()
+def get_intent_classifier() -> Optional[IntentClassifier]:
+    """未开启本地分类时返回 None；质心模型不存在时只使用关键词规则"""
+    settings = get_settings()
+    if not settings.INTENT_CLASSIFIER_ENABLED:
+        return None
+    centroids = []
+    path = settings.INTENT_CLASSIFIER_MODEL_PATH
+    if path and os.path.exists(path):
+        try:
+            centroids = load_centroids(path)
+            logger.info(f"已加载意图质心模型: {path}，共 {len(centroids)} 个意图")
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"加载意图质心模型失败，只使用关键词规则: {str(e)}")
+    return IntentClassifier(
+        centroids=centroids,
+        threshold=settings.INTENT_CLASSIFIER_THRESHOLD,
+        margin=settings.INTENT_CLASSIFIER_MARGIN
+    )
+
+
+@lru_cache()
+def get_intent_log() -> Optional[IntentLog]:
+    path = get_settings().INTENT_LOG_PATH
+    return IntentLog(path) if path else None
@@ -0,0 +1,324 @@
+"""
+LLM 流式输出的增量 JSON 扫描
+
+每个字符只扫描一次：用正则直接跳到下一个有意义的字符（括号、引号、反斜杠、反引号），
+字符串内的括号和转义引号不会影响层级计数；顶层对象闭合时才对这一段调用一次 json.loads。
+输出中出现 ``` 代码块后，只接受代码块内的对象，代码块前后的说明文字即使带括号也会被忽略。
+PartialJSONScanner 额外跟踪对象内部的路径，在字段生成过程中就产出按路径寻址的增量事件。
+"""
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+import json
+import re
+
+_TOP_LEVEL = re.compile(r"[{`]")
+_IN_OBJECT = re.compile(r'[{}"]')
+_IN_OBJECT_PARTIAL = re.compile(r'[{}\[\]"]')
+_SEPARATORS = re.compile(r"([,:])")
+_IN_STRING = re.compile(r'["\\]')
+
+
+class JSONStreamScanner:
+    """增量喂入文本，返回其中已经完整的顶层 JSON 对象"""
+    _object_re = _IN_OBJECT
+    _partial = False  # 子类需要逐段跟踪对象内部结构时设为 True
+
+    def __init__(self):
+        self._parts: List[str] = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._offset = 0  # 已喂入的字符总数
+        self._last_tick = -2  # 上一个顶层反引号的位置
+        self._ticks = 0
+        self._in_fence = False
+        self._fence_seen = False
+        self.started = False  # 是否遇到过对象的开头
+        self.completed = 0  # 解析成功的对象个数
+        self.errors = 0  # 括号闭合但解析失败的片段个数
+
+    @property
+    def in_object(self) -> bool:
+        return self._depth > 0
+
+    def _tick(self, index: int) -> None:
+        # 连续三个反引号切换代码块状态，允许跨数据块
+        position = self._offset + index
+        self._ticks = self._ticks + 1 if position == self._last_tick + 1 else 1
+        self._last_tick = position
+        if self._ticks == 3:
+            self._ticks = 0
+            self._in_fence = not self._in_fence
+            self._fence_seen = True
+
+    def _close(self, results: List[Any]) -> None:
+        raw = "".join(self._parts)
+        self._parts = []
+        try:
+            value = json.loads(raw)
+        except ValueError:
+            self.errors += 1
+            return
+        self.completed += 1
+        results.append(value)
+
+    # 以下钩子只在 _partial 为 True 时调用
+    def _open(self, char: str) -> None:
+        pass
+
+    def _end(self, char: str) -> None:
+        pass
+
+    def _token(self, text: str) -> None:
+        pass
+
+    def _string_start(self) -> None:
+        pass
+
+    def _string(self, raw: str, final: bool) -> None:
+        pass
+
+    def feed(self, text: str) -> List[Any]:
+        results: List[Any] = []
+        if not text:
+            return results
+        pos = 0
+        length = len(text)
+        start = 0
+        string_from = 0  # 当前字符串在本数据块中的起点
+        partial = self._partial
+        if self._escape:
+            self._escape = False
+            pos = 1
+        while pos < length:
+            if self._depth == 0:
+                match = _TOP_LEVEL.search(text, pos)
+                if match is None:
+                    break
+                index = match.start()
+                pos = index + 1
+                if text[index] == "`":
+                    self._tick(index)
+                elif not self._fence_seen or self._in_fence:
+                    self._depth = 1
+                    self.started = True
+                    start = index
+                    if partial:
+                        self._open("{")
+            elif self._in_string:
+                match = _IN_STRING.search(text, pos)
+                if match is None:
+                    break
+                index = match.start()
+                if text[index] == "\\":
+                    pos = index + 2
+                    if pos > length:
+                        self._escape = True
+                else:
+                    self._in_string = False
+                    pos = index + 1
+                    if partial:
+                        self._string(text[string_from:index], True)
+            else:
+                match = self._object_re.search(text, pos)
+                if match is None:
+                    break
+                index = match.start()
+                if partial and index > pos:
+                    self._token(text[pos:index])
+                pos = index + 1
+                char = text[index]
+                if char == '"':
+                    self._in_string = True
+                    string_from = pos
+                    if partial:
+                        self._string_start()
+                elif char == "{":
+                    self._depth += 1
+                    if partial:
+                        self._open(char)
+                elif char == "}":
+                    self._depth -= 1
+                    if partial:
+                        self._end(char)
+                    if self._depth == 0:
+                        self._parts.append(text[start:pos])
+                        self._close(results)
+                elif char == "[":
+                    self._open(char)
+                else:
+                    self._end(char)
+        if self._depth > 0:
+            self._parts.append(text[start:])
+            if partial:
+                if self._in_string:
+                    self._string(text[string_from:], False)
+                elif pos < length:
+                    self._token(text[pos:])
+        self._offset += length
+        return results
+
+
+@dataclass
+class JSONDelta:
+    """
+    部分 JSON 的增量事件，path 形如 response.key_points[2]
+
+    op 为 text 时 value 是追加到该路径字符串末尾的文本（路径不存在时先创建空字符串），
+    为 set 时 value 是该路径上已经完整的数字、布尔值或 null
+    """
+    path: str
+    op: str
+    value: Any
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"path": self.path, "op": self.op, "value": self.value}
+
+
+class PartialJSONScanner(JSONStreamScanner):
+    """在 JSONStreamScanner 的基础上跟踪对象内部的路径，字段还在生成时就产出 JSONDelta"""
+    _object_re = _IN_OBJECT_PARTIAL
+    _partial = True
+
+    def __init__(self):
+        super().__init__()
+        # 每层容器：[类型 "{" 或 "[", 当前键或下标, 是否在等待键]
+        self._stack: List[list] = []
+        self._key_raw: Optional[List[str]] = None
+        self._string_path: Optional[str] = None
+        self._pending = ""  # 末尾不完整的转义序列，留到下一个数据块再解码
+        self._scalar = ""
+        self._events: List[JSONDelta] = []
+
+    def drain(self) -> List[JSONDelta]:
+        """取出累积的事件，同一路径上连续的文本增量合并成一个"""
+        merged: List[JSONDelta] = []
+        for event in self._events:
+            last = merged[-1] if merged else None
+            if last is not None and event.op == "text" and last.op == "text" and last.path == event.path:
+                last.value += event.value
+            else:
+                merged.append(event)
+        self._events = []
+        return merged
+
+    def _path(self) -> str:
+        parts: List[str] = []
+        for kind, key, _ in self._stack:
+            if kind == "[":
+                parts.append(f"[{key}]")
+            elif parts:
+                parts.append(f".{key}")
+            else:
+                parts.append(str(key))
+        return "".join(parts)
+
+    def _flush_scalar(self) -> None:
+        token = self._scalar.strip()
+        self._scalar = ""
+        if not token:
+            return
+        try:
+            value = json.loads(token)
+        except ValueError:
+            return
+        self._events.append(JSONDelta(self._path(), "set", value))
+
+    def _open(self, char: str) -> None:
+        self._scalar = ""
+        self._stack.append([char, 0 if char == "[" else None, char == "{"])
+
+    def _end(self, char: str) -> None:
+        self._flush_scalar()
+        if self._stack:
+            self._stack.pop()
+
+    def _token(self, text: str) -> None:
+        # 对象内部括号和引号之外的文本：冒号、逗号和数字等字面量
+        for piece in _SEPARATORS.split(text):
+            if piece == ",":
+                self._flush_scalar()
+                frame = self._stack[-1]
+                if frame[0] == "[":
+                    frame[1] += 1
+                else:
+                    frame[1] = None
+                    frame[2] = True
+            elif piece == ":":
+                self._scalar = ""
+                self._stack[-1][2] = False
+            else:
+                self._scalar += piece
+
+    def _string_start(self) -> None:
+        self._scalar = ""
+        frame = self._stack[-1]
+        if frame[0] == "{" and frame[2]:
+            self._key_raw = []
+        else:
+            self._key_raw = None
+            self._string_path = self._path()
+            self._pending = ""
+
+    def _string(self, raw: str, final: bool) -> None:
+        if self._key_raw is not None:
+            self._key_raw.append(raw)
+            if final:
+                self._stack[-1][1] = _decode("".join(self._key_raw))
+                self._key_raw = None
+            return
+        text = self._decode_partial(raw, final)
+        if text:
+            self._events.append(JSONDelta(self._string_path, "text", text))
+
+    def _decode_partial(self, raw: str, final: bool) -> str:
+        raw = self._pending + raw
+        self._pending = ""
+        if final:
+            return _decode(raw)
+        # 末尾可能是被切断的转义（最长 \uXXXX 共 6 个字符），或者等待低位代理的高位代理
+        for cut in range(len(raw), max(len(raw) - 7, -1), -1):
+            try:
+                text = json.loads(f'"{raw[:cut]}"', strict=False)
+            except ValueError:
+                continue
+            if text and "\ud800" <= text[-1] <= "\udbff":
+                continue
+            self._pending = raw[cut:]
+            return text
+        self._pending = raw
+        return ""
+
+
+def _decode(raw: str) -> str:
+    try:
+        return json.loads(f'"{raw}"', strict=False)
+    except ValueError:
+        return raw
+
+
+def delta_content(chunk: Any) -> str:
+    """取出流式数据块中的增量文本，没有内容时返回空字符串"""
+    if not chunk or not isinstance(chunk, dict):
+        return ""
+    choices = chunk.get("choices")
+    if not choices:
+        return ""
+    return (choices[0].get("delta") or {}).get("content") or ""
+
+
+def loads_json_object(text: str) -> Dict[str, Any]:
+    """从完整的模型输出中取出第一个 JSON 对象，兼容 Markdown 代码块和前后的说明文字"""
+    scanner = JSONStreamScanner()
+    for value in scanner.feed(text):
+        if isinstance(value, dict):
+            return value
+    raise json.JSONDecodeError("未找到完整的 JSON 对象", text, len(text))
+
+
+def first_matching(values: List[Any], required: Optional[List[str]] = None) -> Optional[Dict[str, Any]]:
+    """返回第一个包含全部必需字段的 dict"""
+    for value in values:
+        if isinstance(value, dict) and all(key in value for key in (required or ())):
+            return value
+    return None
@@ -1,13 +1,13 @@
-from typing import AsyncGenerator
+from typing import AsyncGenerator, Optional
 from app.agents.models import UserContext, IntentAnalysis
 from app.agents.intent_agent import IntentAnalysisAgent
 from app.agents.chat_agent import ChatAgent
 
 class LLMAgent:
     """为了保持向后兼容的包装类"""
-    def __init__(self):
-        self.intent_agent = IntentAnalysisAgent()
-        self.chat_agent = ChatAgent()
+    def __init__(self, intent_agent: Optional[IntentAnalysisAgent] = None, chat_agent: Optional[ChatAgent] = None):
+        self.intent_agent = intent_agent or IntentAnalysisAgent()
+        self.chat_agent = chat_agent or ChatAgent()
 
     async def analyze_intent(self, context: UserContext) -> IntentAnalysis:
         return await self.intent_agent.analyze(context)
@@ -15,6 +15,6 @@ class LLMAgent:
     async def get_response(self, message: str) -> str:
         return await self.chat_agent.get_response(message)
 
-    async def get_stream_response(self, message: str) -> AsyncGenerator[str, None]:
-        async for chunk in self.chat_agent.get_stream_response(message):
-            yield chunk 
\ No newline at end of file
+    def get_stream_response(self, message: str) -> AsyncGenerator[str, None]:
+        # 直接返回内层生成器，调用方关闭时上游流随之关闭
+        return self.chat_agent.get_stream_response(message) 
\ No newline at end of file
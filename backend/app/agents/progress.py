@@ -0,0 +1,53 @@
+"""
+流水线进度事件
+
+agent 只在真实发生的节点产出 ProgressEvent：开始请求模型、收到首个 token、阶段完成或失败，
+不再插入固定的等待和预设的“处理步骤”。需要放慢展示节奏时由客户端处理，
+或者在服务端通过 PIPELINE_EVENT_PACING 显式开启。
+"""
+from typing import Optional
+import time
+
+from pydantic import BaseModel
+
+STARTED = "started"
+FIRST_TOKEN = "first_token"
+COMPLETED = "completed"
+FAILED = "failed"
+
+
+class ProgressEvent(BaseModel):
+    """阶段进度；elapsed 为距阶段开始的秒数"""
+    stage: str
+    status: str
+    message: str = ""
+    elapsed: Optional[float] = None
+
+
+class StageProgress:
+    """记录一个阶段的开始时间，生成带耗时的进度事件"""
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self.started_at = time.perf_counter()
+        self._first_token_sent = False
+
+    def event(self, status: str, message: str = "") -> ProgressEvent:
+        elapsed = round(time.perf_counter() - self.started_at, 3)
+        return ProgressEvent(stage=self.stage, status=status, message=message, elapsed=elapsed)
+
+    def started(self, message: str = "") -> ProgressEvent:
+        return self.event(STARTED, message)
+
+    def first_token(self) -> Optional[ProgressEvent]:
+        """只在第一次调用时返回事件，之后返回 None"""
+        if self._first_token_sent:
+            return None
+        self._first_token_sent = True
+        return self.event(FIRST_TOKEN, "已收到模型输出")
+
+    def completed(self, message: str = "") -> ProgressEvent:
+        return self.event(COMPLETED, message)
+
+    def failed(self, message: str = "") -> ProgressEvent:
+        return self.event(FAILED, message)
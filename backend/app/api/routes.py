@@ -2,18 +2,29 @@ from fastapi import APIRouter, Depends, Request, Query, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.responses import StreamingResponse, JSONResponse
 from app.agents.llm_agent import LLMAgent, UserContext, IntentAnalysis
+from app.agents.intent_classifier import NON_ENTERPRISE_INTENT
 from app.agents.training_advisor_agent import TrainingAdvisorAgent
 from app.agents.ai_response_agent import AIResponseAgent
 from app.agents.course_recommendation_agent import CourseRecommendationAgent
+from app.agents.json_stream import JSONDelta
+from app.agents.progress import ProgressEvent
+from app.container import AppContainer, get_container
 from app.core.config import get_settings
+from app.core.conversation import CLIENT_ROLES, ConversationStore
+from app.core.llm.base import ChatMessage
+from app.core.metrics import PIPELINE_STAGE_DURATION, SPECULATIVE_RETRIEVALS
+from app.core.pipeline import run_concurrently
+from app.core.semantic_cache import SemanticCache, get_semantic_cache
+from app.core.streaming import aclosing, paced, stream_until_disconnect
 from app.core.auth import verify_password, create_access_token, verify_token, ACCESS_TOKEN_EXPIRE_MINUTES, get_password_hash
 from app.models.user import User, Token
 from pydantic import BaseModel
 import json
 import asyncio
 import logging
+import secrets
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import List, Optional
 
 # 配置日志
 logger = logging.getLogger(__name__)
@@ -32,17 +43,21 @@ fake_users_db = {
 # 打印密码哈希值用于调试
 print("Admin password hash:", fake_users_db["admin"]["hashed_password"])
 
-def get_llm_agent():
-    return LLMAgent()
+# agent 由应用级容器在启动时创建，所有请求共享同一组实例
+def get_llm_agent(container: AppContainer = Depends(get_container)) -> LLMAgent:
+    return container.llm_agent
 
-def get_training_advisor_agent():
-    return TrainingAdvisorAgent()
+def get_training_advisor_agent(container: AppContainer = Depends(get_container)) -> TrainingAdvisorAgent:
+    return container.training_advisor_agent
 
-def get_ai_response_agent():
-    return AIResponseAgent()
+def get_ai_response_agent(container: AppContainer = Depends(get_container)) -> AIResponseAgent:
+    return container.ai_response_agent
 
-def get_course_recommendation_agent():
-    return CourseRecommendationAgent()
+def get_course_recommendation_agent(container: AppContainer = Depends(get_container)) -> CourseRecommendationAgent:
+    return container.course_recommendation_agent
+
+def get_conversation_store(container: AppContainer = Depends(get_container)) -> Optional[ConversationStore]:
+    return container.conversation_store
 
 class ChatRequest(BaseModel):
     message: str
@@ -55,7 +70,7 @@ class ChatResponse(BaseModel):
 
 class IntentRequest(BaseModel):
     message: str
-    messages: list = []
+    messages: List[ChatMessage] = []
     user_id: str
     session_id: str
 
@@ -99,6 +114,7 @@ async def logout(request: Request):
 @router.post("/chat")
 async def chat(
     request: ChatRequest,
+    http_request: Request,
     current_user: dict = Depends(get_current_user),
     llm_agent: LLMAgent = Depends(get_llm_agent)
 ):
@@ -111,7 +127,7 @@ async def chat(
 
         if request.stream:
             return StreamingResponse(
-                llm_agent.get_stream_response(request.message),
+                stream_until_disconnect(http_request, llm_agent.get_stream_response(request.message), "chat"),
                 media_type="text/event-stream",
                 headers={
                     "Cache-Control": "no-cache, no-transform",
@@ -139,38 +155,96 @@ async def chat(
             detail=f"处理聊天消息时出错: {str(e)}"
         )
 
-async def stream_analysis(request: IntentRequest, llm_agent: LLMAgent, training_advisor_agent: TrainingAdvisorAgent, ai_response_agent: AIResponseAgent, course_recommendation_agent: CourseRecommendationAgent):
+def _discard_retrieval(retrieval: "asyncio.Future", used: bool) -> None:
+    """取消未被使用的投机检索；已结束的取出异常，避免 "exception was never retrieved" 警告"""
+    if not used:
+        SPECULATIVE_RETRIEVALS.labels("discarded").inc()
+    if retrieval.done():
+        if not retrieval.cancelled():
+            retrieval.exception()
+        return
+    retrieval.cancel()
+
+def _conversation_owner(request: Request) -> str:
+    """
+    会话记忆的归属方：登录用户用用户名，未登录时用服务端签发、保存在签名 session cookie 中的随机 id
+
+    不使用客户端传入的 user_id，否则猜到或复用别人的 id 就能读取或写入别人的会话
+    """
+    user = request.session.get("user")
+    if user:
+        return f"user:{user['username']}"
+    if "conversation_owner" not in request.session:
+        request.session["conversation_owner"] = secrets.token_urlsafe(16)
+    return f"anon:{request.session['conversation_owner']}"
+
+def _progress_event(event: ProgressEvent) -> str:
+    return f"data: {json.dumps({'type': 'progress', 'data': event.dict()}, ensure_ascii=False)}\n\n"
+
+async def stream_analysis(request: IntentRequest, llm_agent: LLMAgent, training_advisor_agent: TrainingAdvisorAgent, ai_response_agent: AIResponseAgent, course_recommendation_agent: CourseRecommendationAgent, semantic_cache: Optional[SemanticCache] = None, conversation_store: Optional[ConversationStore] = None, owner: Optional[str] = None):
     """
     流式处理分析过程
     """
+    cache_lookup = None
+    retrieval = None
+    retrieval_used = False
     try:
         logger.info(f"开始处理用户请求: {request.message}")
         logger.info(f"用户ID: {request.user_id}, 会话ID: {request.session_id}")
 
         # 发送开始分析的消息
         yield f"data: {json.dumps({'type': 'status', 'status': 'started', 'message': '开始分析流程'})}\n\n"
-        await asyncio.sleep(0.1)
 
+        # 有会话记忆时由服务端提供摘要和最近几轮；否则使用客户端带上的历史，
+        # 客户端的历史只接受 user/assistant 消息，不能注入 system 提示词
+        history = [
+            {"role": msg.role.value, "content": msg.content}
+            for msg in request.messages if msg.role.value in CLIENT_ROLES
+        ]
+        if conversation_store is not None:
+            messages = await conversation_store.context_messages(
+                owner, request.session_id, request.message, client_history=history
+            )
+        else:
+            messages = [*history, {"role": "user", "content": request.message}]
         context = UserContext(
-            messages=[{"role": "user", "content": request.message}],
+            messages=messages,
             user_id=request.user_id,
             session_id=request.session_id
         )
 
+        # 语义缓存查询与意图分析并行，在生成标准回答之前取结果；
+        # 缓存只按当前问题匹配，多轮对话中的追问依赖上下文，不查也不写
+        if semantic_cache is not None and len(messages) == 1:
+            catalog_version = course_recommendation_agent.catalog_version()
+            cache_lookup = asyncio.ensure_future(semantic_cache.lookup(request.message, catalog_version))
+
+        # 课程检索只依赖原始问题，请求到达时就投机开始，让检索耗时藏在意图分析的 LLM 调用后面
+        async def speculative_retrieval():
+            if cache_lookup is not None:
+                # 命中语义缓存时不需要检索；shield 避免取消检索时连带取消缓存查询
+                lookup = await asyncio.shield(cache_lookup)
+                if lookup.hit:
+                    return None
+            return await course_recommendation_agent.search_courses(request.message)
+
+        retrieval = asyncio.ensure_future(speculative_retrieval())
+
         # 发送意图分析开始的消息
         yield f"data: {json.dumps({'type': 'status', 'status': 'intent_analysis_started', 'message': '分析意图'})}\n\n"
-        await asyncio.sleep(0.1)
 
         # 进行意图分析，使用流式响应
         intent_analysis = None
-        async for chunk in llm_agent.intent_agent.analyze_stream(context):
-            if isinstance(chunk, dict):
-                yield f"data: {json.dumps({'type': 'intent_analysis_progress', 'data': chunk})}\n\n"
-                await asyncio.sleep(0.1)
-            elif isinstance(chunk, IntentAnalysis):
-                yield f"data: {json.dumps({'type': 'intent_analysis', 'data': chunk.dict()})}\n\n"
-                await asyncio.sleep(0.1)
-                intent_analysis = chunk
+        with PIPELINE_STAGE_DURATION.labels("intent_analysis").time():
+            async with aclosing(llm_agent.intent_agent.analyze_stream(context)) as stream:
+                async for chunk in stream:
+                    if isinstance(chunk, ProgressEvent):
+                        yield _progress_event(chunk)
+                    elif isinstance(chunk, dict):
+                        yield f"data: {json.dumps({'type': 'intent_analysis_progress', 'data': chunk})}\n\n"
+                    elif isinstance(chunk, IntentAnalysis):
+                        yield f"data: {json.dumps({'type': 'intent_analysis', 'data': chunk.dict()})}\n\n"
+                        intent_analysis = chunk
 
         if not intent_analysis:
             logger.error("意图分析失败")
@@ -180,91 +254,138 @@ async def stream_analysis(request: IntentRequest, llm_agent: LLMAgent, training_
 
         # 发送意图分析完成的消息
         yield f"data: {json.dumps({'type': 'status', 'status': 'intent_analysis_completed', 'message': '意图分析完成'})}\n\n"
-        await asyncio.sleep(0.1)
-
-        # 生成标准聊天回答
-        yield f"data: {json.dumps({'type': 'status', 'status': 'chat_response_started', 'message': '生成标准回答'})}\n\n"
-        await asyncio.sleep(0.1)
-
-        # 生成标准聊天回答
-        chat_response = None
-        async for chunk in ai_response_agent.generate_response_stream(context, intent_analysis):
-            if isinstance(chunk, dict):
-                yield f"data: {json.dumps({'type': 'chat_response', 'data': chunk})}\n\n"
-                await asyncio.sleep(0.1)
-                chat_response = chunk
 
-        if not chat_response:
-            logger.error("标准回答生成失败")
-            raise ValueError("标准回答生成失败")
-
-        logger.info("标准回答生成完成")
-
-        # 发送标准回答完成的消息
-        yield f"data: {json.dumps({'type': 'status', 'status': 'chat_response_completed', 'message': '标准回答已生成'})}\n\n"
-        await asyncio.sleep(0.1)
-
-        # 检查是否是工作方法相关的咨询
-        is_work_method = intent_analysis.entities.get('is_work_method', False)
-        
-        # 只有在工作方法相关的咨询时才进行提问分析
-        if is_work_method:
+        lookup = None
+        cached = None
+        if cache_lookup is not None:
+            with PIPELINE_STAGE_DURATION.labels("semantic_cache_lookup").time():
+                lookup = await cache_lookup
+            cached = lookup.response
+            if cached:
+                yield f"data: {json.dumps({'type': 'status', 'status': 'semantic_cache_hit', 'message': '命中语义缓存', 'similarity': lookup.similarity})}\n\n"
+
+        results = {}
+
+        async def chat_response_stage():
+            yield {'type': 'status', 'status': 'chat_response_started', 'message': '生成标准回答'}
+            if cached:
+                results["chat_response"] = cached["chat_response"]
+                yield {'type': 'chat_response', 'data': cached["chat_response"]}
+            else:
+                with PIPELINE_STAGE_DURATION.labels("chat_response").time():
+                    async with aclosing(ai_response_agent.generate_response_stream(context, intent_analysis)) as stream:
+                        async for chunk in stream:
+                            if isinstance(chunk, ProgressEvent):
+                                yield {'type': 'progress', 'data': chunk.dict()}
+                            elif isinstance(chunk, JSONDelta):
+                                # 回答生成过程中按字段路径推送增量，不等待完整的 JSON
+                                yield {'type': 'chat_response_delta', 'data': chunk.to_dict()}
+                            elif isinstance(chunk, dict):
+                                results["chat_response"] = chunk
+                                yield {'type': 'chat_response', 'data': chunk}
+            if not results.get("chat_response"):
+                raise ValueError("标准回答生成失败")
+            logger.info("标准回答生成完成")
+            yield {'type': 'status', 'status': 'chat_response_completed', 'message': '标准回答已生成'}
+
+        async def question_analysis_stage():
             logger.info("开始提问分析")
-            yield f"data: {json.dumps({'type': 'status', 'status': 'question_analysis_started', 'message': '分析提问方式'})}\n\n"
-            await asyncio.sleep(0.1)
-
-            # 进行提问分析，使用流式响应
+            yield {'type': 'status', 'status': 'question_analysis_started', 'message': '分析提问方式'}
             question_analysis = None
-            async for chunk in training_advisor_agent.analyze_question_stream(context, intent_analysis):
-                if isinstance(chunk, dict):
-                    yield f"data: {json.dumps({'type': 'question_analysis', 'data': chunk})}\n\n"
-                    await asyncio.sleep(0.1)
-                    question_analysis = chunk
-
+            with PIPELINE_STAGE_DURATION.labels("question_analysis").time():
+                async with aclosing(training_advisor_agent.analyze_question_stream(context, intent_analysis)) as stream:
+                    async for chunk in stream:
+                        if isinstance(chunk, ProgressEvent):
+                            yield {'type': 'progress', 'data': chunk.dict()}
+                        elif isinstance(chunk, dict):
+                            question_analysis = chunk
+                            yield {'type': 'question_analysis', 'data': chunk}
             if not question_analysis:
-                logger.error("提问分析失败")
                 raise ValueError("提问分析失败")
-
             logger.info("提问分析完成")
-            yield f"data: {json.dumps({'type': 'status', 'status': 'question_analysis_completed', 'message': '提问分析完成'})}\n\n"
-            await asyncio.sleep(0.1)
+            yield {'type': 'status', 'status': 'question_analysis_completed', 'message': '提问分析完成'}
+
+        async def course_recommendation_stage():
+            nonlocal retrieval_used
+            logger.info("开始课程推荐分析")
+            yield {'type': 'status', 'status': 'course_recommendation_started', 'message': '开始课程推荐分析'}
+            if cached:
+                results["course_recommendation"] = cached["course_recommendation"]
+                yield {'type': 'course_recommendation', 'data': cached["course_recommendation"]}
+            else:
+                retrieval_used = True
+                SPECULATIVE_RETRIEVALS.labels("used").inc()
+                with PIPELINE_STAGE_DURATION.labels("course_recommendation").time():
+                    async with aclosing(course_recommendation_agent.recommend_courses_stream(context, intent_analysis, retrieval=retrieval)) as stream:
+                        async for chunk in stream:
+                            if isinstance(chunk, dict):
+                                results["course_recommendation"] = chunk
+                                yield {'type': 'course_recommendation', 'data': chunk}
+            if not results.get("course_recommendation"):
+                raise ValueError("课程推荐失败")
+            logger.info("课程推荐完成")
+            yield {'type': 'status', 'status': 'course_recommendation_completed', 'message': '课程推荐完成'}
+
+        # 后续阶段只依赖意图分析的结果，彼此独立，并发执行
+        stages = {"chat_response": chat_response_stage}
+        # 只有在工作方法相关的咨询时才进行提问分析
+        if intent_analysis.entities.get('is_work_method', False):
+            stages["question_analysis"] = question_analysis_stage
         else:
             logger.info("非工作方法咨询，跳过提问分析")
             yield f"data: {json.dumps({'type': 'status', 'status': 'question_analysis_skipped', 'message': '非工作方法咨询，跳过提问分析'})}\n\n"
-            await asyncio.sleep(0.1)
-
-        # 开始课程推荐分析
-        logger.info("开始课程推荐分析")
-        yield f"data: {json.dumps({'type': 'status', 'status': 'course_recommendation_started', 'message': '开始课程推荐分析'})}\n\n"
-        await asyncio.sleep(0.1)
-
-        # 进行课程推荐分析
-        course_recommendations = None
-        async for chunk in course_recommendation_agent.recommend_courses_stream(context, intent_analysis):
-            if isinstance(chunk, dict):
-                yield f"data: {json.dumps({'type': 'course_recommendation', 'data': chunk})}\n\n"
-                await asyncio.sleep(0.1)
-                course_recommendations = chunk
-
-        if not course_recommendations:
-            logger.error("课程推荐失败")
-            raise ValueError("课程推荐失败")
-
-        logger.info("课程推荐完成")
-        yield f"data: {json.dumps({'type': 'status', 'status': 'course_recommendation_completed', 'message': '课程推荐完成'})}\n\n"
-        await asyncio.sleep(0.1)
+        # 开启 PIPELINE_SKIP_NON_ENTERPRISE_COURSES 时，非企业相关咨询不推荐课程，丢弃投机检索的结果
+        if intent_analysis.intent == NON_ENTERPRISE_INTENT and get_settings().PIPELINE_SKIP_NON_ENTERPRISE_COURSES:
+            logger.info("非企业相关咨询，跳过课程推荐")
+            yield f"data: {json.dumps({'type': 'status', 'status': 'course_recommendation_skipped', 'message': '非企业相关咨询，跳过课程推荐'})}\n\n"
+        else:
+            stages["course_recommendation"] = course_recommendation_stage
+
+        # 各阶段的事件按到达顺序交错推送，用 stage 字段区分；单个阶段失败不影响其他阶段
+        failed_stages = []
+        async with aclosing(run_concurrently(stages)) as events:
+            async for event in events:
+                if event.failed:
+                    failed_stages.append(event.stage)
+                    yield f"data: {json.dumps({'type': 'stage_error', 'stage': event.stage, 'message': str(event.error)}, ensure_ascii=False)}\n\n"
+                else:
+                    yield f"data: {json.dumps({**event.item, 'stage': event.stage}, ensure_ascii=False)}\n\n"
+
+        # 未命中时在后台写回；带错误或不完整的结果不缓存
+        chat_response = results.get("chat_response")
+        course_recommendations = results.get("course_recommendation")
+        if lookup is not None and not lookup.hit and chat_response and course_recommendations \
+                and "error" not in chat_response and "error" not in course_recommendations.get("data", {}):
+            semantic_cache.store_later(lookup, request.message, catalog_version, {
+                "chat_response": chat_response,
+                "course_recommendation": course_recommendations,
+            })
+
+        # 记录本轮对话，供同一会话的后续请求使用；模型输出缺少回答时不记录，
+        # 写入失败只记日志，不影响已经完成的分析
+        if conversation_store is not None and chat_response and "error" not in chat_response:
+            response = chat_response.get("response")
+            answer = response.get("main_answer") if isinstance(response, dict) else None
+            if isinstance(answer, str) and answer:
+                try:
+                    await conversation_store.append(owner, request.session_id, request.message, answer)
+                except Exception as e:
+                    logger.warning(f"记录会话失败: {str(e)}")
 
         # 发送最终完成消息
         logger.info("分析流程完成")
-        yield f"data: {json.dumps({'type': 'status', 'status': 'completed', 'message': '分析完成'})}\n\n"
-        await asyncio.sleep(0.1)
+        yield f"data: {json.dumps({'type': 'status', 'status': 'completed', 'message': '分析完成', 'failed_stages': failed_stages})}\n\n"
         yield "event: complete\n\n"
 
     except Exception as e:
         logger.error(f"分析过程中出错: {str(e)}", exc_info=True)
         yield f"data: {json.dumps({'type': 'error', 'message': f'分析过程中出错: {str(e)}'})}\n\n"
-        await asyncio.sleep(0.1)
         yield "event: complete\n\n"
+    finally:
+        if cache_lookup is not None and not cache_lookup.done():
+            cache_lookup.cancel()
+        if retrieval is not None:
+            _discard_retrieval(retrieval, retrieval_used)
 
 @router.get("/analyze-intent")
 @router.post("/analyze-intent")
@@ -276,7 +397,9 @@ async def analyze_intent(
     llm_agent: LLMAgent = Depends(get_llm_agent),
     training_advisor_agent: TrainingAdvisorAgent = Depends(get_training_advisor_agent),
     ai_response_agent: AIResponseAgent = Depends(get_ai_response_agent),
-    course_recommendation_agent: CourseRecommendationAgent = Depends(get_course_recommendation_agent)
+    course_recommendation_agent: CourseRecommendationAgent = Depends(get_course_recommendation_agent),
+    semantic_cache: Optional[SemanticCache] = Depends(get_semantic_cache),
+    conversation_store: Optional[ConversationStore] = Depends(get_conversation_store)
 ):
     """
     分析用户意图并生成AI回答的API接口（流式响应）
@@ -299,8 +422,15 @@ async def analyze_intent(
             session_id=session_id
         )
 
+    # 在返回响应之前确定归属方，新签发的 id 才能随响应头写入 session cookie
+    owner = _conversation_owner(request) if conversation_store is not None else None
+    events = stream_analysis(intent_request, llm_agent, training_advisor_agent, ai_response_agent, course_recommendation_agent, semantic_cache, conversation_store, owner)
+    # 默认不做任何节流；需要放慢展示节奏时通过 PIPELINE_EVENT_PACING 显式开启
+    pacing = get_settings().PIPELINE_EVENT_PACING
+    if pacing > 0:
+        events = paced(events, pacing)
     return StreamingResponse(
-        stream_analysis(intent_request, llm_agent, training_advisor_agent, ai_response_agent, course_recommendation_agent),
+        stream_until_disconnect(request, events, "analyze_intent"),
         media_type="text/event-stream",
         headers={
             "Cache-Control": "no-cache, no-transform",
@@ -0,0 +1,85 @@
+"""
+应用级的 agent 容器
+
+agent 和它们使用的 LLMService 在 lifespan 中创建一次，挂在 app.state 上由所有请求共享，
+不再在每个请求的 Depends 里重新构造。LLMService 每个提供商一个，各 agent 拿到的是用 for_agent() 绑定了
+名称的视图：预算、指标标签和路由偏好按调用时的 agent 区分，缓存的客户端、指标子项等状态在同一个服务里共享。
+
+测试中替换实现：
+    container = AppContainer.create()
+    app.state.container = dataclasses.replace(container, ai_response_agent=FakeAgent())
+或者
+    app.dependency_overrides[get_container] = lambda: my_container
+"""
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+from starlette.requests import Request
+
+from app.agents.ai_response_agent import AIResponseAgent
+from app.agents.chat_agent import ChatAgent
+from app.agents.conversation_summary_agent import ConversationSummaryAgent
+from app.agents.course_recommendation_agent import CourseRecommendationAgent
+from app.agents.intent_agent import IntentAnalysisAgent
+from app.agents.llm_agent import LLMAgent
+from app.agents.training_advisor_agent import TrainingAdvisorAgent
+from app.core.config import get_settings
+from app.core.conversation import ConversationStore, SQLiteConversations
+from app.core.llm.base import LLMProvider
+from app.core.llm.service import AgentLLMService, LLMService
+
+AGENT_NAMES = ("intent", "chat", "training_advisor", "ai_response", "course_recommendation", "conversation_summary")
+
+
+def _conversation_store(llm_service: AgentLLMService) -> Optional[ConversationStore]:
+    """未开启会话记忆时返回 None"""
+    settings = get_settings()
+    if not settings.CONVERSATION_MEMORY_ENABLED:
+        return None
+    persistence = SQLiteConversations(settings.CONVERSATION_SQLITE_PATH) if settings.CONVERSATION_SQLITE_PATH else None
+    return ConversationStore(
+        ConversationSummaryAgent(llm_service).summarize,
+        window_tokens=settings.CONVERSATION_WINDOW_TOKENS,
+        max_sessions=settings.CONVERSATION_MAX_SESSIONS,
+        persistence=persistence
+    )
+
+
+@dataclass
+class AppContainer:
+    llm_agent: LLMAgent
+    training_advisor_agent: TrainingAdvisorAgent
+    ai_response_agent: AIResponseAgent
+    course_recommendation_agent: CourseRecommendationAgent
+    conversation_store: Optional[ConversationStore] = None
+    llm_services: Dict[LLMProvider, LLMService] = field(default_factory=dict)
+
+    @classmethod
+    def create(cls) -> "AppContainer":
+        provider = LLMProvider(get_settings().LLM_PROVIDER.lower())
+        services = {provider: LLMService(provider)}
+        agents = {name: services[provider].for_agent(name) for name in AGENT_NAMES}
+        return cls(
+            llm_agent=LLMAgent(
+                intent_agent=IntentAnalysisAgent(agents["intent"]),
+                chat_agent=ChatAgent(agents["chat"])
+            ),
+            training_advisor_agent=TrainingAdvisorAgent(agents["training_advisor"]),
+            ai_response_agent=AIResponseAgent(agents["ai_response"]),
+            course_recommendation_agent=CourseRecommendationAgent(agents["course_recommendation"]),
+            conversation_store=_conversation_store(agents["conversation_summary"]),
+            llm_services=services
+        )
+
+    async def close(self) -> None:
+        await self.course_recommendation_agent.close()
+        if self.conversation_store is not None:
+            await self.conversation_store.close()
+
+
+def get_container(request: Request) -> AppContainer:
+    container = getattr(request.app.state, "container", None)
+    if container is None:
+        # 在请求里临时创建会让并发的首批请求各建一套，这里要求必须经过 lifespan 启动
+        raise RuntimeError("AppContainer 未初始化，应用需要通过 lifespan 启动")
+    return container
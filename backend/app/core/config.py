@@ -5,6 +5,7 @@ class Settings(BaseSettings):
     # LLM 配置
     # LLM_PROVIDER: str = "deepseek"  # 默认使用 DeepSeek
     LLM_PROVIDER: str = "wc_llm"  # 使用 WC LLM
+    # LLM_PROVIDER: str = "router"  # 在多个提供商之间路由
     
     # DeepSeek 配置
     DEEPSEEK_API_KEY: str = ""
@@ -14,6 +15,10 @@ class Settings(BaseSettings):
     DEEPSEEK_TIMEOUT: int = 120  # 增加到120秒
     DEEPSEEK_CONNECT_TIMEOUT: int = 30  # 增加到30秒
     DEEPSEEK_READ_TIMEOUT: int = 120  # 增加到120秒
+    DEEPSEEK_MAX_RPS: float = 0  # 每秒请求数上限，0 表示不限制
+    DEEPSEEK_MAX_TPM: int = 0  # 每分钟 tokens 上限，0 表示不限制
+    DEEPSEEK_MAX_CONCURRENCY: int = 32  # 自适应并发上限的最大值
+    DEEPSEEK_MIN_CONCURRENCY: int = 1
     
     # WC LLM 配置
     WC_LLM_API_KEY: str = ""
@@ -23,7 +28,63 @@ class Settings(BaseSettings):
     WC_LLM_TIMEOUT: int = 120
     WC_LLM_CONNECT_TIMEOUT: int = 30
     WC_LLM_READ_TIMEOUT: int = 120
-    
+    WC_LLM_MAX_RPS: float = 0
+    WC_LLM_MAX_TPM: int = 0
+    WC_LLM_MAX_CONCURRENCY: int = 32
+    WC_LLM_MIN_CONCURRENCY: int = 1
+
+    # LLM HTTP 连接池配置（每个提供商一个长连接客户端）
+    LLM_HTTP2: bool = True  # 上游支持时使用 HTTP/2（需要安装 h2）
+    LLM_HTTP_MAX_CONNECTIONS: int = 100
+    LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    LLM_HTTP_KEEPALIVE_EXPIRY: float = 60.0
+    LLM_HTTP_POOL_TIMEOUT: float = 10.0  # 等待空闲连接的最长时间
+    LLM_HTTP_WARMUP: bool = True  # 启动时预热连接
+    LLM_LIMITER_BACKOFF_RATIO: float = 0.5  # 收到 429/5xx 时并发上限的收缩比例
+    LLM_BATCH_CONCURRENCY: int = 8  # 批量补全同时在途的请求数，实际并发仍受限流器约束
+
+    # LLM 重试配置（指数退避 + 抖动）
+    LLM_RETRY_MAX_ATTEMPTS: int = 3  # 包含首次请求
+    LLM_RETRY_BASE_DELAY: float = 0.5
+    LLM_RETRY_MAX_DELAY: float = 8.0
+    LLM_RETRY_MAX_ELAPSED: float = 30.0  # 重试的总耗时上限（秒）
+
+    # LLM 提示词预算配置（各 agent 的预算见 app/core/llm/prompt_budget.py）
+    LLM_PROMPT_BUDGET_ENABLED: bool = True
+    LLM_DEFAULT_INPUT_BUDGET: int = 16000  # 未配置预算的调用方的输入 token 上限
+    LLM_DEFAULT_MAX_TOKENS: int = 2048  # 未指定 max_tokens 时的默认输出上限
+    LLM_STREAM_INCLUDE_USAGE: bool = True  # 流式响应末尾附带 usage，用于统计上游前缀缓存命中
+    LLM_REQUEST_LOG_SAMPLE_RATE: float = 0.01  # 按比例抽样记录请求摘要，完整请求体只在 DEBUG 级别输出
+
+    # LLM 多提供商路由配置（LLM_PROVIDER=router 时生效）
+    LLM_ROUTER_PROVIDERS: str = "deepseek,wc_llm"
+    LLM_AGENT_PROVIDERS: str = ""  # 各 agent 偏好的提供商，如 "intent:deepseek,course_recommendation:wc_llm"
+    LLM_ROUTER_EWMA_ALPHA: float = 0.3
+    LLM_ROUTER_PREFERENCE_WEIGHT: float = 0.5  # 偏好提供商的分数乘以该系数，越小越偏向
+    LLM_ROUTER_FAILURE_THRESHOLD: int = 3  # 连续失败次数达到该值后进入冷却
+    LLM_ROUTER_COOLDOWN: float = 30.0
+
+    # LLM 对冲请求配置（首个 token 迟迟不到时再发一个相同请求）
+    LLM_HEDGE_ENABLED: bool = False  # 调用方未指定 hedge 时的默认值
+    LLM_HEDGE_PROVIDER: str = ""  # 对冲请求使用的提供商，为空则使用主提供商
+    LLM_HEDGE_PERCENTILE: float = 0.95  # 对冲延迟取最近首 token 延迟的该分位数
+    LLM_HEDGE_MIN_DELAY: float = 0.5
+    LLM_HEDGE_MAX_DELAY: float = 10.0  # 样本不足时也使用该值
+    LLM_HEDGE_MAX_RATIO: float = 0.1  # 对冲请求数占总请求数的上限
+
+    # LLM 响应缓存配置
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_MAX_ENTRIES: int = 1024
+    LLM_CACHE_TTL: int = 3600  # 内存缓存过期时间（秒）
+    LLM_CACHE_SQLITE_PATH: str = ""  # 为空则不启用磁盘缓存
+    LLM_CACHE_SQLITE_TTL: int = 7 * 24 * 3600
+    LLM_CACHE_TEMPERATURE_THRESHOLD: float = 0.0  # 未显式指定时，温度不高于该值的请求自动缓存
+
+    # 指标配置
+    METRICS_MULTIPROC_DIR: str = ""  # 多 worker 部署时各 worker 写指标快照的共享目录，为空表示单进程
+    METRICS_FLUSH_INTERVAL: float = 5.0  # 多 worker 模式下写快照的间隔（秒）
+    METRICS_SNAPSHOT_MAX_AGE: float = 60.0  # 超过该时间（秒）未更新的快照视为已退出的 worker，不再汇总
+
     # OpenAI 配置
     OPENAI_API_KEY: str = ""
     OPENAI_API_BASE: str = ""
@@ -45,6 +106,30 @@ class Settings(BaseSettings):
     QDRANT_PORT: int = 6333
     QDRANT_API_KEY: str | None = None
 
+    # 语义缓存配置（/analyze-intent 的回答和课程推荐）
+    SEMANTIC_CACHE_ENABLED: bool = False
+    SEMANTIC_CACHE_COLLECTION: str = "semantic_cache"
+    SEMANTIC_CACHE_THRESHOLD: float = 0.92  # 余弦相似度达到该值才视为命中
+    SEMANTIC_CACHE_TTL: int = 86400  # 条目有效期（秒）
+
+    # 本地意图分类配置（关键词规则 + 离线训练的质心，没把握时才调用 LLM）
+    INTENT_CLASSIFIER_ENABLED: bool = False  # 规则和质心命中时跳过 LLM，也就拿不到 LLM 抽取的实体；建议训练并评估质心后再开启
+    INTENT_CLASSIFIER_MODEL_PATH: str = ""  # scripts/train_intent_classifier.py 生成的质心模型，为空时只用关键词规则
+    INTENT_CLASSIFIER_THRESHOLD: float = 0.85  # 与最近质心的余弦相似度达到该值才直接返回
+    INTENT_CLASSIFIER_MARGIN: float = 0.05  # 最近质心与第二名的最小差距
+    INTENT_LOG_PATH: str = ""  # 把 LLM 的意图分析结果追加到该 JSONL 文件，作为训练样本；为空时不记录
+
+    # 会话记忆配置（服务端保存历史，更早的轮次压缩成摘要）
+    # 开启后同一会话的追问带有历史上下文，语义缓存只对会话中的第一个问题生效
+    CONVERSATION_MEMORY_ENABLED: bool = False
+    CONVERSATION_MAX_SESSIONS: int = 1000  # 内存中最多保留的会话数
+    CONVERSATION_WINDOW_TOKENS: int = 2000  # 放进提示词的最近轮次的 token 上限
+    CONVERSATION_SQLITE_PATH: str = ""  # 为空时只保存在内存中
+
+    # /analyze-intent 事件流配置
+    PIPELINE_EVENT_PACING: float = 0.0  # 相邻事件的最小间隔（秒），0 表示不节流，展示节奏交给前端
+    PIPELINE_SKIP_NON_ENTERPRISE_COURSES: bool = False  # 非企业相关咨询不推荐课程，丢弃投机检索的结果
+
     # 认证配置
     SECRET_KEY: str = "your-secret-key-here"
     ALGORITHM: str = "HS256"
@@ -0,0 +1,220 @@
+"""
+服务端的会话记忆
+
+按会话归属方（owner）和 session_id 保存对话，请求只需要带上最新一条消息。owner 由调用方从服务端可信的身份
+（登录用户或服务端签发的 id）得出，不能直接使用客户端传入的 user_id。发给模型的上下文由两部分组成：
+更早轮次的滚动摘要 + token 预算内的最近几轮，因此对话变长时提示词的大小基本不变。
+
+- 会话保存在有容量上限的内存 LRU 中；配置了 CONVERSATION_SQLITE_PATH 时同时写入 SQLite，
+  内存中淘汰或进程重启后从 SQLite 读回
+- 最近轮次超出窗口后，在后台把溢出的轮次连同旧摘要压缩成新摘要，不阻塞当前请求；
+  压缩完成之前，超出窗口的轮次只是暂时不放进提示词
+"""
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Dict, List, Optional, Set
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from app.core.llm.prompt_budget import estimate_messages_tokens
+from app.core.metrics import CONVERSATION_COMPACTIONS
+
+logger = logging.getLogger(__name__)
+
+# (旧摘要, 需要并入摘要的轮次) -> 新摘要
+Summarizer = Callable[[str, List[Dict[str, str]]], Awaitable[str]]
+
+SUMMARY_PREFIX = "此前对话的摘要："
+# 客户端带上的历史只接受这两种角色，避免客户端注入 system 消息
+CLIENT_ROLES = ("user", "assistant")
+
+
+@dataclass
+class Conversation:
+    summary: str = ""
+    turns: List[Dict[str, str]] = field(default_factory=list)
+    updated_at: float = field(default_factory=time.time)
+
+    def to_json(self) -> str:
+        return json.dumps({"summary": self.summary, "turns": self.turns, "updated_at": self.updated_at},
+                          ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, data: str) -> "Conversation":
+        value = json.loads(data)
+        return cls(value.get("summary", ""), value.get("turns", []), value.get("updated_at", time.time()))
+
+
+class SQLiteConversations:
+    """会话的持久化；sqlite3 是同步接口，由 ConversationStore 放到线程中调用"""
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS conversations (key TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+
+    def get(self, key: str) -> Optional[Conversation]:
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM conversations WHERE key = ?", (key,)).fetchone()
+        return Conversation.from_json(row[0]) if row else None
+
+    def put(self, key: str, data: str, updated_at: float) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO conversations (key, data, updated_at) VALUES (?, ?, ?)",
+                (key, data, updated_at)
+            )
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class ConversationStore:
+    def __init__(
+        self,
+        summarize: Summarizer,
+        window_tokens: int = 2000,
+        max_sessions: int = 1000,
+        persistence: Optional[SQLiteConversations] = None
+    ):
+        """
+        window_tokens: 放进提示词的最近轮次的 token 上限，超出的部分在后台压缩进摘要
+        max_sessions: 内存中最多保留的会话数，超出时淘汰最久未使用的
+        """
+        self.summarize = summarize
+        self.window_tokens = window_tokens
+        self.max_sessions = max_sessions
+        self.persistence = persistence
+        self._sessions: "OrderedDict[str, Conversation]" = OrderedDict()
+        self._compacting: Set[str] = set()
+        self._pending: Set[asyncio.Future] = set()
+        self.compactions = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(owner: str, session_id: str) -> str:
+        return f"{owner}:{session_id}"
+
+    async def _get(self, key: str) -> Conversation:
+        conversation = self._sessions.get(key)
+        if conversation is not None:
+            self._sessions.move_to_end(key)
+            return conversation
+        if self.persistence is not None:
+            conversation = await asyncio.to_thread(self.persistence.get, key)
+        # 读回期间可能有并发请求已经放入同一个会话，以先放入的为准
+        conversation = self._sessions.setdefault(key, conversation or Conversation())
+        self._evict()
+        return conversation
+
+    def _evict(self) -> None:
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            self.evictions += 1
+
+    async def _save(self, key: str, conversation: Conversation) -> None:
+        conversation.updated_at = time.time()
+        if self.persistence is not None:
+            # 在事件循环中序列化，避免线程里读到正在被修改的轮次列表
+            await asyncio.to_thread(self.persistence.put, key, conversation.to_json(), conversation.updated_at)
+
+    def _split(self, turns: List[Dict[str, str]]) -> int:
+        """返回窗口的起点：从最新一轮往前累加，超出 window_tokens 之前的部分都在窗口外"""
+        total = 0
+        for index in range(len(turns) - 1, -1, -1):
+            total += estimate_messages_tokens([turns[index]])
+            if total > self.window_tokens:
+                return index + 1
+        return 0
+
+    async def context_messages(
+        self,
+        owner: str,
+        session_id: str,
+        message: str,
+        client_history: Optional[List[Dict[str, str]]] = None
+    ) -> List[Dict[str, str]]:
+        """
+        构造发给 agent 的消息：摘要（如果有）+ 窗口内的最近轮次 + 当前消息
+
+        client_history: 客户端带上的历史，只在服务端还没有这个会话时用来初始化，且只保留 user/assistant 消息
+        """
+        key = self.key(owner, session_id)
+        conversation = await self._get(key)
+        if client_history and not conversation.turns and not conversation.summary:
+            conversation.turns = [
+                {"role": m["role"], "content": m["content"]} for m in client_history if m["role"] in CLIENT_ROLES
+            ]
+            self._compact_later(key, conversation)
+        messages: List[Dict[str, str]] = []
+        if conversation.summary:
+            messages.append({"role": "system", "content": SUMMARY_PREFIX + conversation.summary})
+        messages.extend(conversation.turns[self._split(conversation.turns):])
+        messages.append({"role": "user", "content": message})
+        return messages
+
+    async def append(self, owner: str, session_id: str, message: str, reply: str) -> None:
+        """记录一轮对话；窗口溢出时在后台压缩"""
+        key = self.key(owner, session_id)
+        conversation = await self._get(key)
+        conversation.turns.append({"role": "user", "content": message})
+        conversation.turns.append({"role": "assistant", "content": reply})
+        await self._save(key, conversation)
+        self._compact_later(key, conversation)
+
+    def _compact_later(self, key: str, conversation: Conversation) -> None:
+        # 同一会话同时只有一个压缩任务；期间新增的轮次留给下一次
+        if key in self._compacting or self._split(conversation.turns) == 0:
+            return
+        self._compacting.add(key)
+        task = asyncio.ensure_future(self._compact(key, conversation))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def _compact(self, key: str, conversation: Conversation) -> None:
+        try:
+            count = self._split(conversation.turns)
+            overflow = conversation.turns[:count]
+            summary = await self.summarize(conversation.summary, overflow)
+            # 压缩期间只会在末尾追加新轮次，开头的 count 轮仍然是刚才摘要的那些
+            conversation.summary = summary
+            del conversation.turns[:count]
+            await self._save(key, conversation)
+            self.compactions += 1
+            CONVERSATION_COMPACTIONS.labels("ok").inc()
+        except Exception as e:
+            # 摘要失败时保留原始轮次，下次追加时重试
+            logger.warning(f"会话摘要失败: {e}")
+            CONVERSATION_COMPACTIONS.labels("error").inc()
+        finally:
+            self._compacting.discard(key)
+
+    async def drain(self) -> None:
+        """等待所有后台压缩完成"""
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+
+    async def close(self) -> None:
+        for task in list(self._pending):
+            task.cancel()
+        await self.drain()
+        if self.persistence is not None:
+            self.persistence.close()
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "sessions": len(self._sessions),
+            "evictions": self.evictions,
+            "compactions": self.compactions,
+            "pending_compactions": len(self._pending),
+        }
@@ -19,6 +19,19 @@ class QdrantDB:
             points=[models.PointStruct(id=id, vector=vector, payload=payload)]
         )
         
+    def ensure_collection(self, collection_name: str, vector_size: int) -> None:
+        if not self.client.collection_exists(collection_name):
+            self.client.create_collection(
+                collection_name=collection_name,
+                vectors_config=models.VectorParams(size=vector_size, distance=models.Distance.COSINE)
+            )
+
+    def delete_by_filter(self, collection_name: str, filter: Dict[str, Any]) -> None:
+        self.client.delete(
+            collection_name=collection_name,
+            points_selector=models.FilterSelector(filter=models.Filter(**filter))
+        )
+
     def delete_vectors(self, collection_name: str, id: str) -> None:
         self.client.delete(
             collection_name=collection_name,
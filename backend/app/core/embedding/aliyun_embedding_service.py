@@ -6,6 +6,8 @@ import os
 from typing import List, Dict, Any, Optional
 import logging
 
+from app.core.metrics import EMBEDDING_DURATION
+
 logger = logging.getLogger(__name__)
 
 class AliyunEmbeddingService:
@@ -26,6 +28,7 @@ class AliyunEmbeddingService:
             raise ValueError("Aliyun credentials not found. Please provide access_key_id and access_key_secret or set environment variables.")
             
         self.client = AcsClient(self.access_key_id, self.access_key_secret, region)
+        self._duration_metric = EMBEDDING_DURATION.labels("aliyun")
         
     async def get_embedding(self, text: str, size: int = 50, split_type: str = "word", operation: str = "average") -> Dict[str, Any]:
         """Get embedding for the given text using Aliyun NLP service
@@ -48,7 +51,8 @@ class AliyunEmbeddingService:
             request.set_Type(split_type)
             request.set_Operation(operation)
             
-            response = self.client.do_action_with_exception(request)
+            with self._duration_metric.time():
+                response = self.client.do_action_with_exception(request)
             if not isinstance(response, (str, bytes, bytearray)):
                 raise ValueError("Unexpected response type from Aliyun API")
                 
@@ -2,6 +2,7 @@ from typing import List, Optional
 import requests
 import os
 from app.core.utils import log
+from app.core.metrics import EMBEDDING_DURATION
 
 class BGEEmbedding:
     """BGE embedding service for text vectorization."""
@@ -14,6 +15,7 @@ class BGEEmbedding:
         """
         self.base_url = base_url or os.getenv("BGE_BASE_URL", "http://stark-vector.x-amc.wke-office.test.wacai.info").rstrip('/')
         self.embedding_endpoint = "/bge/em"
+        self._duration_metric = EMBEDDING_DURATION.labels("bge")
         log.info(f"Initialized BGE embedding service with base URL: {self.base_url}")
     
     def get_embedding(self, text: str) -> List[float]:
@@ -38,10 +40,11 @@ class BGEEmbedding:
             }
             
             # Make request to embedding service
-            response = requests.post(
-                f"{self.base_url}{self.embedding_endpoint}",
-                json=data
-            )
+            with self._duration_metric.time():
+                response = requests.post(
+                    f"{self.base_url}{self.embedding_endpoint}",
+                    json=data
+                )
             
             # Check if request was successful
             response.raise_for_status()
@@ -2,6 +2,7 @@ from abc import ABC, abstractmethod
 from typing import AsyncGenerator, Dict, List, Optional, Union, Any
 from enum import Enum
 from pydantic import BaseModel, Field
+from app.core.llm.retry import RetryPolicy
 
 class MessageRole(str, Enum):
     SYSTEM = "system"
@@ -11,6 +12,7 @@ class MessageRole(str, Enum):
     FUNCTION = "function"
 
 class ChatMessage(BaseModel):
+    """在 API 入口校验客户端传入的消息；服务内部和客户端之间只传普通 dict"""
     role: MessageRole
     content: str
     name: Optional[str] = None
@@ -21,13 +23,27 @@ class ChatMessage(BaseModel):
 class LLMProvider(Enum):
     DEEPSEEK = "deepseek"
     WC_LLM = "wc_llm"  # 添加 WC LLM 提供商
+    ROUTER = "router"  # 按延迟和错误率在 LLM_ROUTER_PROVIDERS 之间路由
     # 可以添加更多提供商
 
 class BaseLLMClient(ABC):
+    _retry_policy: Optional[RetryPolicy] = None
+
+    @property
+    def retry_policy(self) -> RetryPolicy:
+        """重试策略，默认从配置读取，可按实例覆盖"""
+        if self._retry_policy is None:
+            self._retry_policy = RetryPolicy.from_settings()
+        return self._retry_policy
+
+    @retry_policy.setter
+    def retry_policy(self, policy: RetryPolicy) -> None:
+        self._retry_policy = policy
+
     @abstractmethod
     async def create_chat_completion(
         self,
-        messages: List[ChatMessage],
+        messages: List[Dict[str, Any]],
         stream: bool = False,
         temperature: float = 0.7,
         max_tokens: Optional[int] = None,
@@ -41,7 +57,7 @@ class BaseLLMClient(ABC):
     @abstractmethod
     async def create_chat_completion_stream(
         self,
-        messages: List[ChatMessage],
+        messages: List[Dict[str, Any]],
         temperature: float = 0.7,
         max_tokens: Optional[int] = None,
         top_p: float = 1.0,
@@ -54,14 +70,23 @@ class BaseLLMClient(ABC):
 class LLMClientFactory:
     _clients = {}
 
+    @classmethod
+    def create_client(cls, provider: LLMProvider) -> BaseLLMClient:
+        """新建一个客户端实例；连接池和限流器按提供商共享，实例本身只有重试策略等少量状态"""
+        if provider == LLMProvider.DEEPSEEK:
+            from app.core.utils.deepseek_client import DeepSeekClient
+            return DeepSeekClient()
+        elif provider == LLMProvider.WC_LLM:
+            from app.core.utils.wc_llm_client import WCLLMClient
+            return WCLLMClient()
+        elif provider == LLMProvider.ROUTER:
+            from app.core.llm.router import build_router_client
+            return build_router_client()
+        # 可以添加更多提供商
+        raise ValueError(f"不支持的 LLM 提供商: {provider}")
+
     @classmethod
     def get_client(cls, provider: LLMProvider) -> BaseLLMClient:
         if provider not in cls._clients:
-            if provider == LLMProvider.DEEPSEEK:
-                from app.core.utils.deepseek_client import DeepSeekClient
-                cls._clients[provider] = DeepSeekClient()
-            elif provider == LLMProvider.WC_LLM:
-                from app.core.utils.wc_llm_client import WCLLMClient
-                cls._clients[provider] = WCLLMClient()
-            # 可以添加更多提供商
+            cls._clients[provider] = cls.create_client(provider)
         return cls._clients[provider] 
\ No newline at end of file
@@ -0,0 +1,185 @@
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+import asyncio
+import copy
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+
+from app.core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+
+def make_cache_key(
+    provider: str,
+    model: str,
+    messages: List[Dict[str, Any]],
+    temperature: float,
+    top_p: float,
+    max_tokens: Optional[int],
+    frequency_penalty: float = 0.0,
+    presence_penalty: float = 0.0
+) -> str:
+    """对请求参数做规范化序列化后取哈希，作为缓存键"""
+    payload = {
+        "provider": provider,
+        "model": model,
+        "messages": [{"role": str(msg["role"]), "content": msg["content"]} for msg in messages],
+        "temperature": round(float(temperature), 4),
+        "top_p": round(float(top_p), 4),
+        "max_tokens": max_tokens,
+        "frequency_penalty": round(float(frequency_penalty), 4),
+        "presence_penalty": round(float(presence_penalty), 4),
+    }
+    canonical = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+# (过期时间, 响应)
+_Entry = Tuple[float, Dict[str, Any]]
+
+
+class MemoryCacheTier:
+    """进程内 LRU 缓存，带过期时间"""
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteCacheTier:
+    """磁盘 SQLite 缓存，服务重启后仍然有效"""
+    def __init__(self, path: str, ttl: float):
+        self.path = path
+        self.ttl = ttl
+        self.expirations = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn.commit()
+
+    def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if row[1] < time.time():
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                self._conn.commit()
+                self.expirations += 1
+                return None
+        return json.loads(row[0])
+
+    def _set(self, key: str, value: Dict[str, Any]) -> None:
+        data = json.dumps(value, ensure_ascii=False)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, data, time.time() + self.ttl)
+            )
+            self._conn.commit()
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, value: Dict[str, Any]) -> None:
+        await asyncio.to_thread(self._set, key, value)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class ResponseCache:
+    """两级响应缓存：内存 LRU + 可选的 SQLite"""
+    def __init__(self, memory: MemoryCacheTier, disk: Optional[SQLiteCacheTier] = None):
+        self.memory = memory
+        self.disk = disk
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self.memory.get(key)
+        if value is not None:
+            self.memory_hits += 1
+            return copy.deepcopy(value)
+        if self.disk is not None:
+            try:
+                value = await self.disk.get(key)
+            except sqlite3.Error as e:
+                logger.warning(f"读取磁盘缓存失败: {str(e)}")
+                value = None
+            if value is not None:
+                self.disk_hits += 1
+                self.memory.set(key, value)
+                return copy.deepcopy(value)
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, value: Dict[str, Any]) -> None:
+        self.memory.set(key, copy.deepcopy(value))
+        if self.disk is not None:
+            try:
+                await self.disk.set(key, value)
+            except sqlite3.Error as e:
+                logger.warning(f"写入磁盘缓存失败: {str(e)}")
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.memory_hits + self.disk_hits,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.memory.evictions,
+            "expirations": self.memory.expirations + (self.disk.expirations if self.disk else 0),
+            "size": len(self.memory),
+        }
+
+
+@lru_cache()
+def get_response_cache() -> ResponseCache:
+    settings = get_settings()
+    memory = MemoryCacheTier(settings.LLM_CACHE_MAX_ENTRIES, settings.LLM_CACHE_TTL)
+    disk = None
+    if settings.LLM_CACHE_SQLITE_PATH:
+        disk = SQLiteCacheTier(settings.LLM_CACHE_SQLITE_PATH, settings.LLM_CACHE_SQLITE_TTL)
+    return ResponseCache(memory, disk)
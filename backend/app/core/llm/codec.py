@@ -0,0 +1,52 @@
+"""
+请求和响应的 JSON 编解码
+
+消息在服务内部一直是普通 dict，只在 API 入口校验一次；发给上游时一次性序列化成 bytes。
+注册过的系统提示词在注册时就编码好，每次请求直接拼接，不再重复序列化几 KB 的固定文本。
+"""
+from typing import Any, Dict, Iterable, List
+import json
+
+try:  # orjson 比标准库快数倍，未安装时退回 json
+    import orjson
+
+    def loads(data: bytes) -> Any:
+        return orjson.loads(data)
+
+    def dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj)
+
+    JSON_BACKEND = "orjson"
+except ImportError:
+    loads = json.loads
+
+    def dumps(obj: Any) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    JSON_BACKEND = "json"
+
+# 系统提示词内容 -> 编码好的 {"role":"system","content":...}
+_static_messages: Dict[str, bytes] = {}
+
+
+def register_static_message(content: str) -> None:
+    if content not in _static_messages:
+        _static_messages[content] = dumps({"role": "system", "content": content})
+
+
+def encode_messages(messages: Iterable[Dict[str, Any]]) -> bytes:
+    parts: List[bytes] = []
+    for msg in messages:
+        # 只有 role + content 两个字段的系统消息才能直接复用预编码结果
+        if len(msg) == 2 and msg.get("role") == "system":
+            encoded = _static_messages.get(msg["content"])
+            if encoded is not None:
+                parts.append(encoded)
+                continue
+        parts.append(dumps(msg))
+    return b"[" + b",".join(parts) + b"]"
+
+
+def encode_chat_body(messages: Iterable[Dict[str, Any]], params: Dict[str, Any]) -> bytes:
+    """把 messages 和其余参数拼成一个请求体；params 至少包含一个字段（如 model）"""
+    return b'{"messages":' + encode_messages(messages) + b"," + dumps(params)[1:]
@@ -0,0 +1,193 @@
+from collections import deque
+from typing import Any, AsyncGenerator, Awaitable, Callable, Deque, Dict, Optional, Tuple
+import asyncio
+import logging
+import math
+import time
+
+from app.core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+
+def _is_error(result: Any) -> bool:
+    return isinstance(result, dict) and "error" in result
+
+
+class HedgePolicy:
+    """对冲请求策略：延迟取最近延迟样本的分位数，对冲比例受预算限制"""
+    def __init__(
+        self,
+        percentile: float = 0.95,
+        min_delay: float = 0.5,
+        max_delay: float = 10.0,
+        max_ratio: float = 0.1,
+        window: int = 500,
+        min_samples: int = 20
+    ):
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.max_ratio = max_ratio
+        self.min_samples = min_samples
+        self._samples: Deque[float] = deque(maxlen=window)
+        # 每个请求积累 max_ratio 个对冲额度，最多攒 10 个，避免突发时大量对冲
+        self._budget = 0.0
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def observe(self, latency: float) -> None:
+        self._samples.append(latency)
+
+    def delay(self) -> float:
+        """样本不足时用 max_delay，足够后用分位数并限制在 [min_delay, max_delay]"""
+        if len(self._samples) < self.min_samples:
+            return self.max_delay
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, max(0, math.ceil(round(self.percentile * len(ordered), 6)) - 1))
+        return min(self.max_delay, max(self.min_delay, ordered[index]))
+
+    def on_request(self) -> None:
+        self.requests += 1
+        self._budget = min(10.0, self._budget + self.max_ratio)
+
+    def try_hedge(self) -> bool:
+        # 容忍累加 max_ratio 时的浮点误差
+        if self._budget < 1.0 - 1e-9:
+            return False
+        self._budget = max(0.0, self._budget - 1.0)
+        self.hedges += 1
+        return True
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "requests": self.requests,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "hedge_rate": self.hedges / self.requests if self.requests else 0.0,
+            "delay_seconds": self.delay(),
+        }
+
+
+_policies: Dict[Tuple[str, str], HedgePolicy] = {}
+
+
+def get_hedge_policy(provider: str, kind: str) -> HedgePolicy:
+    """按提供商和请求类型（completion/stream）分别维护延迟样本"""
+    key = (provider, kind)
+    policy = _policies.get(key)
+    if policy is None:
+        settings = get_settings()
+        policy = HedgePolicy(
+            percentile=settings.LLM_HEDGE_PERCENTILE,
+            min_delay=settings.LLM_HEDGE_MIN_DELAY,
+            max_delay=settings.LLM_HEDGE_MAX_DELAY,
+            max_ratio=settings.LLM_HEDGE_MAX_RATIO,
+        )
+        _policies[key] = policy
+    return policy
+
+
+def get_hedge_stats() -> Dict[str, Dict[str, float]]:
+    return {f"{provider}:{kind}": policy.stats() for (provider, kind), policy in _policies.items()}
+
+
+async def hedged_completion(
+    policy: HedgePolicy,
+    primary: Callable[[], Awaitable[Dict[str, Any]]],
+    secondary: Callable[[], Awaitable[Dict[str, Any]]]
+) -> Dict[str, Any]:
+    """主请求在对冲延迟内没有返回时发出第二个请求，取先成功的结果并取消另一个"""
+    policy.on_request()
+    start = time.monotonic()
+    first = asyncio.ensure_future(primary())
+    try:
+        done, _ = await asyncio.wait({first}, timeout=policy.delay())
+        if done or not policy.try_hedge():
+            result = await first
+            policy.observe(time.monotonic() - start)
+            return result
+    except BaseException:
+        first.cancel()
+        raise
+
+    logger.info("主请求超过对冲延迟，发出对冲请求")
+    second = asyncio.ensure_future(secondary())
+    pending = {first, second}
+    result: Optional[Dict[str, Any]] = None
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                response = task.result()
+                if not _is_error(response):
+                    if task is second:
+                        policy.hedge_wins += 1
+                    policy.observe(time.monotonic() - start)
+                    return response
+                result = response
+        return result
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+async def hedged_stream(
+    policy: HedgePolicy,
+    primary: Callable[[], AsyncGenerator[Dict[str, Any], None]],
+    secondary: Callable[[], AsyncGenerator[Dict[str, Any], None]]
+) -> AsyncGenerator[Dict[str, Any], None]:
+    """主流在对冲延迟内没有首个数据块时发出第二个流，使用先出首块的流并关闭另一个"""
+    policy.on_request()
+    start = time.monotonic()
+    streams = [primary()]
+    firsts = [asyncio.ensure_future(streams[0].__anext__())]
+    winner = 0
+    try:
+        done, _ = await asyncio.wait({firsts[0]}, timeout=policy.delay())
+        if not done and policy.try_hedge():
+            logger.info("主流式请求超过对冲延迟，发出对冲请求")
+            streams.append(secondary())
+            firsts.append(asyncio.ensure_future(streams[1].__anext__()))
+            pending = set(firsts)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # 优先选择首块不是错误的流
+                good = [t for t in done if t.exception() is None and not _is_error(t.result())]
+                if good or not pending:
+                    chosen = good[0] if good else next(iter(done))
+                    winner = firsts.index(chosen)
+                    break
+            if winner == 1:
+                policy.hedge_wins += 1
+        first_chunk = await firsts[winner]
+    except StopAsyncIteration:
+        first_chunk = None
+    finally:
+        # 正常情况下只关闭落败的流；等待首块时被调用方取消则全部关闭
+        abandoned = [index for index, task in enumerate(firsts) if index != winner or not task.done()]
+        for index in abandoned:
+            firsts[index].cancel()
+        # 先等被取消的 __anext__ 结束，生成器才能被关闭
+        await asyncio.gather(*(firsts[index] for index in abandoned), return_exceptions=True)
+        for index in abandoned:
+            await _close_quietly(streams[index])
+
+    policy.observe(time.monotonic() - start)
+    stream = streams[winner]
+    try:
+        if first_chunk is None:
+            return
+        yield first_chunk
+        async for chunk in stream:
+            yield chunk
+    finally:
+        await stream.aclose()
+
+
+async def _close_quietly(stream: AsyncGenerator[Any, None]) -> None:
+    try:
+        await stream.aclose()
+    except Exception as e:
+        logger.warning(f"关闭对冲落败的流失败: {e}")
@@ -0,0 +1,120 @@
+from typing import Dict, Iterable, Optional
+import asyncio
+import logging
+
+import httpx
+
+from app.core.config import get_settings
+from app.core.llm.base import LLMProvider
+
+logger = logging.getLogger(__name__)
+
+try:  # HTTP/2 需要安装 h2（httpx[http2]），未安装时退回 HTTP/1.1
+    import h2  # noqa: F401
+    _HTTP2_AVAILABLE = True
+except ImportError:
+    _HTTP2_AVAILABLE = False
+
+_clients: Dict[LLMProvider, httpx.AsyncClient] = {}
+
+
+def _provider_settings(provider: LLMProvider) -> Dict[str, object]:
+    """读取某个提供商的连接配置"""
+    settings = get_settings()
+    if provider == LLMProvider.DEEPSEEK:
+        return {
+            "base_url": settings.DEEPSEEK_API_BASE,
+            "timeout": settings.DEEPSEEK_TIMEOUT,
+            "connect_timeout": settings.DEEPSEEK_CONNECT_TIMEOUT,
+            "read_timeout": settings.DEEPSEEK_READ_TIMEOUT,
+        }
+    if provider == LLMProvider.WC_LLM:
+        return {
+            "base_url": settings.WC_LLM_API_BASE,
+            "timeout": settings.WC_LLM_TIMEOUT,
+            "connect_timeout": settings.WC_LLM_CONNECT_TIMEOUT,
+            "read_timeout": settings.WC_LLM_READ_TIMEOUT,
+        }
+    raise ValueError(f"Unsupported LLM provider: {provider}")
+
+
+def _build_client(provider: LLMProvider) -> httpx.AsyncClient:
+    settings = get_settings()
+    conf = _provider_settings(provider)
+    limits = httpx.Limits(
+        max_connections=settings.LLM_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.LLM_HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.LLM_HTTP_KEEPALIVE_EXPIRY,
+    )
+    timeout = httpx.Timeout(
+        conf["timeout"],
+        connect=conf["connect_timeout"],
+        read=conf["read_timeout"],
+        pool=settings.LLM_HTTP_POOL_TIMEOUT,
+    )
+    http2 = settings.LLM_HTTP2 and _HTTP2_AVAILABLE
+    if settings.LLM_HTTP2 and not _HTTP2_AVAILABLE:
+        logger.warning("LLM_HTTP2 已开启但未安装 h2，%s 使用 HTTP/1.1", provider.value)
+    logger.info(
+        "创建 %s 连接池: http2=%s, max_connections=%s, keepalive=%s",
+        provider.value, http2, limits.max_connections, limits.max_keepalive_connections
+    )
+    return httpx.AsyncClient(timeout=timeout, limits=limits, http2=http2)
+
+
+def get_http_client(provider: LLMProvider) -> httpx.AsyncClient:
+    """获取提供商共享的长连接 HTTP 客户端（首次使用或关闭后重建）"""
+    client = _clients.get(provider)
+    if client is None or client.is_closed:
+        client = _build_client(provider)
+        _clients[provider] = client
+    return client
+
+
+async def _warm(provider: LLMProvider) -> None:
+    """预先建立 TCP/TLS 连接，避免首个请求承担握手开销"""
+    base_url = str(_provider_settings(provider)["base_url"])
+    if not base_url:
+        return
+    try:
+        await get_http_client(provider).head(base_url)
+    except httpx.HTTPError as e:
+        # 预热失败不影响启动，首个请求会重新建立连接
+        logger.warning("预热 %s 连接失败: %s", provider.value, str(e))
+
+
+async def open_http_clients(providers: Optional[Iterable[LLMProvider]] = None, warm: bool = True) -> None:
+    """应用启动时创建并预热连接池"""
+    providers = list(providers) if providers is not None else list(_default_providers())
+    for provider in providers:
+        get_http_client(provider)
+    if warm:
+        await asyncio.gather(*(_warm(provider) for provider in providers))
+
+
+async def close_http_clients() -> None:
+    """应用关闭时释放所有连接"""
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        await client.aclose()
+
+
+def _default_providers() -> Iterable[LLMProvider]:
+    settings = get_settings()
+    configured = LLMProvider(settings.LLM_PROVIDER.lower())
+    if configured == LLMProvider.ROUTER:
+        # 路由客户端本身不发请求，连接池属于它路由到的提供商
+        from app.core.llm.router import parse_router_providers
+        routed = parse_router_providers(settings.LLM_ROUTER_PROVIDERS)
+        yield from routed
+    else:
+        routed = [configured]
+        yield configured
+    for provider in LLMProvider:
+        if provider in routed or provider == LLMProvider.ROUTER:
+            continue
+        if provider == LLMProvider.DEEPSEEK and settings.DEEPSEEK_API_KEY:
+            yield provider
+        elif provider == LLMProvider.WC_LLM and settings.WC_LLM_API_KEY:
+            yield provider
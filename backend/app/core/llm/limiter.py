@@ -0,0 +1,228 @@
+from collections import deque
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from typing import Any, AsyncIterator, Deque, Dict, Optional, Union
+import asyncio
+import logging
+import time
+
+from app.core.config import get_settings
+from app.core.llm.base import LLMProvider
+from app.core.llm.prompt_budget import estimate_messages_tokens
+from app.core.metrics import LLM_LIMITER_QUEUE_WAIT
+
+logger = logging.getLogger(__name__)
+
+
+def parse_retry_after(value: Optional[Union[str, float, int]]) -> Optional[float]:
+    """解析 Retry-After（秒数或 HTTP 日期），返回需要等待的秒数"""
+    if value is None or value == "":
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(str(value)).timestamp() - time.time())
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def is_overload_status(status_code: Optional[int]) -> bool:
+    """429 和 5xx 表示上游过载，需要收缩并发"""
+    return status_code is not None and (status_code == 429 or status_code >= 500)
+
+
+class TokenBucket:
+    """令牌桶，rate 为每秒补充的令牌数，rate <= 0 表示不限制"""
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def reserve(self, amount: float = 1.0) -> float:
+        """预留令牌并返回需要等待的秒数；令牌可以透支，按预留顺序排队"""
+        if self.rate <= 0:
+            return 0.0
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        self._tokens -= min(amount, self.capacity)
+        if self._tokens >= 0:
+            return 0.0
+        return -self._tokens / self.rate
+
+
+class AdaptiveConcurrencyLimit:
+    """AIMD 并发上限：成功时加性增长，过载时乘性收缩"""
+    def __init__(self, initial: int, minimum: int, maximum: int, backoff_ratio: float = 0.5):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.backoff_ratio = backoff_ratio
+        self.in_flight = 0
+        self._waiters: Deque["asyncio.Future[None]"] = deque()
+
+    async def acquire(self) -> None:
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # 已经分配到名额但调用方被取消，归还名额
+                self.release()
+            elif waiter in self._waiters:
+                self._waiters.remove(waiter)
+            raise
+
+    def release(self) -> None:
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self) -> None:
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def on_success(self) -> None:
+        # 大约每轮（limit 次成功）增加 1
+        self.limit = min(self.maximum, self.limit + 1.0 / max(self.limit, 1.0))
+        self._wake()
+
+    def on_overload(self) -> None:
+        self.limit = max(self.minimum, self.limit * self.backoff_ratio)
+
+
+class LimiterSlot:
+    """一次上游调用占用的名额，调用结束时把结果反馈给限流器"""
+    def __init__(self):
+        self.status_code: Optional[int] = None
+        self.retry_after: Optional[float] = None
+        self.failed = False
+        self.responded = False  # 上游已经正常响应（流式请求收到了响应头）
+        self.abandoned = False  # 调用方提前关闭流或被取消
+
+    def respond(self) -> None:
+        self.responded = True
+
+    def fail(self, status_code: Optional[int] = None, retry_after: Any = None) -> None:
+        self.failed = True
+        self.status_code = status_code
+        self.retry_after = parse_retry_after(retry_after)
+
+
+class ProviderRateLimiter:
+    """单个提供商的限流器：请求数/秒、tokens/分钟两个令牌桶 + 自适应并发上限"""
+    def __init__(
+        self,
+        name: str,
+        max_rps: float,
+        max_tpm: float,
+        max_concurrency: int,
+        min_concurrency: int = 1,
+        backoff_ratio: float = 0.5
+    ):
+        self.name = name
+        self.requests = TokenBucket(max_rps, max_rps)
+        self.tokens = TokenBucket(max_tpm / 60.0, max_tpm)
+        self.concurrency = AdaptiveConcurrencyLimit(max_concurrency, min_concurrency, max_concurrency, backoff_ratio)
+        self._blocked_until = 0.0
+        self.throttled = 0
+        self.queue_wait_count = 0
+        self.queue_wait_sum = 0.0
+        self.queue_wait_max = 0.0
+        self._queue_wait_histogram = LLM_LIMITER_QUEUE_WAIT.labels(name)
+
+    async def acquire(self, cost_tokens: float = 0.0) -> float:
+        """等待可用名额，返回排队时间（秒）"""
+        start = time.monotonic()
+        blocked = self._blocked_until - start
+        if blocked > 0:
+            await asyncio.sleep(blocked)
+        delay = max(self.requests.reserve(1.0), self.tokens.reserve(cost_tokens))
+        if delay > 0:
+            await asyncio.sleep(delay)
+        await self.concurrency.acquire()
+        waited = time.monotonic() - start
+        self.queue_wait_count += 1
+        self.queue_wait_sum += waited
+        self.queue_wait_max = max(self.queue_wait_max, waited)
+        self._queue_wait_histogram.observe(waited)
+        return waited
+
+    def release(self, slot: LimiterSlot) -> None:
+        if slot.abandoned and not slot.failed and not slot.responded:
+            # 上游还没有响应调用方就离开了，不能说明上游的状况，不调整并发上限
+            pass
+        elif not slot.failed:
+            self.concurrency.on_success()
+        elif is_overload_status(slot.status_code):
+            self.throttled += 1
+            self.concurrency.on_overload()
+            if slot.retry_after:
+                self._blocked_until = max(self._blocked_until, time.monotonic() + slot.retry_after)
+            logger.warning(
+                "%s 上游过载 (status=%s)，并发上限降为 %.1f", self.name, slot.status_code, self.concurrency.limit
+            )
+        self.concurrency.release()
+
+    @asynccontextmanager
+    async def slot(self, cost_tokens: float = 0.0) -> AsyncIterator[LimiterSlot]:
+        await self.acquire(cost_tokens)
+        slot = LimiterSlot()
+        try:
+            yield slot
+        except (GeneratorExit, asyncio.CancelledError):
+            # agent 拿到完整结果后提前关闭流、客户端断开时取消流，都不是上游的故障
+            slot.abandoned = True
+            raise
+        except BaseException:
+            if not slot.failed:
+                slot.fail()
+            raise
+        finally:
+            self.release(slot)
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "concurrency_limit": self.concurrency.limit,
+            "in_flight": self.concurrency.in_flight,
+            "queued": len(self.concurrency._waiters),
+            "throttled": self.throttled,
+            "queue_wait_count": self.queue_wait_count,
+            "queue_wait_seconds_sum": self.queue_wait_sum,
+            "queue_wait_seconds_max": self.queue_wait_max,
+        }
+
+
+_limiters: Dict[LLMProvider, ProviderRateLimiter] = {}
+
+
+def get_rate_limiter(provider: LLMProvider) -> ProviderRateLimiter:
+    """获取提供商的限流器（进程内共享）"""
+    limiter = _limiters.get(provider)
+    if limiter is None:
+        settings = get_settings()
+        if provider == LLMProvider.DEEPSEEK:
+            limits = (settings.DEEPSEEK_MAX_RPS, settings.DEEPSEEK_MAX_TPM,
+                      settings.DEEPSEEK_MAX_CONCURRENCY, settings.DEEPSEEK_MIN_CONCURRENCY)
+        elif provider == LLMProvider.WC_LLM:
+            limits = (settings.WC_LLM_MAX_RPS, settings.WC_LLM_MAX_TPM,
+                      settings.WC_LLM_MAX_CONCURRENCY, settings.WC_LLM_MIN_CONCURRENCY)
+        else:
+            raise ValueError(f"Unsupported LLM provider: {provider}")
+        limiter = ProviderRateLimiter(provider.value, *limits, backoff_ratio=settings.LLM_LIMITER_BACKOFF_RATIO)
+        _limiters[provider] = limiter
+    return limiter
+
+
+def estimate_request_tokens(messages: Any, max_tokens: Optional[int]) -> float:
+    """估算一次请求消耗的 tokens（输入估算 + 输出上限），用于 tokens/分钟 限流"""
+    return estimate_messages_tokens(messages) + (max_tokens or 512)
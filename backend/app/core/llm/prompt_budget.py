@@ -0,0 +1,156 @@
+from collections import defaultdict
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+import math
+import re
+
+from app.core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# 汉字、日文假名、韩文和全角标点：DeepSeek 的分词器中约 0.6 token/字，其余字符约 0.3 token/字
+_CJK_RE = re.compile(r"[\u3000-\u303f\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uff00-\uffef]")
+CJK_TOKENS_PER_CHAR = 0.6
+OTHER_TOKENS_PER_CHAR = 0.3
+# 每条消息的角色、分隔符等格式开销
+MESSAGE_OVERHEAD_TOKENS = 4
+TRUNCATION_MARKER = "\n……（内容过长，已截断）"
+
+
+@dataclass(frozen=True)
+class AgentBudget:
+    """单个 agent 的输入 token 上限和默认输出上限"""
+    max_input_tokens: int
+    max_tokens: int
+
+
+# 各 agent 的默认预算；输出上限按各自 JSON 结构的实际长度留出余量
+AGENT_BUDGETS: Dict[str, AgentBudget] = {
+    "intent": AgentBudget(max_input_tokens=4000, max_tokens=1024),
+    "training_advisor": AgentBudget(max_input_tokens=8000, max_tokens=2048),
+    "collection_strategy": AgentBudget(max_input_tokens=8000, max_tokens=2048),
+    "ai_response": AgentBudget(max_input_tokens=8000, max_tokens=2048),
+    "chat": AgentBudget(max_input_tokens=8000, max_tokens=2048),
+    # 摘要会放进后续每个请求的提示词，输出上限决定了摘要的最大长度
+    "conversation_summary": AgentBudget(max_input_tokens=8000, max_tokens=512),
+    # 课程拆分需要原样返回课程内容，输入和输出都要留得更大
+    "course_recommendation": AgentBudget(max_input_tokens=24000, max_tokens=8192),
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """不依赖分词器的 token 估算，中文按字、其他按字符折算"""
+    if not text:
+        return 0
+    cjk = len(_CJK_RE.findall(text))
+    return math.ceil(cjk * CJK_TOKENS_PER_CHAR + (len(text) - cjk) * OTHER_TOKENS_PER_CHAR)
+
+
+def _content(message: Any) -> str:
+    content = message.content if hasattr(message, "content") else message.get("content", "")
+    return content or ""
+
+
+# 系统提示词基本固定，估算结果按内容缓存
+_estimate_static_tokens = lru_cache(maxsize=256)(estimate_tokens)
+
+
+def _role(message: Any) -> Any:
+    return message.role if hasattr(message, "role") else message.get("role")
+
+
+def estimate_messages_tokens(messages: List[Any]) -> int:
+    return sum(
+        (_estimate_static_tokens if _role(msg) == "system" else estimate_tokens)(_content(msg))
+        + MESSAGE_OVERHEAD_TOKENS
+        for msg in messages
+    )
+
+
+def truncate_text(text: str, max_tokens: int, marker: str = TRUNCATION_MARKER) -> str:
+    """把文本截断到约 max_tokens 个 token，保留开头部分"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    budget = max(0.0, max_tokens - estimate_tokens(marker))
+    used = 0.0
+    end = 0
+    for end, char in enumerate(text):
+        used += CJK_TOKENS_PER_CHAR if _CJK_RE.match(char) else OTHER_TOKENS_PER_CHAR
+        if used > budget:
+            break
+    return text[:end] + marker
+
+
+def trim_messages(messages: List[Dict[str, str]], max_input_tokens: int) -> List[Dict[str, str]]:
+    """
+    把消息列表裁剪到输入预算以内，不修改原列表
+
+    系统消息和最后一条消息始终保留；先从最早的对话历史开始丢弃，
+    仍然超出时再截断最后一条用户消息。系统消息从不截断，其中的输出格式要求是各 agent 解析结果的前提。
+    """
+    if estimate_messages_tokens(messages) <= max_input_tokens:
+        return messages
+
+    kept = list(messages)
+    # 可丢弃的是除最后一条以外的非系统消息，从最早的开始
+    droppable = [i for i, msg in enumerate(kept[:-1]) if msg.get("role") != "system"]
+    dropped = set()
+    total = estimate_messages_tokens(kept)
+    for index in droppable:
+        if total <= max_input_tokens:
+            break
+        dropped.add(index)
+        total -= estimate_tokens(_content(kept[index])) + MESSAGE_OVERHEAD_TOKENS
+    kept = [msg for i, msg in enumerate(kept) if i not in dropped]
+
+    candidates = [i for i, msg in enumerate(kept) if msg.get("role") != "system"]
+    if total > max_input_tokens and candidates:
+        users = [i for i in candidates if kept[i].get("role") == "user"]
+        target = users[-1] if users else max(candidates, key=lambda i: estimate_tokens(_content(kept[i])))
+        content = _content(kept[target])
+        allowed = estimate_tokens(content) - (total - max_input_tokens)
+        kept[target] = {**kept[target], "content": truncate_text(content, max(allowed, 0))}
+    return kept
+
+
+def get_agent_budget(agent: Optional[str]) -> AgentBudget:
+    settings = get_settings()
+    return AGENT_BUDGETS.get(agent or "", AgentBudget(
+        max_input_tokens=settings.LLM_DEFAULT_INPUT_BUDGET,
+        max_tokens=settings.LLM_DEFAULT_MAX_TOKENS,
+    ))
+
+
+_stats: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+
+def record_budget_usage(agent: Optional[str], before: int, after: int) -> None:
+    stats = _stats[agent or "default"]
+    stats["requests"] += 1
+    stats["input_tokens"] += after
+    if after < before:
+        stats["trimmed"] += 1
+        stats["tokens_saved"] += before - after
+
+
+def get_budget_stats() -> Dict[str, Dict[str, int]]:
+    """按 agent 统计的请求数、被裁剪次数和节省的估算 tokens"""
+    return {agent: dict(stats) for agent, stats in _stats.items()}
+
+
+def apply_budget(
+    agent: Optional[str],
+    messages: List[Dict[str, str]],
+    max_tokens: Optional[int]
+) -> Tuple[List[Dict[str, str]], Optional[int]]:
+    """按 agent 预算裁剪消息，并在调用方未指定时补上 max_tokens"""
+    budget = get_agent_budget(agent)
+    before = estimate_messages_tokens(messages)
+    trimmed = trim_messages(messages, budget.max_input_tokens)
+    after = estimate_messages_tokens(trimmed) if trimmed is not messages else before
+    if after < before:
+        logger.info(f"{agent or 'default'} 的提示词超出预算，估算 tokens {before} -> {after}")
+    record_budget_usage(agent, before, after)
+    return trimmed, max_tokens if max_tokens is not None else budget.max_tokens
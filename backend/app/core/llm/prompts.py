@@ -0,0 +1,119 @@
+"""
+提示词模板注册表和上游前缀缓存统计
+
+DeepSeek 等提供商会缓存请求开头与之前请求逐字节相同的部分（前缀），命中的 token
+计费更低、首 token 更快。因此各 agent 的系统提示词统一在模块加载时注册为不可变模板，
+每次调用都原样放在消息最前面，变化的内容只放在后面的 user 消息里；
+注册时顺带预编码成 JSON，发请求时直接拼接。
+模板按 名称 + 版本 注册，内容改动必须提升版本号，便于按版本对比缓存命中率。
+"""
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Tuple
+import hashlib
+import logging
+
+from app.core.llm.codec import register_static_message
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class PromptTemplate:
+    name: str
+    version: str
+    system: str
+    fingerprint: str = field(init=False)
+
+    def __post_init__(self):
+        digest = hashlib.sha256(self.system.encode("utf-8")).hexdigest()[:12]
+        object.__setattr__(self, "fingerprint", digest)
+
+
+class PromptRegistry:
+    def __init__(self):
+        self._templates: Dict[Tuple[str, str], PromptTemplate] = {}
+        self._latest: Dict[str, PromptTemplate] = {}
+
+    def register(self, name: str, version: str, system: str) -> PromptTemplate:
+        key = (name, version)
+        existing = self._templates.get(key)
+        if existing is not None:
+            if existing.system != system:
+                raise ValueError(f"提示词 {name}@{version} 的内容已变化，请提升版本号")
+            return existing
+        template = PromptTemplate(name, version, system)
+        register_static_message(system)
+        self._templates[key] = template
+        self._latest[name] = template
+        return template
+
+    def get(self, name: str, version: Optional[str] = None) -> PromptTemplate:
+        template = self._latest.get(name) if version is None else self._templates.get((name, version))
+        if template is None:
+            raise KeyError(f"未注册的提示词: {name}@{version or 'latest'}")
+        return template
+
+    def versions(self) -> Dict[str, Dict[str, str]]:
+        """各模板当前使用的版本和内容指纹"""
+        return {
+            name: {"version": t.version, "fingerprint": t.fingerprint}
+            for name, t in self._latest.items()
+        }
+
+
+PROMPTS = PromptRegistry()
+
+
+def register_prompt(name: str, version: str, system: str) -> PromptTemplate:
+    return PROMPTS.register(name, version, system)
+
+
+def get_prompt(name: str, version: Optional[str] = None) -> PromptTemplate:
+    return PROMPTS.get(name, version)
+
+
+def parse_prompt_cache_usage(usage: Optional[Dict[str, Any]]) -> Optional[Tuple[int, int]]:
+    """
+    从 usage 中取出 (prompt_tokens, 命中缓存的 tokens)
+
+    兼容 DeepSeek 的 prompt_cache_hit_tokens / prompt_cache_miss_tokens
+    和 OpenAI 的 prompt_tokens_details.cached_tokens；提供商没有返回缓存字段时返回 None
+    """
+    if not usage:
+        return None
+    cached = usage.get("prompt_cache_hit_tokens")
+    if cached is None:
+        cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+    if cached is None:
+        return None
+    prompt_tokens = usage.get("prompt_tokens")
+    if prompt_tokens is None:
+        prompt_tokens = cached + (usage.get("prompt_cache_miss_tokens") or 0)
+    return int(prompt_tokens), int(cached)
+
+
+_stats: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+
+def record_prompt_cache(agent: Optional[str], usage: Optional[Dict[str, Any]]) -> Optional[Tuple[int, int]]:
+    """记录一次响应的前缀缓存命中情况，返回解析出的 (prompt_tokens, cached_tokens)"""
+    parsed = parse_prompt_cache_usage(usage)
+    if parsed is None:
+        return None
+    prompt_tokens, cached = parsed
+    stats = _stats[agent or "default"]
+    stats["responses"] += 1
+    stats["prompt_tokens"] += prompt_tokens
+    stats["cached_tokens"] += cached
+    return parsed
+
+
+def get_prompt_cache_stats() -> Dict[str, Dict[str, float]]:
+    """按 agent 统计的前缀缓存命中 tokens 和命中率"""
+    result = {}
+    for agent, stats in _stats.items():
+        data: Dict[str, float] = dict(stats)
+        data["hit_ratio"] = stats["cached_tokens"] / stats["prompt_tokens"] if stats["prompt_tokens"] else 0.0
+        result[agent] = data
+    return result
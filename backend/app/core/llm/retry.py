@@ -0,0 +1,145 @@
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, Optional
+import asyncio
+import logging
+import random
+import time
+
+from app.core.config import get_settings
+from app.core.metrics import LLM_RETRIES
+
+logger = logging.getLogger(__name__)
+
+# 这些状态码说明请求没有被上游正常处理，重试是安全的
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+# 没有状态码的网络类错误（连接失败、超时）同样可以重试
+RETRYABLE_ERROR_TYPES = {"request_error"}
+
+
+@dataclass
+class RetryPolicy:
+    """指数退避 + 全抖动的重试策略，总耗时受 max_elapsed 限制"""
+    max_attempts: int = 3
+    base_delay: float = 0.5
+    max_delay: float = 8.0
+    max_elapsed: float = 30.0
+
+    @classmethod
+    def from_settings(cls) -> "RetryPolicy":
+        settings = get_settings()
+        return cls(
+            max_attempts=settings.LLM_RETRY_MAX_ATTEMPTS,
+            base_delay=settings.LLM_RETRY_BASE_DELAY,
+            max_delay=settings.LLM_RETRY_MAX_DELAY,
+            max_elapsed=settings.LLM_RETRY_MAX_ELAPSED,
+        )
+
+    def backoff(self, attempt: int) -> float:
+        """第 attempt 次失败后的等待时间（attempt 从 1 开始）"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+
+    def is_retryable(self, response: Any) -> bool:
+        if not isinstance(response, dict) or "error" not in response:
+            return False
+        error = response["error"]
+        if not isinstance(error, dict):
+            return False
+        status_code = error.get("status_code")
+        if status_code is not None:
+            return status_code in RETRYABLE_STATUS_CODES
+        return error.get("type") in RETRYABLE_ERROR_TYPES
+
+    def next_delay(self, attempt: int, response: Dict[str, Any], deadline: float) -> Optional[float]:
+        """返回下次重试前的等待时间；None 表示不再重试"""
+        if attempt >= self.max_attempts or not self.is_retryable(response):
+            return None
+        delay = self.backoff(attempt)
+        retry_after = response["error"].get("retry_after")
+        if retry_after is not None:
+            try:
+                delay = max(delay, float(retry_after))
+            except (TypeError, ValueError):
+                pass
+        if time.monotonic() + delay >= deadline:
+            return None
+        return delay
+
+
+_stats: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+
+def record_retry_event(provider: str, event: str) -> None:
+    _stats[provider][event] += 1
+    LLM_RETRIES.labels(provider, event).inc()
+
+
+def get_retry_stats() -> Dict[str, Dict[str, int]]:
+    """按提供商统计的重试次数和最终结果"""
+    return {provider: dict(events) for provider, events in _stats.items()}
+
+
+async def complete_with_retry(
+    policy: RetryPolicy,
+    provider: str,
+    attempt_fn: Callable[[], Awaitable[Dict[str, Any]]]
+) -> Dict[str, Any]:
+    """执行非流式请求，失败时按策略重试"""
+    deadline = time.monotonic() + policy.max_elapsed
+    attempt = 0
+    while True:
+        attempt += 1
+        response = await attempt_fn()
+        if not (isinstance(response, dict) and "error" in response):
+            record_retry_event(provider, "success" if attempt == 1 else "success_after_retry")
+            return response
+        delay = policy.next_delay(attempt, response, deadline)
+        if delay is None:
+            record_retry_event(provider, "failure" if attempt == 1 else "exhausted")
+            return response
+        record_retry_event(provider, "retry")
+        logger.warning(f"{provider} 第 {attempt} 次请求失败，{delay:.2f} 秒后重试: {response['error'].get('message')}")
+        await asyncio.sleep(delay)
+
+
+async def stream_with_retry(
+    policy: RetryPolicy,
+    provider: str,
+    open_fn: Callable[[], AsyncGenerator[Dict[str, Any], None]]
+) -> AsyncGenerator[Dict[str, Any], None]:
+    """执行流式请求；只有在尚未向调用方输出任何内容时才重试"""
+    deadline = time.monotonic() + policy.max_elapsed
+    attempt = 0
+    while True:
+        attempt += 1
+        delivered = False
+        failed_mid_stream = False
+        failed: Optional[Dict[str, Any]] = None
+        stream = open_fn()
+        try:
+            async for chunk in stream:
+                if isinstance(chunk, dict) and "error" in chunk:
+                    if not delivered:
+                        failed = chunk
+                        break
+                    # 已经输出过内容，不能再重试，错误原样交给调用方
+                    record_retry_event(provider, "failure_mid_stream")
+                    failed_mid_stream = True
+                delivered = True
+                yield chunk
+        finally:
+            await stream.aclose()
+
+        if failed_mid_stream:
+            return
+        if failed is None:
+            record_retry_event(provider, "success" if attempt == 1 else "success_after_retry")
+            return
+        delay = policy.next_delay(attempt, failed, deadline)
+        if delay is None:
+            record_retry_event(provider, "failure" if attempt == 1 else "exhausted")
+            yield failed
+            return
+        record_retry_event(provider, "retry")
+        logger.warning(f"{provider} 第 {attempt} 次流式请求失败，{delay:.2f} 秒后重试: {failed['error'].get('message')}")
+        await asyncio.sleep(delay)
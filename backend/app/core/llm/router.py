@@ -0,0 +1,264 @@
+from typing import Any, AsyncGenerator, Dict, List, Optional
+import logging
+import time
+
+from app.core.config import get_settings
+from app.core.llm.base import BaseLLMClient, LLMClientFactory, LLMProvider
+from app.core.llm.retry import RetryPolicy
+
+logger = logging.getLogger(__name__)
+
+# 这些错误说明提供商本身出了问题，可以换一个提供商再试；其余错误（如 400）换了也一样
+FAILOVER_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+FAILOVER_ERROR_TYPES = {"request_error"}
+
+
+def _is_error(response: Any) -> bool:
+    return isinstance(response, dict) and "error" in response
+
+
+def _should_failover(response: Dict[str, Any]) -> bool:
+    error = response.get("error")
+    if not isinstance(error, dict):
+        return True
+    status_code = error.get("status_code")
+    if status_code is not None:
+        return status_code in FAILOVER_STATUS_CODES
+    return error.get("type") in FAILOVER_ERROR_TYPES
+
+
+def parse_agent_providers(value: str) -> Dict[str, LLMProvider]:
+    """解析 "intent:deepseek,course_recommendation:wc_llm" 形式的配置"""
+    preferences: Dict[str, LLMProvider] = {}
+    for item in value.split(","):
+        if ":" not in item:
+            continue
+        agent, provider = item.split(":", 1)
+        preferences[agent.strip()] = LLMProvider(provider.strip().lower())
+    return preferences
+
+
+def parse_router_providers(value: str) -> List[LLMProvider]:
+    providers = [LLMProvider(name.strip().lower()) for name in value.split(",") if name.strip()]
+    if LLMProvider.ROUTER in providers:
+        raise ValueError("LLM_ROUTER_PROVIDERS 不能包含 router")
+    return providers
+
+
+class ProviderHealth:
+    """单个提供商的健康状况：EWMA 延迟、EWMA 错误率、进行中的请求数和熔断冷却"""
+    def __init__(self, provider: LLMProvider, alpha: float = 0.3, initial_latency: float = 1.0):
+        self.provider = provider
+        self.alpha = alpha
+        self.latency = initial_latency
+        self.error_rate = 0.0
+        self.in_flight = 0
+        self.consecutive_failures = 0
+        self.cooldown_until = 0.0
+        self.requests = 0
+        self.failures = 0
+
+    def begin(self) -> float:
+        self.in_flight += 1
+        self.requests += 1
+        return time.monotonic()
+
+    def first_chunk(self, started: float) -> None:
+        """流式请求收到首个数据块：记一次成功的延迟样本（TTFT），请求仍在进行，不释放 in_flight"""
+        self.latency += self.alpha * (time.monotonic() - started - self.latency)
+        self.error_rate *= 1 - self.alpha
+        self.consecutive_failures = 0
+
+    def success(self, started: float) -> None:
+        self.in_flight -= 1
+        self.first_chunk(started)
+
+    def failure(self, started: float, threshold: int, cooldown: float) -> None:
+        self.in_flight -= 1
+        self.failures += 1
+        # 失败的耗时同样计入延迟，超时类故障会让延迟估计迅速变差
+        self.latency += self.alpha * (time.monotonic() - started - self.latency)
+        self.error_rate += self.alpha * (1 - self.error_rate)
+        self.consecutive_failures += 1
+        if self.consecutive_failures >= threshold:
+            self.cooldown_until = time.monotonic() + cooldown
+            logger.warning(f"{self.provider.value} 连续失败 {self.consecutive_failures} 次，冷却 {cooldown} 秒")
+
+    def release(self) -> None:
+        """请求结束但不计入成功或失败（被取消、流读完或提前关闭）"""
+        self.in_flight -= 1
+
+    @property
+    def degraded(self) -> bool:
+        return time.monotonic() < self.cooldown_until
+
+    def score(self) -> float:
+        """分数越低越优先：延迟随负载线性放大，错误率越高惩罚越重"""
+        return self.latency * (1 + self.in_flight) * (1 + 4 * self.error_rate)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "latency_ewma": self.latency,
+            "error_rate_ewma": self.error_rate,
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "failures": self.failures,
+            "degraded": self.degraded,
+            "score": self.score(),
+        }
+
+
+class RoutingLLMClient(BaseLLMClient):
+    """在多个提供商之间按延迟、错误率和负载选择，失败时自动切换到下一个提供商"""
+    provider = LLMProvider.ROUTER
+    model = "router"
+
+    def __init__(
+        self,
+        providers: List[LLMProvider],
+        preferred: Optional[LLMProvider] = None,
+        health: Optional[Dict[LLMProvider, ProviderHealth]] = None,
+        clients: Optional[Dict[LLMProvider, BaseLLMClient]] = None
+    ):
+        if not providers:
+            raise ValueError("RoutingLLMClient 至少需要一个提供商")
+        settings = get_settings()
+        self.providers = providers
+        self.preferred = preferred
+        self.failure_threshold = settings.LLM_ROUTER_FAILURE_THRESHOLD
+        self.cooldown = settings.LLM_ROUTER_COOLDOWN
+        self.preference_weight = settings.LLM_ROUTER_PREFERENCE_WEIGHT
+        self.health = health if health is not None else {
+            provider: ProviderHealth(provider, alpha=settings.LLM_ROUTER_EWMA_ALPHA) for provider in providers
+        }
+        self._clients = clients if clients is not None else {}
+
+    def for_agent(self, preferred: Optional[LLMProvider]) -> "RoutingLLMClient":
+        """返回共享健康状态、但优先使用指定提供商的路由客户端"""
+        if preferred is not None and preferred not in self.providers:
+            logger.warning(f"偏好的提供商 {preferred.value} 不在路由列表中，忽略")
+            preferred = None
+        return RoutingLLMClient(self.providers, preferred, self.health, self._clients)
+
+    def client_for(self, provider: LLMProvider) -> BaseLLMClient:
+        """
+        路由专用的客户端实例，不在单个提供商内重试
+
+        失败后直接切换到下一个提供商，而不是先等内层客户端用完整个重试预算（LLM_RETRY_MAX_ELAPSED）；
+        连接池和限流器仍与直接使用该提供商的客户端共享
+        """
+        client = self._clients.get(provider)
+        if client is None:
+            client = LLMClientFactory.create_client(provider)
+            client.retry_policy = RetryPolicy(max_attempts=1)
+            self._clients[provider] = client
+        return client
+
+    def candidates(self) -> List[LLMProvider]:
+        """按本次请求的尝试顺序排列提供商，冷却中的提供商排在最后作为兜底"""
+        def key(provider: LLMProvider):
+            health = self.health[provider]
+            score = health.score()
+            if provider == self.preferred:
+                score *= self.preference_weight
+            return (health.degraded, score)
+        return sorted(self.providers, key=key)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {provider.value: health.stats() for provider, health in self.health.items()}
+
+    async def create_chat_completion(
+        self,
+        messages: List[Dict[str, Any]],
+        stream: bool = False,
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        top_p: float = 1.0,
+        frequency_penalty: float = 0.0,
+        presence_penalty: float = 0.0
+    ) -> Dict[str, Any]:
+        response: Dict[str, Any] = {}
+        for provider in self.candidates():
+            health = self.health[provider]
+            started = health.begin()
+            try:
+                response = await self.client_for(provider).create_chat_completion(
+                    messages=messages,
+                    stream=stream,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    top_p=top_p,
+                    frequency_penalty=frequency_penalty,
+                    presence_penalty=presence_penalty
+                )
+            except BaseException:
+                health.release()
+                raise
+            if isinstance(response, dict):
+                # 标注实际处理请求的提供商，调用方按它记录指标
+                response["provider"] = provider.value
+            if not _is_error(response):
+                health.success(started)
+                return response
+            if not _should_failover(response):
+                # 请求本身有问题，不算提供商故障
+                health.success(started)
+                return response
+            health.failure(started, self.failure_threshold, self.cooldown)
+            logger.warning(f"{provider.value} 请求失败，尝试下一个提供商: {response['error'].get('message')}")
+        return response
+
+    async def create_chat_completion_stream(
+        self,
+        messages: List[Dict[str, Any]],
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        top_p: float = 1.0,
+        frequency_penalty: float = 0.0,
+        presence_penalty: float = 0.0
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """只在还没有输出任何数据块时切换提供商，之后的错误原样交给调用方"""
+        last_error: Optional[Dict[str, Any]] = None
+        for provider in self.candidates():
+            health = self.health[provider]
+            started = health.begin()
+            settled = False
+            failed: Optional[Dict[str, Any]] = None
+            stream = self.client_for(provider).create_chat_completion_stream(
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                top_p=top_p,
+                frequency_penalty=frequency_penalty,
+                presence_penalty=presence_penalty
+            )
+            try:
+                async for chunk in stream:
+                    if isinstance(chunk, dict):
+                        chunk["provider"] = provider.value
+                    if not settled:
+                        if _is_error(chunk) and _should_failover(chunk):
+                            failed = chunk
+                            break
+                        # 首个数据块的耗时（TTFT）作为该提供商的延迟样本
+                        health.first_chunk(started)
+                        settled = True
+                    yield chunk
+            finally:
+                await stream.aclose()
+                if failed is None:
+                    # 流结束、调用方提前关闭或上游没有输出任何内容：直到此时才释放 in_flight，
+                    # 负载分数才能反映正在输出的流
+                    health.release()
+
+            if failed is None:
+                return
+            health.failure(started, self.failure_threshold, self.cooldown)
+            last_error = failed
+            logger.warning(f"{provider.value} 流式请求失败，尝试下一个提供商: {failed['error'].get('message')}")
+        if last_error is not None:
+            yield last_error
+
+
+def build_router_client() -> RoutingLLMClient:
+    return RoutingLLMClient(parse_router_providers(get_settings().LLM_ROUTER_PROVIDERS))
@@ -1,26 +1,193 @@
-from typing import AsyncGenerator, Dict, List, Optional, Union, Any
-from app.core.llm.base import BaseLLMClient, LLMClientFactory, LLMProvider, ChatMessage, MessageRole
+from typing import AsyncGenerator, Awaitable, Dict, Iterable, List, Optional, Tuple, Union, Any
+from dataclasses import dataclass
+from app.core.llm.base import BaseLLMClient, LLMClientFactory, LLMProvider
+from app.core.llm.codec import dumps
+from app.core.llm.cache import get_response_cache, make_cache_key
+from app.core.llm.singleflight import get_single_flight, get_stream_fanout
+from app.core.llm.retry import get_retry_stats
+from app.core.llm.prompt_budget import apply_budget, get_budget_stats
+from app.core.llm.prompts import get_prompt_cache_stats, record_prompt_cache
+from app.core.llm.router import RoutingLLMClient, parse_agent_providers
+from app.core.llm.hedging import get_hedge_policy, get_hedge_stats, hedged_completion, hedged_stream
 from app.core.config import get_settings
+from app.core.metrics import (
+    LLM_ERRORS, LLM_PROMPT_CACHED_TOKENS, LLM_PROMPT_TOKENS, LLM_REQUEST_DURATION, LLM_TOKENS_PER_SECOND, LLM_TTFT
+)
+import asyncio
 import httpx
 import json
 import logging
+import random
+import time
 
 logger = logging.getLogger(__name__)
 
+
+@dataclass
+class BatchResult:
+    """批量补全中单个请求的结果；失败时 response 为 {"error": {...}}"""
+    index: int
+    response: Dict[str, Any]
+
+    @property
+    def ok(self) -> bool:
+        return "error" not in self.response
+
+
+class _CallMetrics:
+    """一组 (provider, agent) 预先绑定的指标子项"""
+    __slots__ = ("labels", "ttft", "completion_duration", "stream_duration", "tokens_per_second",
+                 "prompt_tokens", "prompt_cached_tokens")
+
+    def __init__(self, provider: str, agent: str):
+        self.labels = (provider, agent)
+        self.ttft = LLM_TTFT.labels(provider, agent)
+        self.completion_duration = LLM_REQUEST_DURATION.labels(provider, agent, "completion")
+        self.stream_duration = LLM_REQUEST_DURATION.labels(provider, agent, "stream")
+        self.tokens_per_second = LLM_TOKENS_PER_SECOND.labels(provider, agent)
+        self.prompt_tokens = LLM_PROMPT_TOKENS.labels(provider, agent)
+        self.prompt_cached_tokens = LLM_PROMPT_CACHED_TOKENS.labels(provider, agent)
+
+    def record_error(self, response: Dict[str, Any]) -> None:
+        error = response.get("error")
+        error_type = error.get("type", "unknown") if isinstance(error, dict) else "unknown"
+        LLM_ERRORS.labels(*self.labels, error_type).inc()
+
+
+def served_by(response: Any, default: str) -> str:
+    """实际处理请求的提供商：路由客户端会在响应（或流式数据块）上标注 provider，单一提供商时用配置的 default"""
+    if isinstance(response, dict):
+        return response.get("provider") or default
+    return default
+
+
 class LLMService:
-    def __init__(self):
+    def __init__(self, provider: Optional[LLMProvider] = None, agent: Optional[str] = None):
+        """
+        provider: 使用的提供商，默认取 LLM_PROVIDER
+        agent: 默认的调用方名称；每次调用可以用 agent= 覆盖，或用 for_agent() 绑定。
+               预算、指标标签和路由模式下 LLM_AGENT_PROVIDERS 的偏好提供商都按 agent 区分
+        """
         self.settings = get_settings()
-        self._client: Optional[BaseLLMClient] = None
+        self.provider = (provider or LLMProvider(self.settings.LLM_PROVIDER.lower())).value
+        self.agent = agent
+        # 路由模式下每个 agent 的尝试顺序不同，客户端按 agent 缓存；健康状态仍在路由客户端之间共享
+        self._clients: Dict[Optional[str], BaseLLMClient] = {}
+        self._hedge_client: Optional[BaseLLMClient] = None
+        # 指标按实际处理请求的提供商打标签（路由模式下不是 "router"），每组标签只绑定一次
+        self._metrics: Dict[Tuple[str, str], _CallMetrics] = {}
+
+    def for_agent(self, agent: str) -> "AgentLLMService":
+        """返回绑定了 agent 的视图，调用时自动带上 agent=，其余属性和状态与本服务共享"""
+        return AgentLLMService(self, agent)
+
+    def _metrics_for(self, provider: str, agent: Optional[str]) -> _CallMetrics:
+        key = (provider, agent or "default")
+        metrics = self._metrics.get(key)
+        if metrics is None:
+            metrics = self._metrics[key] = _CallMetrics(*key)
+        return metrics
+
+    def client_for(self, agent: Optional[str]) -> BaseLLMClient:
+        client = self._clients.get(agent)
+        if client is None:
+            client = LLMClientFactory.get_client(LLMProvider(self.provider))
+            if isinstance(client, RoutingLLMClient) and agent:
+                preferred = parse_agent_providers(self.settings.LLM_AGENT_PROVIDERS).get(agent)
+                client = client.for_agent(preferred)
+            self._clients[agent] = client
+        return client
 
     @property
     def client(self) -> BaseLLMClient:
-        if self._client is None:
-            provider = LLMProvider(self.settings.LLM_PROVIDER.lower())
-            self._client = LLMClientFactory.get_client(provider)
-        return self._client
+        return self.client_for(self.agent)
+
+    def hedge_client_for(self, agent: Optional[str]) -> BaseLLMClient:
+        """对冲请求使用的客户端，未配置 LLM_HEDGE_PROVIDER 时与主客户端相同"""
+        if not self.settings.LLM_HEDGE_PROVIDER:
+            return self.client_for(agent)
+        if self._hedge_client is None:
+            provider = LLMProvider(self.settings.LLM_HEDGE_PROVIDER.lower())
+            self._hedge_client = LLMClientFactory.get_client(provider)
+        return self._hedge_client
+
+    @property
+    def hedge_client(self) -> BaseLLMClient:
+        return self.hedge_client_for(self.agent)
+
+    def _should_hedge(self, hedge: Optional[bool]) -> bool:
+        return self.settings.LLM_HEDGE_ENABLED if hedge is None else hedge
+
+    def _apply_budget(
+        self,
+        agent: Optional[str],
+        messages: List[Dict[str, str]],
+        max_tokens: Optional[int]
+    ) -> Tuple[List[Dict[str, str]], Optional[int]]:
+        """把消息裁剪到 agent 的输入预算内，并补上默认的 max_tokens"""
+        if not self.settings.LLM_PROMPT_BUDGET_ENABLED:
+            return messages, max_tokens
+        return apply_budget(agent, messages, max_tokens)
+
+    def _record_usage(self, agent: Optional[str], metrics: _CallMetrics, usage: Optional[Dict[str, Any]]) -> None:
+        """记录上游前缀缓存命中的 tokens（提供商没有返回缓存字段时跳过）"""
+        parsed = record_prompt_cache(agent, usage)
+        if parsed is not None:
+            metrics.prompt_tokens.inc(parsed[0])
+            metrics.prompt_cached_tokens.inc(parsed[1])
 
-    def _convert_messages(self, messages: List[Dict[str, str]]) -> List[ChatMessage]:
-        return [ChatMessage(role=MessageRole(msg["role"]), content=msg["content"]) for msg in messages]
+    def _should_cache(self, cache: Optional[bool], temperature: float) -> bool:
+        """调用方显式指定优先，否则只缓存低温度（结果近似确定）的请求"""
+        if not self.settings.LLM_CACHE_ENABLED:
+            return False
+        if cache is not None:
+            return cache
+        return temperature <= self.settings.LLM_CACHE_TEMPERATURE_THRESHOLD
+
+    def _request_key(
+        self,
+        client: BaseLLMClient,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: Optional[int],
+        top_p: float,
+        frequency_penalty: float,
+        presence_penalty: float
+    ) -> str:
+        return make_cache_key(
+            self.provider,
+            getattr(client, "model", ""),
+            messages,
+            temperature,
+            top_p,
+            max_tokens,
+            frequency_penalty,
+            presence_penalty
+        )
+
+    def _log_request(
+        self,
+        agent: Optional[str],
+        kind: str,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: Optional[int]
+    ) -> None:
+        """按 LLM_REQUEST_LOG_SAMPLE_RATE 抽样记录一行请求摘要，完整请求体只在 DEBUG 级别输出"""
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(f"llm_request_body kind={kind} agent={agent} body={dumps(messages).decode('utf-8')}")
+        rate = self.settings.LLM_REQUEST_LOG_SAMPLE_RATE
+        if rate <= 0 or (rate < 1 and random.random() >= rate):
+            return
+        fields = {
+            "agent": agent or "default",
+            "kind": kind,
+            "messages": len(messages),
+            "prompt_chars": sum(len(msg.get("content") or "") for msg in messages),
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+        }
+        logger.info("llm_request " + " ".join(f"{k}={v}" for k, v in fields.items()), extra={"llm_request": fields})
 
     async def create_chat_completion(
         self,
@@ -30,34 +197,172 @@ class LLMService:
         max_tokens: Optional[int] = None,
         top_p: float = 1.0,
         frequency_penalty: float = 0.0,
-        presence_penalty: float = 0.0
+        presence_penalty: float = 0.0,
+        cache: Optional[bool] = None,
+        coalesce: bool = True,
+        hedge: Optional[bool] = None,
+        agent: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         统一的聊天完成接口
+
+        cache: 是否使用响应缓存，None 表示按温度阈值自动决定
+        coalesce: 是否与并发中的相同请求合并为一次上游调用
+        hedge: 响应超过对冲延迟时是否再发一个请求，None 表示使用 LLM_HEDGE_ENABLED
+        agent: 调用方名称，默认使用构造时的 agent
         """
         if stream:
             raise ValueError("For streaming responses, use create_chat_completion_stream instead")
         
-        request_body = {
-            "messages": messages,
-            "stream": False,
-            "temperature": temperature,
-            "max_tokens": max_tokens,
-            "top_p": top_p,
-            "frequency_penalty": frequency_penalty,
-            "presence_penalty": presence_penalty
+        agent = agent or self.agent
+        client = self.client_for(agent)
+        messages, max_tokens = self._apply_budget(agent, messages, max_tokens)
+        self._log_request(agent, "completion", messages, temperature, max_tokens)
+
+        use_cache = self._should_cache(cache, temperature)
+        request_key = None
+        if use_cache or coalesce:
+            request_key = self._request_key(
+                client, messages, temperature, max_tokens, top_p, frequency_penalty, presence_penalty
+            )
+
+        if use_cache:
+            cached = await get_response_cache().get(request_key)
+            if cached is not None:
+                logger.info("LLM 响应缓存命中")
+                return cached
+
+        def call_client(client: BaseLLMClient):
+            return client.create_chat_completion(
+                messages=messages,
+                stream=False,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                top_p=top_p,
+                frequency_penalty=frequency_penalty,
+                presence_penalty=presence_penalty
+            )
+
+        use_hedge = self._should_hedge(hedge)
+
+        async def call_upstream() -> Dict[str, Any]:
+            started = time.perf_counter()
+            if use_hedge:
+                response = await hedged_completion(
+                    get_hedge_policy(self.provider, "completion"),
+                    lambda: call_client(client),
+                    lambda: call_client(self.hedge_client_for(agent))
+                )
+            else:
+                response = await call_client(client)
+            elapsed = time.perf_counter() - started
+            metrics = self._metrics_for(served_by(response, self.provider), agent)
+            if isinstance(response, dict) and "error" in response:
+                metrics.record_error(response)
+                return response
+            metrics.completion_duration.observe(elapsed)
+            usage = response.get("usage") or {}
+            self._record_usage(agent, metrics, usage)
+            completion_tokens = usage.get("completion_tokens")
+            if completion_tokens and elapsed > 0:
+                metrics.tokens_per_second.observe(completion_tokens / elapsed)
+            # 只缓存成功的响应
+            if use_cache:
+                await get_response_cache().set(request_key, response)
+            return response
+
+        if coalesce:
+            return await get_single_flight().do(request_key, call_upstream)
+        return await call_upstream()
+
+    async def create_chat_completions_batch(
+        self,
+        requests: Iterable[Dict[str, Any]],
+        concurrency: Optional[int] = None,
+        ordered: bool = False,
+        agent: Optional[str] = None
+    ) -> AsyncGenerator[BatchResult, None]:
+        """
+        并发执行一批聊天补全，每个请求是 create_chat_completion 的关键字参数
+
+        concurrency: 同时在途的请求数，默认 LLM_BATCH_CONCURRENCY；实际并发仍受提供商限流器约束
+        ordered: False 时按完成顺序产出结果（用 BatchResult.index 对应输入），True 时按输入顺序产出
+        agent: 请求里没有指定 agent 时使用的调用方名称
+        单个请求的异常会被转换成错误响应，不会中断整个批次
+        """
+        requests = list(requests)
+        if not requests:
+            return
+        limit = max(1, min(concurrency or self.settings.LLM_BATCH_CONCURRENCY, len(requests)))
+        pending = iter(enumerate(requests))
+        results: asyncio.Queue = asyncio.Queue()
+
+        async def worker() -> None:
+            # 所有 worker 共享同一个迭代器，某个请求慢时其他 worker 继续取下一个
+            for index, kwargs in pending:
+                if agent is not None:
+                    kwargs = {"agent": agent, **kwargs}
+                try:
+                    response = await self.create_chat_completion(**kwargs)
+                except Exception as e:
+                    logger.error(f"批量补全第 {index} 个请求失败: {e}")
+                    response = {"error": {"message": str(e), "type": type(e).__name__}}
+                results.put_nowait(BatchResult(index, response))
+
+        workers = [asyncio.ensure_future(worker()) for _ in range(limit)]
+        try:
+            buffered: Dict[int, BatchResult] = {}
+            next_index = 0
+            for _ in range(len(requests)):
+                result = await results.get()
+                if not ordered:
+                    yield result
+                    continue
+                buffered[result.index] = result
+                while next_index in buffered:
+                    yield buffered.pop(next_index)
+                    next_index += 1
+        finally:
+            # 调用方提前停止迭代时取消剩余请求
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+
+    def cache_stats(self) -> Dict[str, int]:
+        """响应缓存的命中、未命中和淘汰计数"""
+        return get_response_cache().stats()
+
+    def limiter_stats(self) -> Dict[str, float]:
+        """当前提供商限流器的并发上限、排队等待时间等指标"""
+        limiter = getattr(self.client, "limiter", None)
+        return limiter.stats() if limiter is not None else {}
+
+    def retry_stats(self) -> Dict[str, Dict[str, int]]:
+        """各提供商的重试次数和最终结果"""
+        return get_retry_stats()
+
+    def budget_stats(self) -> Dict[str, Dict[str, int]]:
+        """各 agent 的提示词裁剪次数和节省的估算 tokens"""
+        return get_budget_stats()
+
+    def prompt_cache_stats(self) -> Dict[str, Dict[str, float]]:
+        """各 agent 命中上游前缀缓存的输入 tokens 和命中率"""
+        return get_prompt_cache_stats()
+
+    def routing_stats(self) -> Dict[str, Dict[str, Any]]:
+        """路由模式下各提供商的延迟、错误率和负载"""
+        return self.client.stats() if isinstance(self.client, RoutingLLMClient) else {}
+
+    def hedge_stats(self) -> Dict[str, Dict[str, float]]:
+        """对冲请求的次数、胜出次数和当前对冲延迟"""
+        return get_hedge_stats()
+
+    def coalescing_stats(self) -> Dict[str, Dict[str, int]]:
+        """请求合并的执行次数和被合并次数"""
+        return {
+            "completion": get_single_flight().stats(),
+            "stream": get_stream_fanout().stats()
         }
-        logger.info(f"Request body: {json.dumps(request_body, ensure_ascii=False, indent=2)}")
-            
-        return await self.client.create_chat_completion(
-            messages=self._convert_messages(messages),
-            stream=False,
-            temperature=temperature,
-            max_tokens=max_tokens,
-            top_p=top_p,
-            frequency_penalty=frequency_penalty,
-            presence_penalty=presence_penalty
-        )
 
     async def create_chat_completion_stream(
         self,
@@ -66,33 +371,153 @@ class LLMService:
         max_tokens: Optional[int] = None,
         top_p: float = 1.0,
         frequency_penalty: float = 0.0,
-        presence_penalty: float = 0.0
+        presence_penalty: float = 0.0,
+        coalesce: bool = True,
+        hedge: Optional[bool] = None,
+        agent: Optional[str] = None
     ) -> AsyncGenerator[Dict[str, Any], None]:
         """
         统一的流式聊天完成接口
+
+        coalesce: 并发中的相同流式请求共享一个上游流
+        hedge: 首个数据块超过对冲延迟仍未到达时是否再发一个流式请求
+        agent: 调用方名称，默认使用构造时的 agent
         """
-        request_body = {
-            "messages": messages,
-            "temperature": temperature,
-            "max_tokens": max_tokens,
-            "top_p": top_p,
-            "frequency_penalty": frequency_penalty,
-            "presence_penalty": presence_penalty
-        }
-        logger.info(f"Stream request body: {json.dumps(request_body, ensure_ascii=False, indent=2)}")
-        
-        async for chunk in await self.client.create_chat_completion_stream(
-            messages=self._convert_messages(messages),
+        agent = agent or self.agent
+        client = self.client_for(agent)
+        messages, max_tokens = self._apply_budget(agent, messages, max_tokens)
+        self._log_request(agent, "stream", messages, temperature, max_tokens)
+
+        def open_client(upstream: BaseLLMClient) -> AsyncGenerator[Dict[str, Any], None]:
+            return self._stream_upstream(
+                upstream, messages, temperature, max_tokens, top_p, frequency_penalty, presence_penalty
+            )
+
+        use_hedge = self._should_hedge(hedge)
+
+        def open_upstream() -> AsyncGenerator[Dict[str, Any], None]:
+            if use_hedge:
+                return self._observe_stream(agent, hedged_stream(
+                    get_hedge_policy(self.provider, "stream"),
+                    lambda: open_client(client),
+                    lambda: open_client(self.hedge_client_for(agent))
+                ))
+            return self._observe_stream(agent, open_client(client))
+
+        if coalesce:
+            request_key = self._request_key(
+                client, messages, temperature, max_tokens, top_p, frequency_penalty, presence_penalty
+            )
+            stream = get_stream_fanout().subscribe(request_key, open_upstream)
+        else:
+            stream = open_upstream()
+        # 调用方提前关闭时同步关闭内层流：退订合并的流，或直接关闭上游连接
+        try:
+            async for chunk in stream:
+                yield chunk
+        finally:
+            await stream.aclose()
+
+    async def _observe_stream(
+        self,
+        agent: Optional[str],
+        source: AsyncGenerator[Dict[str, Any], None]
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """记录上游流的首 token 时间、总耗时和输出速度（合并的订阅者不会重复计数）"""
+        started = time.perf_counter()
+        first_token_at: Optional[float] = None
+        content_chunks = 0
+        completion_tokens: Optional[int] = None
+        failed = False
+        metrics: Optional[_CallMetrics] = None
+        try:
+            async for chunk in source:
+                if isinstance(chunk, dict):
+                    if metrics is None:
+                        # 首个数据块标注了实际处理请求的提供商
+                        metrics = self._metrics_for(served_by(chunk, self.provider), agent)
+                    if "error" in chunk:
+                        failed = True
+                        metrics.record_error(chunk)
+                    else:
+                        choices = chunk.get("choices") or [{}]
+                        if (choices[0].get("delta") or {}).get("content"):
+                            content_chunks += 1
+                            if first_token_at is None:
+                                first_token_at = time.perf_counter()
+                                metrics.ttft.observe(first_token_at - started)
+                        usage = chunk.get("usage")
+                        if usage:
+                            self._record_usage(agent, metrics, usage)
+                            if usage.get("completion_tokens"):
+                                completion_tokens = usage["completion_tokens"]
+                yield chunk
+        finally:
+            await source.aclose()
+        if failed:
+            return
+        if metrics is None:
+            metrics = self._metrics_for(self.provider, agent)
+        finished = time.perf_counter()
+        metrics.stream_duration.observe(finished - started)
+        if first_token_at is not None and finished > first_token_at:
+            # 没有 usage 时按内容块数近似 token 数
+            tokens = completion_tokens or content_chunks
+            metrics.tokens_per_second.observe(tokens / (finished - first_token_at))
+
+    async def _stream_upstream(
+        self,
+        client: BaseLLMClient,
+        messages: List[Dict[str, str]],
+        temperature: float,
+        max_tokens: Optional[int],
+        top_p: float,
+        frequency_penalty: float,
+        presence_penalty: float
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        stream = client.create_chat_completion_stream(
+            messages=messages,
             temperature=temperature,
             max_tokens=max_tokens,
             top_p=top_p,
             frequency_penalty=frequency_penalty,
             presence_penalty=presence_penalty
-        ):
-            if isinstance(chunk, str):
-                try:
-                    yield json.loads(chunk)
-                except json.JSONDecodeError:
-                    yield {"choices": [{"delta": {"content": chunk}}]}
-            else:
-                yield chunk 
\ No newline at end of file
+        )
+        try:
+            async for chunk in stream:
+                if isinstance(chunk, str):
+                    try:
+                        yield json.loads(chunk)
+                    except json.JSONDecodeError:
+                        yield {"choices": [{"delta": {"content": chunk}}]}
+                else:
+                    yield chunk
+        finally:
+            await stream.aclose() 
+
+class AgentLLMService:
+    """绑定了调用方名称的 LLMService 视图，同一提供商的所有 agent 共享背后的 LLMService"""
+
+    def __init__(self, service: LLMService, agent: str):
+        self.service = service
+        self.agent = agent
+
+    @property
+    def client(self) -> BaseLLMClient:
+        return self.service.client_for(self.agent)
+
+    def create_chat_completion(self, *args, **kwargs) -> Awaitable[Dict[str, Any]]:
+        kwargs.setdefault("agent", self.agent)
+        return self.service.create_chat_completion(*args, **kwargs)
+
+    def create_chat_completion_stream(self, *args, **kwargs) -> AsyncGenerator[Dict[str, Any], None]:
+        kwargs.setdefault("agent", self.agent)
+        return self.service.create_chat_completion_stream(*args, **kwargs)
+
+    def create_chat_completions_batch(self, *args, **kwargs) -> AsyncGenerator[BatchResult, None]:
+        kwargs.setdefault("agent", self.agent)
+        return self.service.create_chat_completions_batch(*args, **kwargs)
+
+    def __getattr__(self, name: str) -> Any:
+        # 统计等其余接口直接转发
+        return getattr(self.service, name)
@@ -0,0 +1,146 @@
+from functools import lru_cache
+from typing import Any, AsyncGenerator, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Set
+import asyncio
+import copy
+import logging
+
+logger = logging.getLogger(__name__)
+
+_END = object()
+
+
+class _Call:
+    def __init__(self, task: "asyncio.Future[Any]"):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """合并并发的相同请求：同一时刻相同键只执行一次，其余调用等待同一个结果"""
+    def __init__(self):
+        self._calls: Dict[str, _Call] = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        call = self._calls.get(key)
+        leader = call is None
+        if leader:
+            call = _Call(asyncio.ensure_future(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, call))
+            self.executed += 1
+        else:
+            self.coalesced += 1
+
+        call.waiters += 1
+        try:
+            result = await asyncio.shield(call.task)
+        except asyncio.CancelledError:
+            # 最后一个等待者离开时取消上游调用
+            if call.waiters == 1 and not call.task.done():
+                call.task.cancel()
+            raise
+        finally:
+            call.waiters -= 1
+        # 跟随者拿到副本，避免多个调用方共享同一个可变对象
+        return result if leader else copy.deepcopy(result)
+
+    def _forget(self, key: str, call: _Call) -> None:
+        if self._calls.get(key) is call:
+            del self._calls[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {"executed": self.executed, "coalesced": self.coalesced, "in_flight": len(self._calls)}
+
+
+class _SharedStream:
+    def __init__(self, key: str, source: AsyncGenerator[Any, None], on_close: Callable[["_SharedStream"], None]):
+        self.key = key
+        self.history: List[Any] = []
+        self.subscribers: Set["asyncio.Queue[Any]"] = set()
+        self.finished = False
+        self._on_close = on_close
+        self._task = asyncio.ensure_future(self._pump(source))
+
+    async def _pump(self, source: AsyncGenerator[Any, None]) -> None:
+        try:
+            async for chunk in source:
+                self.history.append(chunk)
+                for queue in self.subscribers:
+                    queue.put_nowait(chunk)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            for queue in self.subscribers:
+                queue.put_nowait(e)
+        finally:
+            self.finished = True
+            self._on_close(self)
+            for queue in self.subscribers:
+                queue.put_nowait(_END)
+            await source.aclose()
+
+    def subscribe(self) -> "asyncio.Queue[Any]":
+        # 后加入的订阅者先回放已经收到的数据块
+        queue: "asyncio.Queue[Any]" = asyncio.Queue()
+        for chunk in self.history:
+            queue.put_nowait(chunk)
+        self.subscribers.add(queue)
+        return queue
+
+    def unsubscribe(self, queue: "asyncio.Queue[Any]") -> None:
+        self.subscribers.discard(queue)
+        if not self.subscribers and not self.finished:
+            self._task.cancel()
+            self._on_close(self)
+
+
+class StreamFanout:
+    """相同的流式请求共享一个上游流，每个订阅者有独立的缓冲队列"""
+    def __init__(self):
+        self._streams: Dict[str, _SharedStream] = {}
+        self.executed = 0
+        self.coalesced = 0
+
+    def _forget(self, stream: _SharedStream) -> None:
+        if self._streams.get(stream.key) is stream:
+            del self._streams[stream.key]
+
+    async def subscribe(
+        self,
+        key: str,
+        factory: Callable[[], AsyncGenerator[Any, None]]
+    ) -> AsyncIterator[Any]:
+        stream: Optional[_SharedStream] = self._streams.get(key)
+        if stream is None or stream.finished:
+            stream = _SharedStream(key, factory(), self._forget)
+            self._streams[key] = stream
+            self.executed += 1
+        else:
+            self.coalesced += 1
+
+        queue = stream.subscribe()
+        try:
+            while True:
+                item = await queue.get()
+                if item is _END:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stream.unsubscribe(queue)
+
+    def stats(self) -> Dict[str, int]:
+        return {"executed": self.executed, "coalesced": self.coalesced, "in_flight": len(self._streams)}
+
+
+@lru_cache()
+def get_single_flight() -> SingleFlight:
+    return SingleFlight()
+
+
+@lru_cache()
+def get_stream_fanout() -> StreamFanout:
+    return StreamFanout()
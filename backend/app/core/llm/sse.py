@@ -0,0 +1,163 @@
+"""
+字节级的 SSE 解码器
+
+直接在网络数据块上按空行切分事件，不先拆成一行行的字符串；
+data 负载以 bytes 交给 JSON 解析（安装了 orjson 时使用 orjson）。
+"""
+from typing import Any, AsyncGenerator, AsyncIterator, Dict, List, Optional
+import logging
+
+from app.core.llm.codec import loads
+
+logger = logging.getLogger(__name__)
+
+DONE = b"[DONE]"
+
+
+class SSEEvent:
+    __slots__ = ("data", "event", "id")
+
+    def __init__(self, data: bytes, event: Optional[str] = None, id: Optional[str] = None):
+        self.data = data
+        self.event = event
+        self.id = id
+
+
+def _parse_block(block: bytes) -> Optional[SSEEvent]:
+    # 最常见的情况：整个事件只有一行 "data: ..."
+    if block.startswith(b"data:") and b"\n" not in block:
+        data = block[5:]
+        return SSEEvent(data[1:] if data[:1] == b" " else data)
+
+    data_lines: List[bytes] = []
+    event = None
+    event_id = None
+    for line in block.split(b"\n"):
+        if not line or line[0] == 0x3A:  # 空行或以 ":" 开头的注释（常用作心跳）
+            continue
+        name, _, value = line.partition(b":")
+        if value[:1] == b" ":
+            value = value[1:]
+        if name == b"data":
+            data_lines.append(value)
+        elif name == b"event":
+            event = value.decode("utf-8", "replace")
+        elif name == b"id":
+            event_id = value.decode("utf-8", "replace")
+    if not data_lines:
+        return None
+    return SSEEvent(b"\n".join(data_lines), event, event_id)
+
+
+class SSEDecoder:
+    """把任意切分的字节块解码成 SSE 事件，兼容 \\n、\\r\\n 和 \\r 换行"""
+    __slots__ = ("_buffer",)
+
+    def __init__(self):
+        self._buffer = b""
+
+    def feed_blocks(self, chunk: bytes) -> List[bytes]:
+        """返回已经完整的事件块（未解析），用 bytes.split 在 C 层切分"""
+        data = self._buffer + chunk if self._buffer else bytes(chunk)
+        if b"\r" in data:
+            # 末尾的 \r 可能和下一个块开头的 \n 组成 \r\n，先留着
+            tail = data.endswith(b"\r")
+            data = (data[:-1] if tail else data).replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+            if tail:
+                data += b"\r"
+        blocks = data.split(b"\n\n")
+        self._buffer = blocks.pop()
+        return blocks
+
+    def feed(self, chunk: bytes) -> List[SSEEvent]:
+        events = []
+        for block in self.feed_blocks(chunk):
+            event = _parse_block(block)
+            if event is not None:
+                events.append(event)
+        return events
+
+    def flush(self) -> List[SSEEvent]:
+        """流结束时处理最后一个没有以空行结尾的事件"""
+        block = self._buffer.rstrip(b"\r\n")
+        self._buffer = b""
+        event = _parse_block(block) if block else None
+        return [event] if event is not None else []
+
+
+class ChatDelta:
+    """流式补全中的一个增量，只保留下游需要的字段"""
+    __slots__ = ("content", "role", "finish_reason", "usage", "error")
+
+    def __init__(
+        self,
+        content: Optional[str] = None,
+        role: Optional[str] = None,
+        finish_reason: Optional[str] = None,
+        usage: Optional[Dict[str, Any]] = None,
+        error: Optional[Dict[str, Any]] = None
+    ):
+        self.content = content
+        self.role = role
+        self.finish_reason = finish_reason
+        self.usage = usage
+        self.error = error
+
+    @classmethod
+    def from_payload(cls, payload: Dict[str, Any]) -> "ChatDelta":
+        if "error" in payload:
+            return cls(error=payload["error"])
+        choices = payload.get("choices")
+        if not choices:
+            return cls(usage=payload.get("usage"))
+        choice = choices[0]
+        delta = choice.get("delta") or {}
+        return cls(delta.get("content"), delta.get("role"), choice.get("finish_reason"), payload.get("usage"))
+
+    def to_chunk(self) -> Dict[str, Any]:
+        """转换成与 OpenAI 流式响应兼容的最小 dict，供基于 dict 的下游使用"""
+        if self.error is not None:
+            return {"error": self.error}
+        delta: Dict[str, Any] = {}
+        if self.role is not None:
+            delta["role"] = self.role
+        if self.content is not None:
+            delta["content"] = self.content
+        chunk: Dict[str, Any] = {"choices": [{"delta": delta, "finish_reason": self.finish_reason}]}
+        if self.usage is not None:
+            chunk["usage"] = self.usage
+        return chunk
+
+
+async def iter_chat_deltas(byte_chunks: AsyncIterator[bytes]) -> AsyncGenerator[ChatDelta, None]:
+    """从原始字节流中解析出 ChatDelta，遇到 [DONE] 结束"""
+    decoder = SSEDecoder()
+    async for chunk in byte_chunks:
+        for block in decoder.feed_blocks(chunk):
+            # 热路径：单行 "data: {...}" 事件直接取负载，不构造 SSEEvent
+            if block[:6] == b"data: " and b"\n" not in block:
+                data = block[6:]
+            else:
+                event = _parse_block(block)
+                if event is None:
+                    continue
+                data = event.data
+            if data == DONE:
+                return
+            delta = _decode(data)
+            if delta is not None:
+                yield delta
+    for event in decoder.flush():
+        if event.data == DONE:
+            return
+        delta = _decode(event.data)
+        if delta is not None:
+            yield delta
+
+
+def _decode(data: bytes) -> Optional[ChatDelta]:
+    try:
+        return ChatDelta.from_payload(loads(data))
+    except (ValueError, TypeError, AttributeError) as e:
+        logger.warning(f"无法解析 SSE 数据: {e}; data={data[:200]!r}")
+        return None
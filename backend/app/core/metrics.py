@@ -0,0 +1,465 @@
+"""
+Prometheus 文本格式的指标
+
+热路径上只做整数/浮点累加：指标子项按标签预先绑定，记录时不加锁，
+前提是只在事件循环线程内记录。会在 asyncio.to_thread 的工作线程中记录的指标
+（向量化、Qdrant 检索）用 thread_safe=True 创建，记录和读取时加锁。多 worker 部署时设置
+METRICS_MULTIPROC_DIR，各 worker 定期把快照写入该目录，/metrics 汇总仍在运行的 worker 的快照。
+"""
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+import asyncio
+import json
+import logging
+import math
+import os
+import re
+import threading
+import time
+
+from app.core.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+
+
+class CounterChild:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.value += amount
+
+
+class _Timer:
+    __slots__ = ("_child", "_start")
+
+    def __init__(self, child: "HistogramChild"):
+        self._child = child
+        self._start = 0.0
+
+    def __enter__(self) -> "_Timer":
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self._child.observe(time.perf_counter() - self._start)
+
+
+class HistogramChild:
+    __slots__ = ("upper_bounds", "counts", "sum", "count")
+
+    def __init__(self, upper_bounds: Sequence[float]):
+        self.upper_bounds = upper_bounds
+        # 每个桶只记录落在该区间的次数，渲染时再累加成 Prometheus 的累计桶
+        self.counts = [0] * (len(upper_bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.upper_bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self) -> _Timer:
+        return _Timer(self)
+
+
+class LockedHistogramChild(HistogramChild):
+    """在工作线程中记录的直方图子项，累加和读取都持有所属指标的锁"""
+    __slots__ = ("lock",)
+
+    def __init__(self, upper_bounds: Sequence[float], lock: threading.Lock):
+        super().__init__(upper_bounds)
+        self.lock = lock
+
+    def observe(self, value: float) -> None:
+        with self.lock:
+            super().observe(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[LabelValues, Any] = {}
+        REGISTRY.register(self)
+
+    def _new_child(self) -> Any:
+        raise NotImplementedError
+
+    def labels(self, *values: Any) -> Any:
+        """返回指定标签的子项；调用方应在初始化时绑定并复用，避免热路径上查字典"""
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} 需要标签 {self.labelnames}，实际为 {key}")
+            child = self._children[key] = self._new_child()
+        return child
+
+    def _snapshot_child(self, child: Any) -> Any:
+        raise NotImplementedError
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "kind": self.kind,
+            "help": self.documentation,
+            "labelnames": list(self.labelnames),
+            "samples": [[list(key), self._snapshot_child(child)] for key, child in list(self._children.items())],
+        }
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self) -> CounterChild:
+        return CounterChild()
+
+    def inc(self, amount: float = 1.0) -> None:
+        self.labels().inc(amount)
+
+    def _snapshot_child(self, child: CounterChild) -> float:
+        return child.value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+        thread_safe: bool = False
+    ):
+        """thread_safe: 会在事件循环以外的线程中记录时设为 True"""
+        self.buckets = tuple(sorted(buckets))
+        self._lock: Optional[threading.Lock] = threading.Lock() if thread_safe else None
+        super().__init__(name, documentation, labelnames)
+
+    def _new_child(self) -> HistogramChild:
+        if self._lock is not None:
+            return LockedHistogramChild(self.buckets, self._lock)
+        return HistogramChild(self.buckets)
+
+    def labels(self, *values: Any) -> Any:
+        if self._lock is None:
+            return super().labels(*values)
+        with self._lock:
+            return super().labels(*values)
+
+    def observe(self, value: float) -> None:
+        self.labels().observe(value)
+
+    def time(self) -> _Timer:
+        return self.labels().time()
+
+    def snapshot(self) -> Dict[str, Any]:
+        data = super().snapshot()
+        data["buckets"] = list(self.buckets)
+        return data
+
+    def _snapshot_child(self, child: HistogramChild) -> List[Any]:
+        if self._lock is not None:
+            with self._lock:
+                return [list(child.counts), child.sum, child.count]
+        return [list(child.counts), child.sum, child.count]
+
+
+# 采集时才计算的指标：返回 (名称, 说明, 标签, 值)
+Collector = Callable[[], Iterable[Tuple[str, str, Dict[str, str], float]]]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Collector] = []
+
+    def register(self, metric: _Metric) -> None:
+        if metric.name in self._metrics:
+            raise ValueError(f"指标 {metric.name} 已注册")
+        self._metrics[metric.name] = metric
+
+    def register_collector(self, collector: Collector) -> None:
+        self._collectors.append(collector)
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        data = {name: metric.snapshot() for name, metric in self._metrics.items()}
+        for collector in self._collectors:
+            try:
+                samples = list(collector())
+            except Exception as e:
+                logger.warning(f"采集指标失败: {e}")
+                continue
+            for name, documentation, labels, value in samples:
+                gauge = data.setdefault(name, {
+                    "kind": "gauge",
+                    "help": documentation,
+                    "labelnames": list(labels),
+                    "samples": [],
+                })
+                gauge["samples"].append([[labels[k] for k in gauge["labelnames"]], value])
+        return data
+
+
+REGISTRY = Registry()
+
+
+def _merge(snapshots: List[Tuple[int, Dict[str, Dict[str, Any]]]]) -> Dict[str, Dict[str, Any]]:
+    """
+    汇总多个 worker 的 (pid, 快照)：计数器和直方图按指标和标签相加；
+    仪表（如并发上限）相加没有意义，加上 pid 标签按 worker 分别输出
+    """
+    merged: Dict[str, Dict[str, Any]] = {}
+    for pid, snapshot in snapshots:
+        for name, metric in snapshot.items():
+            gauge = metric["kind"] == "gauge"
+            labelnames = list(metric["labelnames"]) + (["pid"] if gauge else [])
+            target = merged.setdefault(name, {**metric, "labelnames": labelnames, "samples": {}})
+            for labels, value in metric["samples"]:
+                key = tuple(labels) + ((str(pid),) if gauge else ())
+                current = target["samples"].get(key)
+                if current is None or gauge:
+                    target["samples"][key] = value
+                elif metric["kind"] == "histogram":
+                    counts = [a + b for a, b in zip(current[0], value[0])]
+                    target["samples"][key] = [counts, current[1] + value[1], current[2] + value[2]]
+                else:
+                    target["samples"][key] = current + value
+    return merged
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+def render(snapshot: Dict[str, Dict[str, Any]]) -> str:
+    lines: List[str] = []
+    for name, metric in sorted(snapshot.items()):
+        samples = metric["samples"]
+        if isinstance(samples, list):
+            samples = {tuple(labels): value for labels, value in samples}
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['kind']}")
+        names = metric["labelnames"]
+        for labels, value in samples.items():
+            if metric["kind"] == "histogram":
+                counts, total, count = value
+                cumulative = 0
+                for bound, bucket_count in zip(list(metric["buckets"]) + [math.inf], counts):
+                    cumulative += bucket_count
+                    le = _format_value(bound) if not math.isinf(bound) else "+Inf"
+                    lines.append(f"{name}_bucket{_format_labels(names, labels, ('le', le))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(names, labels)} {_format_value(total)}")
+                lines.append(f"{name}_count{_format_labels(names, labels)} {count}")
+            else:
+                lines.append(f"{name}{_format_labels(names, labels)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+_SNAPSHOT_FILE = re.compile(r"^metrics-(\d+)\.json$")
+
+
+def _snapshot_path(directory: str) -> str:
+    return os.path.join(directory, f"metrics-{os.getpid()}.json")
+
+
+def write_snapshot(directory: Optional[str] = None, snapshot: Optional[Dict[str, Dict[str, Any]]] = None) -> None:
+    """
+    把当前进程的指标写入共享目录（先写临时文件再改名，避免读到半个文件）
+
+    snapshot: 在事件循环中取好的快照；只把文件读写放到线程中，避免线程里读到正在更新的指标
+    """
+    directory = directory or get_settings().METRICS_MULTIPROC_DIR
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    path = _snapshot_path(directory)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(snapshot if snapshot is not None else REGISTRY.snapshot(), f)
+    os.replace(tmp_path, path)
+
+
+def remove_snapshot(directory: Optional[str] = None) -> None:
+    """worker 退出时删除自己的快照，避免已退出进程的计数被一直累加"""
+    directory = directory or get_settings().METRICS_MULTIPROC_DIR
+    if not directory:
+        return
+    try:
+        os.remove(_snapshot_path(directory))
+    except FileNotFoundError:
+        pass
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _read_snapshots(directory: str, max_age: float) -> List[Tuple[int, Dict[str, Dict[str, Any]]]]:
+    """读取其他 worker 的快照；跳过进程已不存在或超过 max_age 秒未更新的文件（异常退出的 worker）"""
+    snapshots = []
+    own_pid = os.getpid()
+    now = time.time()
+    for filename in os.listdir(directory):
+        match = _SNAPSHOT_FILE.match(filename)
+        if not match or int(match.group(1)) == own_pid:
+            continue
+        pid = int(match.group(1))
+        path = os.path.join(directory, filename)
+        try:
+            if now - os.path.getmtime(path) > max_age or not _pid_alive(pid):
+                continue
+            with open(path, encoding="utf-8") as f:
+                snapshots.append((pid, json.load(f)))
+        except (OSError, ValueError) as e:
+            logger.warning(f"读取指标快照 {filename} 失败: {e}")
+    return snapshots
+
+
+def _exchange_snapshots(directory: str, own: Dict[str, Dict[str, Any]],
+                        max_age: float) -> List[Tuple[int, Dict[str, Dict[str, Any]]]]:
+    write_snapshot(directory, own)
+    return _read_snapshots(directory, max_age)
+
+
+async def render_metrics() -> str:
+    """/metrics 的响应内容；多 worker 模式下汇总所有 worker 的快照，文件读写放到线程中"""
+    settings = get_settings()
+    directory = settings.METRICS_MULTIPROC_DIR
+    own = REGISTRY.snapshot()
+    if not directory:
+        return render(own)
+    others = await asyncio.to_thread(_exchange_snapshots, directory, own, settings.METRICS_SNAPSHOT_MAX_AGE)
+    return render(_merge([(os.getpid(), own)] + others))
+
+
+async def flush_periodically() -> None:
+    """多 worker 模式下定期写快照，让其他 worker 抓取时能看到本进程的数据"""
+    settings = get_settings()
+    if not settings.METRICS_MULTIPROC_DIR:
+        return
+    while True:
+        await asyncio.sleep(settings.METRICS_FLUSH_INTERVAL)
+        try:
+            await asyncio.to_thread(write_snapshot, None, REGISTRY.snapshot())
+        except OSError as e:
+            logger.warning(f"写入指标快照失败: {e}")
+
+
+# LLM 调用
+LLM_TTFT = Histogram(
+    "llm_ttft_seconds", "流式请求从发出到收到首个内容块的时间", ("provider", "agent")
+)
+LLM_REQUEST_DURATION = Histogram(
+    "llm_request_duration_seconds", "LLM 请求的总耗时", ("provider", "agent", "kind")
+)
+LLM_TOKENS_PER_SECOND = Histogram(
+    "llm_tokens_per_second", "LLM 输出速度", ("provider", "agent"),
+    buckets=(1, 5, 10, 20, 40, 80, 160, 320)
+)
+LLM_ERRORS = Counter("llm_errors_total", "LLM 请求失败次数", ("provider", "agent", "type"))
+LLM_RETRIES = Counter("llm_retries_total", "LLM 重试事件次数", ("provider", "event"))
+LLM_PROMPT_TOKENS = Counter("llm_prompt_tokens_total", "上游返回的输入 tokens", ("provider", "agent"))
+LLM_PROMPT_CACHED_TOKENS = Counter(
+    "llm_prompt_cached_tokens_total", "输入 tokens 中命中上游前缀缓存的部分", ("provider", "agent")
+)
+LLM_LIMITER_QUEUE_WAIT = Histogram(
+    "llm_limiter_queue_wait_seconds", "请求在限流器中排队的时间", ("provider",)
+)
+
+# 分析流程
+PIPELINE_STAGE_DURATION = Histogram(
+    "pipeline_stage_duration_seconds", "stream_analysis 各阶段耗时", ("stage",)
+)
+PIPELINE_STAGE_FAILURES = Counter(
+    "pipeline_stage_failures_total", "并发执行的流水线阶段失败次数", ("stage",)
+)
+STREAM_DISCONNECTS = Counter(
+    "stream_client_disconnects_total", "客户端在流式响应结束前断开的次数", ("endpoint",)
+)
+COURSE_INDEX_LOAD_DURATION = Histogram(
+    "course_index_load_seconds", "加载课程索引的耗时",
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600)
+)
+INTENT_CLASSIFIER_DECISIONS = Counter(
+    "intent_classifier_decisions_total", "本地意图分类的结果：rule/centroid 为直接返回，fallback 为交给 LLM", ("result",)
+)
+CONVERSATION_COMPACTIONS = Counter(
+    "conversation_compactions_total", "会话历史压缩成摘要的次数", ("result",)
+)
+SPECULATIVE_RETRIEVALS = Counter(
+    "speculative_course_retrievals_total", "投机开始的课程检索，按结果是否被使用统计", ("result",)
+)
+SEMANTIC_CACHE_LOOKUPS = Counter(
+    "semantic_cache_lookups_total", "语义缓存查询次数", ("result",)
+)
+SEMANTIC_CACHE_WRITES = Counter(
+    "semantic_cache_writes_total", "语义缓存后台写入次数", ("result",)
+)
+# 这两个在 asyncio.to_thread 的工作线程中记录
+QDRANT_SEARCH_DURATION = Histogram("qdrant_search_seconds", "Qdrant 向量检索耗时", thread_safe=True)
+EMBEDDING_DURATION = Histogram("embedding_seconds", "文本向量化耗时", ("backend",), thread_safe=True)
+
+
+def _collect_llm_state() -> Iterable[Tuple[str, str, Dict[str, str], float]]:
+    from app.core.llm.cache import get_response_cache
+    from app.core.llm.limiter import _limiters
+    from app.core.llm.prompts import PROMPTS
+    from app.core.llm.singleflight import get_single_flight, get_stream_fanout
+
+    for key, value in get_response_cache().stats().items():
+        yield "llm_cache", "LLM 响应缓存统计", {"stat": key}, value
+    for kind, flight in (("completion", get_single_flight()), ("stream", get_stream_fanout())):
+        for key, value in flight.stats().items():
+            yield "llm_coalescing", "LLM 请求合并统计", {"kind": kind, "stat": key}, value
+    for provider, limiter in list(_limiters.items()):
+        for key, value in limiter.stats().items():
+            yield "llm_limiter", "LLM 限流器状态", {"provider": provider.value, "stat": key}, value
+    for name, info in PROMPTS.versions().items():
+        yield "llm_prompt_info", "当前使用的提示词模板版本", {"name": name, **info}, 1
+
+
+REGISTRY.register_collector(_collect_llm_state)
+
+
+def _collect_semantic_cache_state() -> Iterable[Tuple[str, str, Dict[str, str], float]]:
+    from app.core.semantic_cache import get_semantic_cache
+
+    cache = get_semantic_cache()
+    if cache is None:
+        return
+    for key, value in cache.stats().items():
+        yield "semantic_cache", "语义缓存统计", {"stat": key}, value
+
+
+REGISTRY.register_collector(_collect_semantic_cache_state)
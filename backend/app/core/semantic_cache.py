@@ -0,0 +1,185 @@
+"""
+语义响应缓存
+
+对 /analyze-intent 的用户问题做向量化，在专用的 Qdrant 集合里找语义相近的历史问题；
+相似度达到阈值时直接重放当时生成的标准回答和课程推荐，跳过这两个最慢的 LLM 阶段。
+未命中的请求在生成完成后由后台任务写回，不阻塞响应。
+
+条目带有写入时间和课程目录版本，查询时只匹配 TTL 内、目录版本一致的条目；
+目录变化或过期的条目在后续写入时批量删除。
+"""
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+import asyncio
+import logging
+import time
+import uuid
+
+from app.core.config import get_settings
+from app.core.metrics import SEMANTIC_CACHE_LOOKUPS, SEMANTIC_CACHE_WRITES
+from app.core.vector_store.qdrant import QdrantStore, VectorNode, VectorQuery
+
+logger = logging.getLogger(__name__)
+
+# 文本 -> 向量，可替换为任意向量化服务
+Embedder = Callable[[str], Awaitable[List[float]]]
+
+
+def bge_embedder(base_url: Optional[str] = None) -> Embedder:
+    """把同步的 BGEEmbedding 包装成在线程池中执行的异步 embedder"""
+    from app.core.embedding.bge import BGEEmbedding
+
+    bge = BGEEmbedding(base_url)
+
+    async def embed(text: str) -> List[float]:
+        return await asyncio.to_thread(bge.get_embedding, text)
+
+    return embed
+
+
+@dataclass
+class SemanticLookup:
+    embedding: Optional[List[float]] = None
+    response: Optional[Dict[str, Any]] = None
+    similarity: float = 0.0
+
+    @property
+    def hit(self) -> bool:
+        return self.response is not None
+
+
+class SemanticCache:
+    def __init__(self, store: QdrantStore, embed: Embedder, threshold: float, ttl: float):
+        self.store = store
+        self.embed = embed
+        self.threshold = threshold
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.writes = 0
+        self._collection_ready = False
+        self._purged_version: Optional[str] = None
+        self._last_purge = 0.0
+        self._pending: Set[asyncio.Task] = set()
+        self._hit_metric = SEMANTIC_CACHE_LOOKUPS.labels("hit")
+        self._miss_metric = SEMANTIC_CACHE_LOOKUPS.labels("miss")
+        self._error_metric = SEMANTIC_CACHE_LOOKUPS.labels("error")
+
+    def _live_filter(self, catalog_version: str) -> Dict[str, Any]:
+        return {
+            "must": [
+                {"key": "catalog_version", "match": {"value": catalog_version}},
+                {"key": "created_at", "range": {"gte": time.time() - self.ttl}},
+            ]
+        }
+
+    def _stale_filter(self, catalog_version: str) -> Dict[str, Any]:
+        return {
+            "should": [
+                {"key": "created_at", "range": {"lt": time.time() - self.ttl}},
+                {"must_not": [{"key": "catalog_version", "match": {"value": catalog_version}}]},
+            ]
+        }
+
+    def _ensure_collection(self, vector_size: int) -> None:
+        # 集合在第一次拿到向量、知道维度之后才创建
+        if not self._collection_ready:
+            self.store.ensure_collection(vector_size)
+            self._collection_ready = True
+
+    def _search(self, embedding: List[float], catalog_version: str):
+        self._ensure_collection(len(embedding))
+        return self.store.query(VectorQuery(
+            query_embedding=embedding,
+            similarity_top_k=1,
+            filter_json=self._live_filter(catalog_version)
+        ))
+
+    async def lookup(self, text: str, catalog_version: str) -> SemanticLookup:
+        """查询语义相近的缓存响应；出错时按未命中处理，返回的 embedding 为 None 时不会写回"""
+        try:
+            embedding = await self.embed(text)
+            result = await asyncio.to_thread(self._search, embedding, catalog_version)
+        except Exception as e:
+            logger.warning(f"语义缓存查询失败: {e}")
+            self.errors += 1
+            self._error_metric.inc()
+            return SemanticLookup()
+
+        similarity = result.similarities[0] if result.similarities else 0.0
+        if result.nodes and similarity >= self.threshold:
+            self.hits += 1
+            self._hit_metric.inc()
+            logger.info(f"语义缓存命中，相似度 {similarity:.3f}: {result.nodes[0].metadata.get('query')}")
+            return SemanticLookup(embedding, result.nodes[0].metadata.get("response"), similarity)
+
+        self.misses += 1
+        self._miss_metric.inc()
+        return SemanticLookup(embedding, similarity=similarity)
+
+    def _write(self, embedding: List[float], text: str, catalog_version: str, response: Dict[str, Any]) -> None:
+        self._ensure_collection(len(embedding))
+        now = time.time()
+        if catalog_version != self._purged_version or now - self._last_purge >= self.ttl:
+            self.store.delete_where(self._stale_filter(catalog_version))
+            self._purged_version = catalog_version
+            self._last_purge = now
+        self.store.add([VectorNode(
+            id=str(uuid.uuid4()),
+            embedding=embedding,
+            metadata={
+                "query": text,
+                "catalog_version": catalog_version,
+                "created_at": now,
+                "response": response,
+            }
+        )])
+
+    async def _store(self, embedding: List[float], text: str, catalog_version: str, response: Dict[str, Any]) -> None:
+        try:
+            await asyncio.to_thread(self._write, embedding, text, catalog_version, response)
+            self.writes += 1
+            SEMANTIC_CACHE_WRITES.labels("ok").inc()
+        except Exception as e:
+            logger.warning(f"语义缓存写入失败: {e}")
+            SEMANTIC_CACHE_WRITES.labels("error").inc()
+
+    def store_later(self, lookup: SemanticLookup, text: str, catalog_version: str, response: Dict[str, Any]) -> None:
+        """在后台写回一次未命中的结果，复用查询时算好的向量"""
+        if lookup.embedding is None or lookup.hit:
+            return
+        task = asyncio.ensure_future(self._store(lookup.embedding, text, catalog_version, response))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def drain(self) -> None:
+        """等待所有后台写入完成"""
+        if self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses + self.errors
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "errors": self.errors,
+            "writes": self.writes,
+            "pending_writes": len(self._pending),
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+
+@lru_cache()
+def get_semantic_cache() -> Optional[SemanticCache]:
+    """未开启语义缓存时返回 None"""
+    settings = get_settings()
+    if not settings.SEMANTIC_CACHE_ENABLED:
+        return None
+    return SemanticCache(
+        QdrantStore(settings.SEMANTIC_CACHE_COLLECTION),
+        bge_embedder(settings.BGE_BASE_URL),
+        settings.SEMANTIC_CACHE_THRESHOLD,
+        settings.SEMANTIC_CACHE_TTL
+    )
@@ -0,0 +1,87 @@
+"""
+流式响应的生命周期
+
+async for 提前退出时，被迭代的生成器停在 yield 处，不会自动关闭，它持有的上游
+HTTP 流要等到垃圾回收才释放；嵌套的流都应通过 aclosing 或 finally 中的 aclose() 显式关闭。
+客户端断开 SSE 连接后，stream_until_disconnect 取消正在等待上游的读取，让整条生成器链随之结束。
+paced 只在显式配置了事件间隔时使用，默认不给流水线增加任何等待。
+"""
+from typing import AsyncGenerator, AsyncIterator, TypeVar
+from contextlib import asynccontextmanager
+import asyncio
+import logging
+import time
+
+from starlette.requests import Request
+
+from app.core.metrics import STREAM_DISCONNECTS
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+try:
+    from contextlib import aclosing
+except ImportError:  # Python 3.9
+    @asynccontextmanager
+    async def aclosing(thing: AsyncGenerator[T, None]) -> AsyncIterator[AsyncGenerator[T, None]]:
+        try:
+            yield thing
+        finally:
+            await thing.aclose()
+
+
+async def _wait_for_disconnect(request: Request) -> None:
+    # 请求体已读完，之后 receive() 只会在连接断开时返回 http.disconnect
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def stream_until_disconnect(
+    request: Request,
+    source: AsyncGenerator[T, None],
+    endpoint: str
+) -> AsyncGenerator[T, None]:
+    """转发 source 的输出；客户端断开后立即取消 source 当前的等待并结束"""
+    watcher = asyncio.ensure_future(_wait_for_disconnect(request))
+    step = None
+    try:
+        while True:
+            step = asyncio.ensure_future(source.__anext__())
+            await asyncio.wait({step, watcher}, return_when=asyncio.FIRST_COMPLETED)
+            if not step.done():
+                return
+            try:
+                item = step.result()
+            except StopAsyncIteration:
+                return
+            yield item
+    finally:
+        # ASGI spec < 2.4 时 Starlette 自己也会监听断开并取消响应任务，两种情况都在这里统计
+        if watcher.done() and not watcher.cancelled():
+            logger.info(f"客户端已断开，取消 {endpoint} 的上游流")
+            STREAM_DISCONNECTS.labels(endpoint).inc()
+        watcher.cancel()
+        if step is not None and not step.done():
+            # 取消后 CancelledError 沿生成器链向上传播，各层的 finally 会关闭上游连接
+            step.cancel()
+            await asyncio.gather(step, return_exceptions=True)
+        else:
+            await source.aclose()
+
+
+async def paced(source: AsyncGenerator[T, None], interval: float) -> AsyncGenerator[T, None]:
+    """保证相邻两个事件至少间隔 interval 秒；只补足不够的部分，生成本身已经够慢时不再等待"""
+    last = None
+    try:
+        async for item in source:
+            if last is not None:
+                delay = last + interval - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            yield item
+            last = time.monotonic()
+    finally:
+        await source.aclose()
@@ -1,27 +1,22 @@
 from typing import AsyncGenerator, Dict, List, Optional, Union, Any
 import httpx
-from pydantic import BaseModel
 import json
+import logging
 
 from app.core.config import get_settings
-from app.core.llm.base import BaseLLMClient
+from app.core.llm.base import BaseLLMClient, LLMProvider
+from app.core.llm.codec import encode_chat_body
+from app.core.llm.http_client import get_http_client
+from app.core.llm.limiter import ProviderRateLimiter, estimate_request_tokens, get_rate_limiter
+from app.core.llm.retry import complete_with_retry, stream_with_retry
+from app.core.llm.sse import iter_chat_deltas
 
 settings = get_settings()
-
-class Message(BaseModel):
-    role: str
-    content: str
-
-class ChatCompletionRequest(BaseModel):
-    messages: List[Message]
-    stream: bool = False
-    temperature: float = 0.7
-    max_tokens: Optional[int] = None
-    top_p: float = 1.0
-    frequency_penalty: float = 0.0
-    presence_penalty: float = 0.0
+logger = logging.getLogger(__name__)
 
 class DeepSeekClient(BaseLLMClient):
+    provider = LLMProvider.DEEPSEEK
+
     def __init__(self):
         self.api_key = settings.DEEPSEEK_API_KEY
         self.api_base = settings.DEEPSEEK_API_BASE
@@ -38,42 +33,45 @@ class DeepSeekClient(BaseLLMClient):
             read=settings.DEEPSEEK_READ_TIMEOUT
         )
 
+    @property
+    def http_client(self) -> httpx.AsyncClient:
+        """共享的长连接客户端，由应用生命周期统一创建和关闭"""
+        return get_http_client(self.provider)
+
+    @property
+    def limiter(self) -> ProviderRateLimiter:
+        return get_rate_limiter(self.provider)
+
     def _get_url(self) -> str:
         return f"{self.api_base}/chat/completions"
 
     def _prepare_request_data(
         self,
-        messages: List[Dict[str, str]],
+        messages: List[Dict[str, Any]],
         temperature: float = 0.7,
         max_tokens: Optional[int] = None,
         top_p: float = 1.0,
         frequency_penalty: float = 0.0,
         presence_penalty: float = 0.0,
         stream: bool = False
-    ) -> Dict[str, Any]:
-        request_data = ChatCompletionRequest(
-            messages=[Message(**msg) for msg in messages],
-            stream=stream,
-            temperature=temperature,
-            max_tokens=max_tokens,
-            top_p=top_p,
-            frequency_penalty=frequency_penalty,
-            presence_penalty=presence_penalty
-        ).model_dump()
-        
-        # 添加 model 字段
-        request_data["model"] = self.model
-        
-        # print(f"\n=== 准备请求数据 ===")
-        # print(f"Stream enabled: {stream}")
-        # print(f"Request data: {request_data}")
-        # print("===================\n")
-        
-        return request_data
+    ) -> bytes:
+        """直接把消息 dict 和参数序列化成请求体，消息已在 API 入口校验过"""
+        params: Dict[str, Any] = {
+            "model": self.model,
+            "stream": stream,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "top_p": top_p,
+            "frequency_penalty": frequency_penalty,
+            "presence_penalty": presence_penalty
+        }
+        if stream and settings.LLM_STREAM_INCLUDE_USAGE:
+            params["stream_options"] = {"include_usage": True}
+        return encode_chat_body(messages, params)
 
     async def create_chat_completion_stream(
         self,
-        messages: List[Dict[str, str]],
+        messages: List[Dict[str, Any]],
         temperature: float = 0.7,
         max_tokens: Optional[int] = None,
         top_p: float = 1.0,
@@ -83,7 +81,29 @@ class DeepSeekClient(BaseLLMClient):
         """
         Create a streaming chat completion with DeepSeek API.
         """
-        request_data = self._prepare_request_data(
+        stream = stream_with_retry(
+            self.retry_policy,
+            self.provider.value,
+            lambda: self._create_chat_completion_stream_once(
+                messages, temperature, max_tokens, top_p, frequency_penalty, presence_penalty
+            )
+        )
+        try:
+            async for chunk in stream:
+                yield chunk
+        finally:
+            await stream.aclose()
+
+    async def _create_chat_completion_stream_once(
+        self,
+        messages: List[Dict[str, Any]],
+        temperature: float,
+        max_tokens: Optional[int],
+        top_p: float,
+        frequency_penalty: float,
+        presence_penalty: float
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        request_body = self._prepare_request_data(
             messages, temperature, max_tokens, top_p, frequency_penalty, presence_penalty, stream=True
         )
         params = {"api-version": self.api_version}
@@ -91,44 +111,55 @@ class DeepSeekClient(BaseLLMClient):
         # print(f"\n=== DeepSeek Stream API 请求信息 ===")
         # print(f"API Key: {self.api_key}")
         # print(f"请求地址: {self._get_url()}")
-        # print(f"请求参数: {request_data}")
         # print(f"Headers: {self.headers}")
         # print("========================\n")
 
-        async with httpx.AsyncClient(timeout=self.timeout) as client:
+        async with self.limiter.slot(estimate_request_tokens(messages, max_tokens)) as slot:
+            client = self.http_client
             try:
                 async with client.stream(
                     "POST",
                     self._get_url(),
                     headers=self.headers,
-                    json=request_data,
+                    content=request_body,
                     params=params
                 ) as response:
+                    if response.is_error:
+                        slot.fail(response.status_code, response.headers.get("retry-after"))
                     response.raise_for_status()
-                    print(f"Response status: {response.status_code}")
-                    print("Response headers:", response.headers)
-                    async for line in response.aiter_lines():
-                        # print("Raw line:", line)  # 添加原始响应日志
-                        if not line.strip():
-                            continue
-                        
-                        if line.startswith("data: "):
-                            try:
-                                data = json.loads(line[6:])
-                                # print("Parsed data:", data)  # 添加解析数据日志
-                                yield data
-                            except json.JSONDecodeError as e:
-                                print(f"Error parsing JSON: {e}")
-                                print(f"Problematic line: {line[6:]}")  # 添加问题行日志
-                                yield {"choices": [{"delta": {"content": line[6:]}}]}
-            except Exception as e:
-                print(f"Stream error: {e}")
-                print(f"Error details: {str(e)}")
-                yield {"choices": [{"delta": {"content": f"[ERROR] {str(e)}"}}]}
+                    slot.respond()
+                    # 直接在原始字节上解码 SSE，收到 [DONE] 即结束
+                    async for delta in iter_chat_deltas(response.aiter_bytes()):
+                        if delta.error is not None and not slot.failed:
+                            # 上游在流中途返回错误：按失败反馈给限流器，不能让并发上限在失败的调用上增长
+                            status_code = delta.error.get("status_code") if isinstance(delta.error, dict) else None
+                            slot.fail(status_code)
+                        yield delta.to_chunk()
+            except httpx.HTTPStatusError as e:
+                logger.warning(f"Stream error: {e}")
+                yield {
+                    "error": {
+                        "message": f"API调用失败: {str(e)}",
+                        "type": "http_error",
+                        "status_code": e.response.status_code,
+                        "retry_after": e.response.headers.get("retry-after")
+                    }
+                }
+            except httpx.RequestError as e:
+                # 超时通常意味着上游过载，按 503 处理以收缩并发
+                slot.fail(503 if isinstance(e, httpx.TimeoutException) else None)
+                logger.warning(f"Stream error: {e}")
+                yield {
+                    "error": {
+                        "message": f"请求失败: {str(e)}",
+                        "type": "request_error",
+                        "details": str(e)
+                    }
+                }
 
     async def create_chat_completion(
         self,
-        messages: List[Dict[str, str]],
+        messages: List[Dict[str, Any]],
         stream: bool = False,
         temperature: float = 0.7,
         max_tokens: Optional[int] = None,
@@ -141,8 +172,25 @@ class DeepSeekClient(BaseLLMClient):
         """
         if stream:
             raise ValueError("For streaming responses, use create_chat_completion_stream instead")
-            
-        request_data = self._prepare_request_data(
+
+        return await complete_with_retry(
+            self.retry_policy,
+            self.provider.value,
+            lambda: self._create_chat_completion_once(
+                messages, temperature, max_tokens, top_p, frequency_penalty, presence_penalty
+            )
+        )
+
+    async def _create_chat_completion_once(
+        self,
+        messages: List[Dict[str, Any]],
+        temperature: float,
+        max_tokens: Optional[int],
+        top_p: float,
+        frequency_penalty: float,
+        presence_penalty: float
+    ) -> Dict[str, Any]:
+        request_body = self._prepare_request_data(
             messages, temperature, max_tokens, top_p, frequency_penalty, presence_penalty, stream=False
         )
         params = {"api-version": self.api_version}
@@ -154,12 +202,13 @@ class DeepSeekClient(BaseLLMClient):
         # print(f"Model: {self.model}")
         # print("========================\n")
         
-        async with httpx.AsyncClient(timeout=self.timeout) as client:
+        async with self.limiter.slot(estimate_request_tokens(messages, max_tokens)) as slot:
+            client = self.http_client
             try:
                 response = await client.post(
                     self._get_url(),
                     headers=self.headers,
-                    json=request_data,
+                    content=request_body,
                     params=params
                 )
                 response.raise_for_status()
@@ -167,6 +216,7 @@ class DeepSeekClient(BaseLLMClient):
                 try:
                     return response.json()
                 except json.JSONDecodeError as e:
+                    slot.fail(response.status_code)
                     print(f"JSON解析错误: {str(e)}")
                     print(f"响应内容: {response.text}")
                     return {
@@ -179,6 +229,7 @@ class DeepSeekClient(BaseLLMClient):
                     }
                     
             except httpx.HTTPStatusError as e:
+                slot.fail(e.response.status_code, e.response.headers.get("retry-after"))
                 print(f"HTTP错误: {str(e)}")
                 try:
                     error_content = e.response.json()
@@ -192,11 +243,14 @@ class DeepSeekClient(BaseLLMClient):
                         "message": f"API调用失败: {str(e)}",
                         "type": "http_error",
                         "status_code": e.response.status_code,
+                        "retry_after": e.response.headers.get("retry-after"),
                         "details": error_content
                     }
                 }
                 
             except httpx.RequestError as e:
+                # 超时通常意味着上游过载，按 503 处理以收缩并发
+                slot.fail(503 if isinstance(e, httpx.TimeoutException) else None)
                 print(f"请求错误: {str(e)}")
                 return {
                     "error": {
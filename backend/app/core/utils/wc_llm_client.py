@@ -1,49 +1,71 @@
 from typing import AsyncGenerator, Dict, List, Optional, Union, Any, cast
-from openai import OpenAI
+import httpx
+from openai import NOT_GIVEN, APIConnectionError, APIStatusError, APITimeoutError, AsyncOpenAI
 from openai.types.chat import ChatCompletionMessageParam
 import json
 import logging
 
 from app.core.config import get_settings
-from app.core.llm.base import BaseLLMClient, ChatMessage
+from app.core.llm.base import BaseLLMClient, LLMProvider
+from app.core.llm.http_client import get_http_client
+from app.core.llm.limiter import LimiterSlot, ProviderRateLimiter, estimate_request_tokens, get_rate_limiter
+from app.core.llm.retry import complete_with_retry, stream_with_retry
 
 logger = logging.getLogger(__name__)
 settings = get_settings()
 
 class WCLLMClient(BaseLLMClient):
+    provider = LLMProvider.WC_LLM
+
     def __init__(self):
         self.api_key = settings.WC_LLM_API_KEY
         self.api_base = settings.WC_LLM_API_BASE
         self.model = settings.WC_LLM_MODEL
-        self.client = OpenAI(
-            api_key=self.api_key,
-            base_url=self.api_base
-        )
-        logger.info(f"Initialized WCLLMClient with API Key: {self.api_key}")
+        self._client: Optional[AsyncOpenAI] = None
+        self._http_client: Optional[httpx.AsyncClient] = None
         logger.info(f"Base URL: {self.api_base}")
 
-    def _convert_messages(self, messages: List[ChatMessage]) -> List[ChatCompletionMessageParam]:
-        """Convert ChatMessage objects to the format expected by OpenAI client"""
-        converted = []
-        for msg in messages:
-            message_dict: Dict[str, Any] = {
-                "role": msg.role.value,
-                "content": msg.content
-            }
-            if msg.name:
-                message_dict["name"] = msg.name
-            if msg.function_call:
-                message_dict["function_call"] = msg.function_call
-            if msg.tool_calls:
-                message_dict["tool_calls"] = msg.tool_calls
-            if msg.tool_call_id:
-                message_dict["tool_call_id"] = msg.tool_call_id
-            converted.append(cast(ChatCompletionMessageParam, message_dict))
-        return converted
+    @property
+    def client(self) -> AsyncOpenAI:
+        """基于共享连接池的异步 OpenAI 客户端，连接池重建后随之重建"""
+        http_client = get_http_client(self.provider)
+        if self._client is None or self._http_client is not http_client:
+            self._client = AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.api_base,
+                http_client=http_client,
+                max_retries=0  # 重试由 BaseLLMClient 的重试策略统一处理
+            )
+            self._http_client = http_client
+        return self._client
+
+    @property
+    def limiter(self) -> ProviderRateLimiter:
+        return get_rate_limiter(self.provider)
+
+    def _error_response(self, e: Exception, slot: LimiterSlot) -> Dict[str, Any]:
+        """把异常转换成错误响应，并把状态码和 Retry-After 反馈给限流器"""
+        error: Dict[str, Any] = {
+            "message": f"API调用失败: {str(e)}",
+            "type": "api_error",
+            "details": str(e)
+        }
+        if isinstance(e, APIStatusError):
+            retry_after = e.response.headers.get("retry-after")
+            error["status_code"] = e.status_code
+            error["retry_after"] = retry_after
+            slot.fail(e.status_code, retry_after)
+        elif isinstance(e, APIConnectionError):
+            error["type"] = "request_error"
+            # 超时通常意味着上游过载，按 503 处理以收缩并发
+            slot.fail(503 if isinstance(e, APITimeoutError) else None)
+        else:
+            slot.fail()
+        return {"error": error}
 
     async def create_chat_completion(
         self,
-        messages: List[ChatMessage],
+        messages: List[Dict[str, Any]],
         stream: bool = False,
         temperature: float = 0.7,
         max_tokens: Optional[int] = None,
@@ -53,58 +75,89 @@ class WCLLMClient(BaseLLMClient):
     ) -> Dict[str, Any]:
         if stream:
             raise ValueError("For streaming responses, use create_chat_completion_stream instead")
-            
-        try:
-            converted_messages = self._convert_messages(messages)
-            completion = self.client.chat.completions.create(
-                model=self.model,
-                messages=converted_messages,
-                temperature=temperature,
-                max_tokens=max_tokens,
-                top_p=top_p,
-                frequency_penalty=frequency_penalty,
-                presence_penalty=presence_penalty
+
+        return await complete_with_retry(
+            self.retry_policy,
+            self.provider.value,
+            lambda: self._create_chat_completion_once(
+                messages, temperature, max_tokens, top_p, frequency_penalty, presence_penalty
             )
-            return completion.model_dump()
-        except Exception as e:
-            logger.error(f"Error in create_chat_completion: {str(e)}")
-            return {
-                "error": {
-                    "message": f"API调用失败: {str(e)}",
-                    "type": "api_error",
-                    "details": str(e)
-                }
-            }
+        )
+
+    async def _create_chat_completion_once(
+        self,
+        messages: List[Dict[str, Any]],
+        temperature: float,
+        max_tokens: Optional[int],
+        top_p: float,
+        frequency_penalty: float,
+        presence_penalty: float
+    ) -> Dict[str, Any]:
+        async with self.limiter.slot(estimate_request_tokens(messages, max_tokens)) as slot:
+            try:
+                completion = await self.client.chat.completions.create(
+                    model=self.model,
+                    messages=cast(List[ChatCompletionMessageParam], messages),
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    top_p=top_p,
+                    frequency_penalty=frequency_penalty,
+                    presence_penalty=presence_penalty
+                )
+                return completion.model_dump()
+            except Exception as e:
+                logger.error(f"Error in create_chat_completion: {str(e)}")
+                return self._error_response(e, slot)
 
     async def create_chat_completion_stream(
         self,
-        messages: List[ChatMessage],
+        messages: List[Dict[str, Any]],
         temperature: float = 0.7,
         max_tokens: Optional[int] = None,
         top_p: float = 1.0,
         frequency_penalty: float = 0.0,
         presence_penalty: float = 0.0
     ) -> AsyncGenerator[Dict[str, Any], None]:
-        try:
-            converted_messages = self._convert_messages(messages)
-            stream = self.client.chat.completions.create(
-                model=self.model,
-                messages=converted_messages,
-                temperature=temperature,
-                max_tokens=max_tokens,
-                top_p=top_p,
-                frequency_penalty=frequency_penalty,
-                presence_penalty=presence_penalty,
-                stream=True
+        stream = stream_with_retry(
+            self.retry_policy,
+            self.provider.value,
+            lambda: self._create_chat_completion_stream_once(
+                messages, temperature, max_tokens, top_p, frequency_penalty, presence_penalty
             )
-            for chunk in stream:
-                yield chunk.model_dump()
-        except Exception as e:
-            logger.error(f"Error in create_chat_completion_stream: {str(e)}")
-            yield {
-                "error": {
-                    "message": f"API调用失败: {str(e)}",
-                    "type": "api_error",
-                    "details": str(e)
-                }
-            } 
\ No newline at end of file
+        )
+        try:
+            async for chunk in stream:
+                yield chunk
+        finally:
+            await stream.aclose()
+
+    async def _create_chat_completion_stream_once(
+        self,
+        messages: List[Dict[str, Any]],
+        temperature: float,
+        max_tokens: Optional[int],
+        top_p: float,
+        frequency_penalty: float,
+        presence_penalty: float
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        async with self.limiter.slot(estimate_request_tokens(messages, max_tokens)) as slot:
+            try:
+                stream = await self.client.chat.completions.create(
+                    model=self.model,
+                    messages=cast(List[ChatCompletionMessageParam], messages),
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    top_p=top_p,
+                    frequency_penalty=frequency_penalty,
+                    presence_penalty=presence_penalty,
+                    stream=True,
+                    stream_options={"include_usage": True} if settings.LLM_STREAM_INCLUDE_USAGE else NOT_GIVEN
+                )
+                slot.respond()
+                # 调用方提前关闭或被取消时，退出 async with 会立即关闭上游 HTTP 响应
+                async with stream:
+                    async for chunk in stream:
+                        yield chunk.model_dump()
+            except Exception as e:
+                logger.error(f"Error in create_chat_completion_stream: {str(e)}")
+                yield self._error_response(e, slot)
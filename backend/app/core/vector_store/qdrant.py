@@ -2,6 +2,7 @@ from typing import Any, List, Optional, Dict
 from pydantic import BaseModel, Field
 from app.core.db import get_qdrant_db
 from app.core.utils import log
+from app.core.metrics import QDRANT_SEARCH_DURATION
 
 class VectorNode(BaseModel):
     """Vector node with embedding and metadata."""
@@ -68,6 +69,22 @@ class QdrantStore:
         result = qdrant_db.delete_vectors(self.collection_name, ref_doc_id)
         log.debug("qdrant delete node result: %s", result)
     
+    def ensure_collection(self, vector_size: int) -> None:
+        """Create the collection with cosine distance if it does not exist.
+        
+        Args:
+            vector_size: Dimension of the embeddings stored in the collection
+        """
+        get_qdrant_db().ensure_collection(self.collection_name, vector_size)
+    
+    def delete_where(self, filter_json: Dict[str, Any]) -> None:
+        """Delete all nodes matching a Qdrant filter.
+        
+        Args:
+            filter_json: Filter in Qdrant's JSON format
+        """
+        get_qdrant_db().delete_by_filter(self.collection_name, filter_json)
+    
     def query(
         self,
         query: VectorQuery,
@@ -85,12 +102,13 @@ class QdrantStore:
         qdrant_db = get_qdrant_db()
         filter = query.filter_json or {}
             
-        response_json = qdrant_db.search_points(
-            self.collection_name,
-            query.query_embedding,
-            filter=filter,
-            top=query.similarity_top_k
-        )
+        with QDRANT_SEARCH_DURATION.time():
+            response_json = qdrant_db.search_points(
+                self.collection_name,
+                query.query_embedding,
+                filter=filter,
+                top=query.similarity_top_k
+            )
         
         result = response_json['result']
         vector_result = VectorQueryResult(nodes=[], similarities=[])
@@ -1,16 +1,39 @@
+from contextlib import asynccontextmanager
+import asyncio
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 from fastapi.middleware.httpsredirect import HTTPSRedirectMiddleware
 from starlette.middleware.sessions import SessionMiddleware
 from app.api.routes import router
+from app.container import AppContainer
 from app.core.config import get_settings
+from app.core.llm.http_client import open_http_clients, close_http_clients
+from app.core.metrics import flush_periodically, remove_snapshot, render_metrics
 
 settings = get_settings()
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 启动时创建并预热 LLM 连接池，关闭时释放连接
+    await open_http_clients(warm=settings.LLM_HTTP_WARMUP)
+    # agent 和 LLMService 只创建一次，由所有请求共享
+    app.state.container = AppContainer.create()
+    # 多 worker 模式下定期把本进程的指标写入共享目录
+    metrics_flusher = asyncio.create_task(flush_periodically())
+    try:
+        yield
+    finally:
+        metrics_flusher.cancel()
+        await app.state.container.close()
+        remove_snapshot()
+        await close_http_clients()
+
 app = FastAPI(
     title=settings.APP_NAME,
-    debug=settings.DEBUG
+    debug=settings.DEBUG,
+    lifespan=lifespan
 )
 
 # 配置CORS
@@ -35,6 +58,11 @@ app.add_middleware(
 
 app.include_router(router, prefix="/api/v1")
 
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus 文本格式的指标"""
+    return PlainTextResponse(await render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 @app.get("/")
 async def root():
     return {"message": "Welcome to Chainsage API"} 
\ No newline at end of file
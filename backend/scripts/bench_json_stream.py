@@ -0,0 +1,133 @@
+"""
+流式 JSON 解析的微基准：比较旧的两种做法和增量扫描器
+
+- 每个数据块后对整个缓冲区重新 json.loads（旧 BaseAgent._handle_stream_response）
+- 逐字符数括号，闭合后再 json.loads（旧 IntentAnalysisAgent 等）
+- JSONStreamScanner
+
+模拟一个包在 ```json 代码块中的长回答，按每块几个字符切分，统计整段输出消耗的 CPU 时间。
+
+用法：
+    python scripts/bench_json_stream.py --items 100 400 --rounds 5
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+# 添加项目根目录到 Python 路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.agents.json_stream import JSONStreamScanner  # noqa: E402
+
+
+def build_response(items: int) -> dict:
+    return {
+        "question_analysis": {"clarity": 0.8, "specificity": 0.6, "overall_score": 0.7},
+        "improvement_suggestions": {
+            f"suggestion_{i}": [f"第 {i} 条建议：明确目标 {{范围}}，补充\"背景\"信息" for _ in range(3)]
+            for i in range(items)
+        },
+        "follow_up_questions": [f"问题 {i}？" for i in range(items)],
+    }
+
+
+def split_chunks(text: str, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    chunks = []
+    pos = 0
+    while pos < len(text):
+        size = rng.randint(1, 6)
+        chunks.append(text[pos:pos + size])
+        pos += size
+    return chunks
+
+
+def reparse_buffer(chunks) -> dict:
+    """旧 BaseAgent：每个数据块后去掉代码块标记，对整个缓冲区重新解析"""
+    current = ""
+    started = False
+    for content in chunks:
+        current += content
+        if not started and "{" in content:
+            started = True
+        if started:
+            text = current.strip()
+            if text.startswith("```json"):
+                text = text[7:]
+            if text.endswith("```"):
+                text = text[:-3]
+            try:
+                return json.loads(text.strip())
+            except json.JSONDecodeError:
+                continue
+    raise ValueError("incomplete")
+
+
+def count_braces(chunks) -> dict:
+    """旧 IntentAnalysisAgent：逐字符数括号（不识别字符串），归零时解析"""
+    current = ""
+    depth = 0
+    for content in chunks:
+        current += content
+        for char in content:
+            if char == "{":
+                depth += 1
+            elif char == "}":
+                depth -= 1
+                if depth == 0:
+                    text = current.strip()
+                    if text.startswith("```json"):
+                        text = text[7:]
+                    if text.endswith("```"):
+                        text = text[:-3]
+                    try:
+                        return json.loads(text.strip())
+                    except json.JSONDecodeError:
+                        pass
+    raise ValueError("incomplete")
+
+
+def scan(chunks) -> dict:
+    scanner = JSONStreamScanner()
+    for content in chunks:
+        results = scanner.feed(content)
+        if results:
+            return results[0]
+    raise ValueError("incomplete")
+
+
+def measure(fn, chunks, expected, rounds: int) -> str:
+    """返回整段输出的 CPU 时间（毫秒），取多轮中的最小值；解析不出正确结果时返回“失败”"""
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.process_time()
+        try:
+            ok = fn(chunks) == expected
+        except ValueError:
+            ok = False
+        if not ok:
+            return "失败"
+        best = min(best, time.process_time() - start)
+    return f"{best * 1000:.1f}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="流式 JSON 解析微基准")
+    parser.add_argument("--items", type=int, nargs="+", default=[20, 100, 200, 400])
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'字符数':>8} {'数据块':>7} {'整体重解析':>10} {'数括号':>8} {'增量扫描':>8}  (ms CPU)")
+    for items in args.items:
+        expected = build_response(items)
+        text = "```json\n" + json.dumps(expected, ensure_ascii=False, indent=2) + "\n```"
+        chunks = split_chunks(text)
+        timings = [measure(fn, chunks, expected, args.rounds) for fn in (reparse_buffer, count_braces, scan)]
+        print(f"{len(text):>10} {len(chunks):>9} {timings[0]:>14} {timings[1]:>11} {timings[2]:>12}")
+
+
+if __name__ == "__main__":
+    main()
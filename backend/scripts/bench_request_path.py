@@ -0,0 +1,120 @@
+"""
+请求构造路径的微基准：比较旧的 pydantic 往返 + 缩进日志和直接序列化 dict 的方式
+
+模拟一次典型的 agent 调用（几 KB 的系统提示词 + 一条用户消息），
+统计每次调用的 CPU 时间和峰值内存分配。
+
+用法：
+    python scripts/bench_request_path.py --calls 20000 --rounds 5
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+from typing import Any, Dict, List, Optional
+
+# 添加项目根目录到 Python 路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pydantic import BaseModel  # noqa: E402
+
+from app.core.llm.base import ChatMessage, MessageRole  # noqa: E402
+from app.core.llm.codec import JSON_BACKEND, encode_chat_body  # noqa: E402
+from app.core.llm.prompts import register_prompt  # noqa: E402
+
+SYSTEM = register_prompt(
+    "bench.system", "v1",
+    "你是一个专业的培训顾问，请根据用户的问题分析其提问方式，并按照以下 JSON 结构返回结果。\n" * 40
+).system
+
+
+class Message(BaseModel):
+    role: str
+    content: str
+
+
+class ChatCompletionRequest(BaseModel):
+    messages: List[Message]
+    stream: bool = False
+    temperature: float = 0.7
+    max_tokens: Optional[int] = None
+    top_p: float = 1.0
+    frequency_penalty: float = 0.0
+    presence_penalty: float = 0.0
+
+
+def build_messages(i: int) -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "content": SYSTEM},
+        {"role": "user", "content": f"用户问题 {i}：如何提升团队的沟通效率？"},
+    ]
+
+
+def legacy_path(messages: List[Dict[str, str]]) -> bytes:
+    """旧实现：缩进日志 -> ChatMessage -> Message/ChatCompletionRequest -> model_dump -> httpx 再序列化"""
+    request_body = {"messages": messages, "stream": False, "temperature": 0.3, "max_tokens": 1024,
+                    "top_p": 1.0, "frequency_penalty": 0.0, "presence_penalty": 0.0}
+    _ = f"Request body: {json.dumps(request_body, ensure_ascii=False, indent=2)}"
+    converted = [ChatMessage(role=MessageRole(msg["role"]), content=msg["content"]) for msg in messages]
+    data = ChatCompletionRequest(
+        messages=[Message(role=msg.role.value, content=msg.content) for msg in converted],
+        temperature=0.3,
+        max_tokens=1024
+    ).model_dump()
+    data["model"] = "deepseek-chat"
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def lean_path(messages: List[Dict[str, str]]) -> bytes:
+    """新实现：dict 直接序列化，系统提示词复用预编码结果"""
+    params: Dict[str, Any] = {"model": "deepseek-chat", "stream": False, "temperature": 0.3, "max_tokens": 1024,
+                              "top_p": 1.0, "frequency_penalty": 0.0, "presence_penalty": 0.0}
+    return encode_chat_body(messages, params)
+
+
+def measure(fn, calls: int, rounds: int) -> float:
+    """返回每次调用的 CPU 时间（微秒），取多轮中的最小值"""
+    batches = [build_messages(i) for i in range(calls)]
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.process_time()
+        for messages in batches:
+            fn(messages)
+        best = min(best, time.process_time() - start)
+    return best / calls * 1e6
+
+
+def peak_memory(fn, calls: int) -> float:
+    """每次调用过程中的峰值内存分配（字节），取平均"""
+    batches = [build_messages(i) for i in range(calls)]
+    tracemalloc.start()
+    total = 0
+    for messages in batches:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        fn(messages)
+        total += tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    return total / calls
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="请求构造路径微基准")
+    parser.add_argument("--calls", type=int, default=20000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    assert json.loads(legacy_path(build_messages(0))) == json.loads(lean_path(build_messages(0)))
+    legacy_us = measure(legacy_path, args.calls, args.rounds)
+    lean_us = measure(lean_path, args.calls, args.rounds)
+    print(f"JSON 后端: {JSON_BACKEND}")
+    print(f"pydantic 往返 + 缩进日志: {legacy_us:8.1f} µs CPU / 次")
+    print(f"dict 直接序列化:         {lean_us:8.1f} µs CPU / 次")
+    print(f"加速比: {legacy_us / lean_us:.2f}x")
+    print(f"峰值内存分配: {peak_memory(legacy_path, 2000) / 1024:.1f} KiB -> {peak_memory(lean_path, 2000) / 1024:.1f} KiB / 次")
+
+
+if __name__ == "__main__":
+    main()
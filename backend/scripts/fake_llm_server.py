@@ -0,0 +1,292 @@
+"""
+本地的 OpenAI 兼容 LLM 模拟服务，用于离线压测
+
+支持 /chat/completions 的 JSON 和 SSE 两种响应，按各 agent 系统提示词中的 JSON 模板
+生成结构合法的回答，并可以配置首 token 延迟分布、输出速度、错误率和 429 比例。
+usage 中按 DeepSeek 的格式返回前缀缓存命中的 tokens（重复出现的系统提示词视为命中）。
+
+用法：
+    python scripts/fake_llm_server.py --port 9000 --ttft-median 0.8 --ttft-p99 4 --tokens-per-second 40
+    # 然后在 .env 中设置
+    LLM_PROVIDER=deepseek
+    DEEPSEEK_API_BASE=http://127.0.0.1:9000
+    DEEPSEEK_API_KEY=fake
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import random
+import re
+import time
+import uuid
+from dataclasses import dataclass
+from typing import Any, AsyncGenerator, Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+_CJK_RE = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]")
+
+
+@dataclass
+class FakeLLMConfig:
+    ttft_median: float = 0.5  # 首 token 延迟的中位数（秒），按对数正态分布采样
+    ttft_p99: float = 2.0
+    tokens_per_second: float = 50.0
+    error_rate: float = 0.0  # 返回 500 的比例
+    rate_limit_rate: float = 0.0  # 返回 429 的比例
+    retry_after: float = 1.0
+    chars_per_chunk: int = 2  # 每个流式数据块的字符数，约等于一个 token
+    model: str = "fake-llm"
+
+    def sample_ttft(self) -> float:
+        if self.ttft_median <= 0:
+            return 0.0
+        # p99 对应标准正态分布的 2.326 倍标准差
+        sigma = max(0.0, math.log(max(self.ttft_p99, self.ttft_median) / self.ttft_median) / 2.326)
+        return random.lognormvariate(math.log(self.ttft_median), sigma)
+
+
+def estimate_tokens(text: str) -> int:
+    cjk = len(_CJK_RE.findall(text))
+    return math.ceil(cjk * 0.6 + (len(text) - cjk) * 0.3)
+
+
+def _extract_template(prompt: str) -> Optional[Any]:
+    """取出系统提示词中的第一个 JSON 模板，并修正模板里不合法的写法"""
+    start = prompt.find("{")
+    if start < 0:
+        return None
+    depth = 0
+    for end in range(start, len(prompt)):
+        if prompt[end] == "{":
+            depth += 1
+        elif prompt[end] == "}":
+            depth -= 1
+            if depth == 0:
+                break
+    else:
+        return None
+    template = prompt[start:end + 1]
+    template = re.sub(r",\s*\.\.\.", "", template)  # ["a", "b", ...]
+    # "confidence": 0.0-1.0 之间的置信度分数, 这类未加引号的说明文字替换成数字
+    template = re.sub(r':[ \t]*(?![ \t"\[{]|true\b|false\b|null\b|-?\d+(?:\.\d+)?\s*[,}\n])([^,\n}]+)', ": 0.8", template)
+    try:
+        return json.loads(template)
+    except ValueError:
+        return None
+
+
+def _fill(value: Any, key: str = "") -> Any:
+    """把模板中的说明文字换成看起来像真实回答的值"""
+    if isinstance(value, dict):
+        return {k: _fill(v, k) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_fill(v, key) for v in value]
+    if isinstance(value, str):
+        if "true/false" in value:
+            return True
+        if "0-1" in value:
+            return round(random.uniform(0.6, 0.95), 2)
+        if key == "intent":
+            return "工作方法咨询"
+        # 去掉括号里的填写说明
+        stripped = re.sub(r"（[^）]*）|\([^)]*\)", "", value).strip()
+        return stripped or value
+    return value
+
+
+def build_content(messages: List[Dict[str, Any]]) -> str:
+    system = next((m.get("content") or "" for m in messages if m.get("role") == "system"), "")
+    user = next((m.get("content") or "" for m in reversed(messages) if m.get("role") == "user"), "")
+
+    if "相关性" in system and "分数" in system:
+        return f"{random.uniform(0.3, 0.95):.2f}"
+    if "识别其中的课程信息" in system:
+        title = re.search(r"《([^》]+)》", user)
+        return json.dumps({"courses": [{
+            "title": title.group(1) if title else "模拟课程",
+            "content": user[:2000],
+            "pages": [1],
+        }]}, ensure_ascii=False)
+    if "课程内容优化" in system:
+        try:
+            return json.dumps(json.loads(user), ensure_ascii=False)
+        except ValueError:
+            pass
+
+    template = _extract_template(system)
+    if template is not None:
+        return json.dumps(_fill(template), ensure_ascii=False)
+    topic = user.strip().replace("\n", " ")[:40] or "这个问题"
+    return f"关于“{topic}”，这是一个模拟回答。" * 5
+
+
+class PrefixCache:
+    """模拟 DeepSeek 的前缀缓存：以 64 tokens 为单位缓存见过的系统提示词"""
+
+    def __init__(self):
+        self._seen = set()
+
+    def usage(self, messages: List[Dict[str, Any]]) -> Dict[str, int]:
+        prompt_tokens = sum(estimate_tokens(m.get("content") or "") + 4 for m in messages)
+        hit = 0
+        if messages and messages[0].get("role") == "system":
+            system = messages[0].get("content") or ""
+            key = hashlib.sha256(system.encode("utf-8")).digest()
+            if key in self._seen:
+                hit = (estimate_tokens(system) + 4) // 64 * 64
+            self._seen.add(key)
+        return {
+            "prompt_tokens": prompt_tokens,
+            "prompt_cache_hit_tokens": hit,
+            "prompt_cache_miss_tokens": prompt_tokens - hit,
+        }
+
+
+def _usage(prompt_usage: Dict[str, int], completion_tokens: int) -> Dict[str, int]:
+    return {
+        **prompt_usage,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_usage["prompt_tokens"] + completion_tokens,
+    }
+
+
+def _completion_body(config: FakeLLMConfig, content: str, prompt_usage: Dict[str, int]) -> Dict[str, Any]:
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": config.model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop",
+        }],
+        "usage": _usage(prompt_usage, estimate_tokens(content)),
+    }
+
+
+async def _stream_events(
+    config: FakeLLMConfig,
+    content: str,
+    prompt_usage: Dict[str, int],
+    include_usage: bool
+) -> AsyncGenerator[str, None]:
+    chunk_id = f"chatcmpl-{uuid.uuid4().hex}"
+    created = int(time.time())
+
+    def event(delta: Dict[str, Any], finish_reason: Optional[str] = None, usage: Optional[Dict[str, int]] = None) -> str:
+        body: Dict[str, Any] = {
+            "id": chunk_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": config.model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        if usage is not None:
+            body["usage"] = usage
+        return f"data: {json.dumps(body, ensure_ascii=False)}\n\n"
+
+    await asyncio.sleep(config.sample_ttft())
+    yield event({"role": "assistant", "content": ""})
+    step = max(1, config.chars_per_chunk)
+    interval = 1.0 / config.tokens_per_second if config.tokens_per_second > 0 else 0.0
+    for i in range(0, len(content), step):
+        piece = content[i:i + step]
+        yield event({"content": piece})
+        if interval:
+            await asyncio.sleep(interval * max(1, estimate_tokens(piece)))
+    yield event({}, "stop", _usage(prompt_usage, estimate_tokens(content)) if include_usage else None)
+    yield "data: [DONE]\n\n"
+
+
+def create_app(config: FakeLLMConfig) -> FastAPI:
+    app = FastAPI(title="Fake LLM")
+    stats = {"requests": 0, "errors": 0, "rate_limited": 0}
+    prefix_cache = PrefixCache()
+
+    @app.head("/")
+    @app.get("/")
+    async def root():
+        # 客户端启动时会 HEAD 一次 base_url 预热连接
+        return {"status": "ok"}
+
+    @app.get("/stats")
+    async def get_stats():
+        return stats
+
+    @app.post("/chat/completions")
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        stats["requests"] += 1
+        roll = random.random()
+        if roll < config.rate_limit_rate:
+            stats["rate_limited"] += 1
+            return JSONResponse(
+                status_code=429,
+                headers={"Retry-After": str(config.retry_after)},
+                content={"error": {"message": "Rate limit exceeded", "type": "rate_limit_error"}},
+            )
+        if roll < config.rate_limit_rate + config.error_rate:
+            stats["errors"] += 1
+            await asyncio.sleep(config.sample_ttft())
+            return JSONResponse(
+                status_code=500,
+                content={"error": {"message": "Injected upstream failure", "type": "server_error"}},
+            )
+
+        messages = body.get("messages") or []
+        content = build_content(messages)
+        prompt_usage = prefix_cache.usage(messages)
+
+        if body.get("stream"):
+            include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+            return StreamingResponse(
+                _stream_events(config, content, prompt_usage, include_usage),
+                media_type="text/event-stream",
+            )
+
+        completion_tokens = estimate_tokens(content)
+        delay = config.sample_ttft()
+        if config.tokens_per_second > 0:
+            delay += completion_tokens / config.tokens_per_second
+        await asyncio.sleep(delay)
+        return JSONResponse(_completion_body(config, content, prompt_usage))
+
+    return app
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="OpenAI 兼容的本地 LLM 模拟服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--ttft-median", type=float, default=0.5, help="首 token 延迟中位数（秒）")
+    parser.add_argument("--ttft-p99", type=float, default=2.0, help="首 token 延迟 p99（秒）")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0, help="输出速度，0 表示不限速")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 500 的比例")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="返回 429 的比例")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="429 响应的 Retry-After（秒）")
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    config = FakeLLMConfig(
+        ttft_median=args.ttft_median,
+        ttft_p99=args.ttft_p99,
+        tokens_per_second=args.tokens_per_second,
+        error_rate=args.error_rate,
+        rate_limit_rate=args.rate_limit_rate,
+        retry_after=args.retry_after,
+    )
+
+    import uvicorn
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
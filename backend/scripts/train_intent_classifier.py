@@ -0,0 +1,86 @@
+"""
+由记录的 LLM 意图分析结果离线训练本地意图分类器的质心模型
+
+样本来自 INTENT_LOG_PATH 记录的 JSONL（每行 message/intent/confidence/is_work_method）。
+按比例留出一部分样本评估：本地直接返回（短路）的比例、短路时与 LLM 结果一致的比例和单次分类耗时。
+
+用法：
+    python scripts/train_intent_classifier.py logs/intent.jsonl --output app/data/intent_classifier.json
+    # 然后在 .env 中设置
+    INTENT_CLASSIFIER_MODEL_PATH=app/data/intent_classifier.json
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+# 添加项目根目录到 Python 路径
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.agents.intent_classifier import IntentClassifier, save_centroids, train_centroids  # noqa: E402
+
+
+def read_records(paths):
+    records = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    records.append(json.loads(line))
+    return records
+
+
+def evaluate(classifier: IntentClassifier, records) -> None:
+    hits = correct = 0
+    sources = {}
+    start = time.perf_counter()
+    for record in records:
+        result = classifier.classify(record["message"])
+        if result is None:
+            continue
+        hits += 1
+        sources[result.source] = sources.get(result.source, 0) + 1
+        correct += result.intent == record["intent"]
+    elapsed = time.perf_counter() - start
+    total = len(records)
+    print(f"评估样本: {total}")
+    print(f"本地短路: {hits} ({hits / max(total, 1):.1%})，其中 {sources}")
+    print(f"短路结果与 LLM 一致: {correct} ({correct / max(hits, 1):.1%})")
+    print(f"平均分类耗时: {elapsed / max(total, 1) * 1e6:.1f} µs")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="训练本地意图分类器的质心模型")
+    parser.add_argument("logs", nargs="+", help="意图分析结果的 JSONL 文件")
+    parser.add_argument("--output", default="app/data/intent_classifier.json")
+    parser.add_argument("--holdout", type=float, default=0.2, help="留作评估的样本比例")
+    parser.add_argument("--min-samples", type=int, default=5, help="意图的最少样本数")
+    parser.add_argument("--min-confidence", type=float, default=0.8, help="只用 LLM 置信度不低于该值的样本")
+    parser.add_argument("--threshold", type=float, default=0.85)
+    parser.add_argument("--margin", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    records = read_records(args.logs)
+    random.Random(args.seed).shuffle(records)
+    split = int(len(records) * (1 - args.holdout))
+    train, test = records[:split], records[split:]
+
+    centroids = train_centroids(train, args.min_samples, args.min_confidence)
+    print(f"训练样本: {len(train)}，得到 {len(centroids)} 个意图质心")
+    for centroid in sorted(centroids, key=lambda c: -c.samples):
+        print(f"  {centroid.intent}: {centroid.samples} 个样本，工作方法占比 {centroid.work_method_ratio:.0%}")
+
+    if test:
+        evaluate(IntentClassifier(centroids=centroids, threshold=args.threshold, margin=args.margin), test)
+
+    # 评估完成后用全部样本训练最终模型
+    save_centroids(train_centroids(records, args.min_samples, args.min_confidence), args.output)
+    print(f"模型已保存到 {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import asyncio
+import json
+import pytest
+from app.agents.intent_agent import IntentAnalysisAgent
+from app.agents.intent_classifier import (
+    NON_ENTERPRISE_INTENT, IntentClassifier, IntentLog, features, load_centroids, save_centroids, train_centroids
+)
+from app.agents.models import IntentAnalysis, UserContext
+
+def _records(intent, messages, is_work_method=True):
+    return [{"message": m, "intent": intent, "confidence": 0.9, "is_work_method": is_work_method} for m in messages]
+
+TRAINING = (
+    _records("绩效考核", [f"绩效考核指标怎么定{suffix}" for suffix in ("", "？", "才合理", "比较好", "更公平", "呢")])
+    + _records("会议组织", [f"怎么组织高效的会议{suffix}" for suffix in ("", "？", "才有效", "比较好", "不拖沓", "呢")])
+)
+
+def test_unambiguous_keyword_short_circuits():
+    result = IntentClassifier().classify("最近总是拖延，怎么办？")
+    assert result.intent == "时间管理" and result.is_work_method and result.source == "rule"
+    assert result.to_analysis().entities["is_work_method"] is True
+
+def test_greeting_is_non_enterprise():
+    result = IntentClassifier().classify("你好！")
+    assert result.intent == NON_ENTERPRISE_INTENT and not result.is_work_method
+
+@pytest.mark.parametrize("message", [
+    "有没有时间管理的课程？",  # 提到课程交给 LLM
+    "项目延期导致跨部门沟通很困难",  # 同时命中两类意图
+    "帮我写一首诗",
+])
+def test_ambiguous_or_unknown_falls_back(message):
+    assert IntentClassifier().classify(message) is None
+
+def test_centroids_classify_similar_messages(tmp_path):
+    path = tmp_path / "model.json"
+    save_centroids(train_centroids(TRAINING), str(path))
+    classifier = IntentClassifier(centroids=load_centroids(str(path)), threshold=0.6)
+    result = classifier.classify("绩效考核的指标应该怎么定")
+    assert result.intent == "绩效考核" and result.source == "centroid"
+    assert classifier.classify("今天天气怎么样") is None
+
+def test_training_drops_rare_and_low_confidence_intents():
+    records = TRAINING + _records("罕见意图", ["只出现一次"]) + [
+        {"message": f"低置信度{i}", "intent": "低置信度", "confidence": 0.3} for i in range(10)
+    ]
+    assert {c.intent for c in train_centroids(records)} == {"绩效考核", "会议组织"}
+
+def test_features_are_normalized_and_stable():
+    vector = features("团队协作")
+    assert abs(sum(v * v for v in vector.values()) - 1.0) < 1e-9
+    assert vector == features("团队协作！")
+
+def test_intent_log_appends_training_records(tmp_path):
+    path = tmp_path / "intent.jsonl"
+    log = IntentLog(str(path))
+    log.record("怎么组织高效的会议", IntentAnalysis(intent="会议组织", confidence=0.9, entities={"is_work_method": "true"}))
+    records = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    assert records == [{"message": "怎么组织高效的会议", "intent": "会议组织", "confidence": 0.9, "is_work_method": True}]
+
+class _FakeLLMService:
+    async def create_chat_completion(self, messages, **kwargs):
+        content = json.dumps({"intent": "会议组织", "confidence": 0.9, "entities": {"is_work_method": True}})
+        return {"choices": [{"message": {"content": content}}]}
+
+@pytest.mark.asyncio
+async def test_agent_records_llm_analysis_off_the_event_loop(tmp_path):
+    """LLM 的结果在工作线程中追加到日志，analyze 不等待写文件"""
+    path = tmp_path / "intent.jsonl"
+    agent = IntentAnalysisAgent(_FakeLLMService())
+    agent.classifier, agent.intent_log = None, IntentLog(str(path))
+    context = UserContext(messages=[{"role": "user", "content": "怎么组织高效的会议"}], user_id="u", session_id="s")
+    analysis = await agent.analyze(context)
+    assert analysis.intent == "会议组织"
+    await asyncio.gather(*agent._pending_records)
+    assert json.loads(path.read_text(encoding="utf-8"))["intent"] == "会议组织"
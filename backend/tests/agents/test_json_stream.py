@@ -0,0 +1,95 @@
+import json
+import pytest
+from app.agents.json_stream import JSONStreamScanner, PartialJSONScanner, delta_content, first_matching, loads_json_object
+
+def _feed_all(text, size):
+    scanner = JSONStreamScanner()
+    results = []
+    for i in range(0, len(text), size):
+        results.extend(scanner.feed(text[i:i + size]))
+    return scanner, results
+
+OBJECT = {"intent": "时间管理 {进阶}", "quote": "他说\"}\"", "path": "C:\\\\tmp\\\\", "nested": {"list": [{"a": 1}, "}"]}}
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 1000])
+def test_braces_and_escapes_inside_strings(size):
+    text = json.dumps(OBJECT, ensure_ascii=False)
+    scanner, results = _feed_all(text, size)
+    assert results == [OBJECT]
+    assert scanner.completed == 1
+    assert not scanner.in_object
+
+@pytest.mark.parametrize("size", [1, 4, 1000])
+def test_code_fence_ignores_surrounding_prose(size):
+    text = "好的 {示例}，结果如下：\n```json\n" + json.dumps(OBJECT, ensure_ascii=False) + "\n```\n以上 {说明}"
+    _, results = _feed_all(text, size)
+    assert results == [OBJECT]
+
+def test_multiple_objects_and_invalid_segment():
+    scanner = JSONStreamScanner()
+    results = scanner.feed('{"a": 1} {not json} {"b": 2}')
+    assert results == [{"a": 1}, {"b": 2}]
+    assert scanner.errors == 1
+
+def test_started_without_completion():
+    scanner = JSONStreamScanner()
+    assert scanner.feed('前言 {"a": "未完') == []
+    assert scanner.started and scanner.in_object
+    assert scanner.completed == 0
+
+def test_loads_json_object():
+    assert loads_json_object("```json\n{\"a\": 1}\n```") == {"a": 1}
+    with pytest.raises(json.JSONDecodeError):
+        loads_json_object("没有 JSON")
+
+def test_helpers():
+    assert delta_content({"choices": [{"delta": {"content": "x"}}]}) == "x"
+    assert delta_content({"choices": [{"delta": {}}]}) == ""
+    assert delta_content({"usage": {}}) == ""
+    assert first_matching([{"a": 1}, {"a": 1, "b": 2}], ["a", "b"]) == {"a": 1, "b": 2}
+    assert first_matching([[1]], None) is None
+
+def _apply(events):
+    texts, values = {}, {}
+    for event in events:
+        if event.op == "text":
+            texts[event.path] = texts.get(event.path, "") + event.value
+        else:
+            values[event.path] = event.value
+    return texts, values
+
+@pytest.mark.parametrize("size", [1, 3, 1000])
+def test_partial_scanner_emits_path_addressed_deltas(size):
+    obj = {
+        "response": {"main_answer": "先做\"计划\"\n再执行 😀 {x}", "key_points": ["a", "b\\c", {"k": [1, 2.5, True, None]}]},
+        "metadata": {"confidence": 0.9},
+    }
+    text = "```json\n" + json.dumps(obj, indent=1) + "\n```"
+    scanner = PartialJSONScanner()
+    events, results = [], []
+    for i in range(0, len(text), size):
+        results.extend(scanner.feed(text[i:i + size]))
+        events.extend(scanner.drain())
+    assert results == [obj]
+    texts, values = _apply(events)
+    assert texts == {
+        "response.main_answer": obj["response"]["main_answer"],
+        "response.key_points[0]": "a",
+        "response.key_points[1]": "b\\c",
+    }
+    assert values == {
+        "response.key_points[2].k[0]": 1,
+        "response.key_points[2].k[1]": 2.5,
+        "response.key_points[2].k[2]": True,
+        "response.key_points[2].k[3]": None,
+        "metadata.confidence": 0.9,
+    }
+
+def test_partial_scanner_streams_text_before_object_closes():
+    scanner = PartialJSONScanner()
+    scanner.feed('{"response": {"main_answer": "第一')
+    assert [e.to_dict() for e in scanner.drain()] == [{"path": "response.main_answer", "op": "text", "value": "第一"}]
+    scanner.feed('句\\')
+    assert [e.value for e in scanner.drain()] == ["句"]
+    scanner.feed('n第二句')
+    assert [e.value for e in scanner.drain()] == ["\n第二句"]
@@ -0,0 +1,46 @@
+import asyncio
+import pytest
+from app.agents.progress import COMPLETED, FIRST_TOKEN, STARTED, StageProgress
+from app.core.streaming import paced
+
+def test_first_token_is_reported_once():
+    progress = StageProgress("intent_analysis")
+    assert progress.started().status == STARTED
+    first = progress.first_token()
+    assert first.status == FIRST_TOKEN and first.stage == "intent_analysis"
+    assert progress.first_token() is None
+    completed = progress.completed()
+    assert completed.status == COMPLETED and completed.elapsed >= first.elapsed
+
+@pytest.mark.asyncio
+async def test_paced_only_fills_missing_interval():
+    loop = asyncio.get_running_loop()
+    stamps = []
+
+    async def source():
+        for i in range(3):
+            if i == 2:
+                await asyncio.sleep(0.06)
+            yield i
+
+    async for _ in paced(source(), 0.05):
+        stamps.append(loop.time())
+    assert stamps[1] - stamps[0] >= 0.045
+    # 生成本身已经超过间隔时不再额外等待
+    assert stamps[2] - stamps[1] < 0.1
+
+@pytest.mark.asyncio
+async def test_paced_closes_source():
+    closed = asyncio.Event()
+
+    async def source():
+        try:
+            while True:
+                yield "event"
+        finally:
+            closed.set()
+
+    stream = paced(source(), 0.0)
+    assert await stream.__anext__() == "event"
+    await stream.aclose()
+    assert closed.is_set()
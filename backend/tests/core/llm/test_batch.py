@@ -0,0 +1,110 @@
+import asyncio
+import pytest
+from app.core.llm.service import LLMService
+
+def _response(text):
+    return {"choices": [{"message": {"content": text}}]}
+
+def _service(handler):
+    service = LLMService(agent="test")
+    service.create_chat_completion = handler
+    return service
+
+@pytest.mark.asyncio
+async def test_batch_yields_as_completed_with_index():
+    """结果按完成顺序产出，index 对应输入位置"""
+    async def handler(messages, delay):
+        await asyncio.sleep(delay)
+        return _response(messages[0]["content"])
+
+    service = _service(handler)
+    requests = [
+        {"messages": [{"role": "user", "content": str(i)}], "delay": delay}
+        for i, delay in enumerate([0.03, 0.01, 0.02])
+    ]
+    results = [r async for r in service.create_chat_completions_batch(requests, concurrency=3)]
+    assert [r.index for r in results] == [1, 2, 0]
+    assert all(r.response["choices"][0]["message"]["content"] == str(r.index) for r in results)
+
+@pytest.mark.asyncio
+async def test_bound_agent_is_passed_per_call():
+    """for_agent 绑定的视图共享同一个服务，每次调用带上自己的 agent"""
+    async def handler(agent=None, **kwargs):
+        return _response(agent)
+
+    service = _service(handler)
+    intent = service.for_agent("intent")
+    results = [r async for r in intent.create_chat_completions_batch([{}, {"agent": "chat"}], ordered=True)]
+    assert [r.response["choices"][0]["message"]["content"] for r in results] == ["intent", "chat"]
+    assert intent.cache_stats() == service.cache_stats()
+
+@pytest.mark.asyncio
+async def test_batch_ordered_preserves_input_order():
+    async def handler(delay):
+        await asyncio.sleep(delay)
+        return _response(str(delay))
+
+    service = _service(handler)
+    requests = [{"delay": d} for d in [0.03, 0.0, 0.02, 0.01]]
+    results = [r async for r in service.create_chat_completions_batch(requests, concurrency=4, ordered=True)]
+    assert [r.index for r in results] == [0, 1, 2, 3]
+
+@pytest.mark.asyncio
+async def test_batch_respects_concurrency():
+    in_flight = 0
+    peak = 0
+
+    async def handler():
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return _response("ok")
+
+    service = _service(handler)
+    results = [r async for r in service.create_chat_completions_batch([{}] * 10, concurrency=3)]
+    assert len(results) == 10
+    assert peak == 3
+
+@pytest.mark.asyncio
+async def test_batch_isolates_errors():
+    """单个请求抛出异常时转换成错误响应，其他请求不受影响"""
+    async def handler(fail):
+        if fail:
+            raise RuntimeError("boom")
+        return _response("ok")
+
+    service = _service(handler)
+    results = [r async for r in service.create_chat_completions_batch(
+        [{"fail": False}, {"fail": True}, {"fail": False}], ordered=True
+    )]
+    assert [r.ok for r in results] == [True, False, True]
+    assert results[1].response == {"error": {"message": "boom", "type": "RuntimeError"}}
+
+@pytest.mark.asyncio
+async def test_batch_cancels_remaining_when_consumer_stops():
+    started = 0
+    cancelled = 0
+
+    async def handler(delay):
+        nonlocal started, cancelled
+        started += 1
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            cancelled += 1
+            raise
+        return _response("ok")
+
+    service = _service(handler)
+    batch = service.create_chat_completions_batch([{"delay": 0}] + [{"delay": 10}] * 5, concurrency=2)
+    first = await batch.__anext__()
+    assert first.index == 0
+    await batch.aclose()
+    assert cancelled == started - 1
+
+@pytest.mark.asyncio
+async def test_empty_batch():
+    service = _service(None)
+    assert [r async for r in service.create_chat_completions_batch([])] == []
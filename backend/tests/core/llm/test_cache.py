@@ -0,0 +1,59 @@
+import pytest
+from app.core.llm.cache import MemoryCacheTier, SQLiteCacheTier, ResponseCache, make_cache_key
+
+MESSAGES = [
+    {"role": "system", "content": "你是一个专业的文本相关性评估助手。"},
+    {"role": "user", "content": "查询文本：AI培训"}
+]
+
+def test_cache_key_is_canonical():
+    """相同参数得到相同的键，任一参数变化都会改变键"""
+    key = make_cache_key("wc_llm", "deepseek-chat", MESSAGES, 0.1, 1.0, None)
+    assert key == make_cache_key("wc_llm", "deepseek-chat", [dict(m) for m in MESSAGES], 0.1, 1.0, None)
+    assert key != make_cache_key("deepseek", "deepseek-chat", MESSAGES, 0.1, 1.0, None)
+    assert key != make_cache_key("wc_llm", "deepseek-chat", MESSAGES, 0.2, 1.0, None)
+    assert key != make_cache_key("wc_llm", "deepseek-chat", MESSAGES, 0.1, 1.0, 100)
+
+def test_memory_tier_lru_eviction():
+    """超过容量时淘汰最久未使用的条目"""
+    tier = MemoryCacheTier(max_entries=2, ttl=60)
+    tier.set("a", {"v": 1})
+    tier.set("b", {"v": 2})
+    assert tier.get("a") == {"v": 1}
+    tier.set("c", {"v": 3})
+    assert tier.get("b") is None
+    assert tier.get("a") == {"v": 1}
+    assert tier.evictions == 1
+
+def test_memory_tier_ttl():
+    """过期条目不会被返回"""
+    tier = MemoryCacheTier(max_entries=2, ttl=-1)
+    tier.set("a", {"v": 1})
+    assert tier.get("a") is None
+    assert tier.expirations == 1
+
+@pytest.mark.asyncio
+async def test_sqlite_tier_survives_restart(tmp_path):
+    """磁盘缓存在新实例中仍可命中，并回填内存缓存"""
+    path = str(tmp_path / "llm_cache.db")
+    cache = ResponseCache(MemoryCacheTier(8, 60), SQLiteCacheTier(path, 60))
+    await cache.set("k", {"choices": [{"message": {"content": "0.8"}}]})
+
+    restarted = ResponseCache(MemoryCacheTier(8, 60), SQLiteCacheTier(path, 60))
+    assert await restarted.get("k") == {"choices": [{"message": {"content": "0.8"}}]}
+    assert await restarted.get("k") is not None
+    assert await restarted.get("missing") is None
+
+    stats = restarted.stats()
+    assert stats["disk_hits"] == 1
+    assert stats["memory_hits"] == 1
+    assert stats["misses"] == 1
+
+@pytest.mark.asyncio
+async def test_cached_value_is_isolated():
+    """调用方修改返回值不会污染缓存"""
+    cache = ResponseCache(MemoryCacheTier(8, 60))
+    await cache.set("k", {"choices": []})
+    value = await cache.get("k")
+    value["choices"].append("x")
+    assert await cache.get("k") == {"choices": []}
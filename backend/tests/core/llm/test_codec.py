@@ -0,0 +1,24 @@
+import json
+from app.core.llm import codec
+from app.core.llm.codec import encode_chat_body, encode_messages, register_static_message
+
+def test_chat_body_round_trips():
+    messages = [{"role": "system", "content": "你是助手"}, {"role": "user", "content": "你好\n\"引号\""}]
+    params = {"model": "deepseek-chat", "stream": True, "max_tokens": None, "stream_options": {"include_usage": True}}
+    assert json.loads(encode_chat_body(messages, params)) == {"messages": messages, **params}
+
+def test_registered_system_prompt_is_encoded_once(monkeypatch):
+    register_static_message("固定的系统提示词")
+    calls = []
+    real_dumps = codec.dumps
+    monkeypatch.setattr(codec, "dumps", lambda obj: calls.append(obj) or real_dumps(obj))
+
+    messages = [{"role": "system", "content": "固定的系统提示词"}, {"role": "user", "content": "问题"}]
+    assert json.loads(encode_messages(messages)) == messages
+    # 只有 user 消息需要序列化
+    assert calls == [messages[1]]
+
+def test_system_message_with_extra_fields_is_not_replaced():
+    register_static_message("带名字的提示词")
+    messages = [{"role": "system", "content": "带名字的提示词", "name": "planner"}]
+    assert json.loads(encode_messages(messages)) == messages
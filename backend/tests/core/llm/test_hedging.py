@@ -0,0 +1,107 @@
+import asyncio
+import pytest
+from app.core.llm.hedging import HedgePolicy, hedged_completion, hedged_stream
+
+OK = {"choices": [{"message": {"content": "ok"}}]}
+
+def test_delay_tracks_percentile():
+    """样本不足时使用最大延迟，之后取分位数并限制在上下界内"""
+    policy = HedgePolicy(percentile=0.9, min_delay=0.1, max_delay=5.0, min_samples=10)
+    assert policy.delay() == 5.0
+    for i in range(1, 11):
+        policy.observe(i * 0.1)
+    assert policy.delay() == pytest.approx(0.9)
+    for _ in range(10):
+        policy.observe(100)
+    assert policy.delay() == 5.0
+
+def test_hedge_rate_is_capped():
+    """对冲次数不超过请求数乘以 max_ratio"""
+    policy = HedgePolicy(max_ratio=0.1)
+    granted = 0
+    for _ in range(100):
+        policy.on_request()
+        granted += policy.try_hedge()
+    assert granted == 10
+
+@pytest.mark.asyncio
+async def test_slow_primary_is_hedged_and_cancelled():
+    """主请求过慢时对冲请求胜出，主请求被取消"""
+    policy = HedgePolicy(max_delay=0.01, max_ratio=1.0)
+    cancelled = asyncio.Event()
+
+    async def slow():
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    async def fast():
+        return OK
+
+    assert await hedged_completion(policy, slow, fast) == OK
+    await asyncio.sleep(0)
+    assert cancelled.is_set()
+    assert policy.hedge_wins == 1
+
+@pytest.mark.asyncio
+async def test_no_hedge_without_budget():
+    """对冲额度用完时只等待主请求"""
+    policy = HedgePolicy(max_delay=0.01, max_ratio=0.0)
+    calls = []
+
+    async def primary():
+        await asyncio.sleep(0.03)
+        return OK
+
+    async def secondary():
+        calls.append(1)
+        return OK
+
+    assert await hedged_completion(policy, primary, secondary) == OK
+    assert calls == []
+
+@pytest.mark.asyncio
+async def test_stream_uses_first_to_produce_a_chunk():
+    """先产出首个数据块的流胜出，另一个流被关闭"""
+    policy = HedgePolicy(max_delay=0.01, max_ratio=1.0)
+    closed = []
+
+    def make(name, delay):
+        async def gen():
+            try:
+                await asyncio.sleep(delay)
+                yield {"name": name, "i": 0}
+                yield {"name": name, "i": 1}
+            finally:
+                closed.append(name)
+        return gen
+
+    received = [chunk async for chunk in hedged_stream(policy, make("slow", 5), make("fast", 0))]
+    assert received == [{"name": "fast", "i": 0}, {"name": "fast", "i": 1}]
+    assert sorted(closed) == ["fast", "slow"]
+
+@pytest.mark.asyncio
+async def test_stream_cancelled_before_first_chunk_closes_upstream():
+    """等待首块时调用方取消，主流也会被关闭"""
+    policy = HedgePolicy(max_delay=5.0, max_ratio=1.0)
+    closed = asyncio.Event()
+
+    async def slow():
+        try:
+            await asyncio.sleep(5)
+            yield OK
+        finally:
+            closed.set()
+
+    async def consume():
+        async for _ in hedged_stream(policy, slow, slow):
+            pass
+
+    task = asyncio.ensure_future(consume())
+    await asyncio.sleep(0.01)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert closed.is_set()
@@ -0,0 +1,40 @@
+import pytest
+from fastapi import FastAPI
+from app import main
+from app.core.llm import http_client
+from app.core.llm.base import LLMProvider
+
+@pytest.fixture(autouse=True)
+async def no_open_clients():
+    await http_client.close_http_clients()
+    yield
+    await http_client.close_http_clients()
+
+@pytest.mark.asyncio
+async def test_open_and_close_share_one_pool_per_provider():
+    await http_client.open_http_clients([LLMProvider.DEEPSEEK], warm=False)
+    client = http_client.get_http_client(LLMProvider.DEEPSEEK)
+    assert http_client.get_http_client(LLMProvider.DEEPSEEK) is client
+    await http_client.close_http_clients()
+    assert client.is_closed
+    assert http_client._clients == {}
+
+@pytest.mark.asyncio
+async def test_lifespan_opens_and_closes_pools(monkeypatch):
+    monkeypatch.setattr(main.settings, "LLM_HTTP_WARMUP", False)
+    app = FastAPI()
+    async with main.lifespan(app):
+        clients = list(http_client._clients.values())
+        assert clients and not any(c.is_closed for c in clients)
+        assert app.state.container is not None
+    assert all(c.is_closed for c in clients)
+    assert http_client._clients == {}
+
+@pytest.mark.asyncio
+async def test_use_before_startup_is_released_on_shutdown():
+    """lifespan 之外（脚本、测试）首次使用时按需创建，关闭时同样释放；关闭后再用会重建"""
+    early = http_client.get_http_client(LLMProvider.WC_LLM)
+    await http_client.close_http_clients()
+    assert early.is_closed
+    rebuilt = http_client.get_http_client(LLMProvider.WC_LLM)
+    assert rebuilt is not early and not rebuilt.is_closed
@@ -0,0 +1,100 @@
+import asyncio
+import time
+import pytest
+from app.core.llm.limiter import (
+    AdaptiveConcurrencyLimit,
+    ProviderRateLimiter,
+    TokenBucket,
+    parse_retry_after,
+)
+
+def test_parse_retry_after():
+    """支持秒数和 HTTP 日期两种格式"""
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after(None) is None
+    assert parse_retry_after("garbage") is None
+    assert parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0
+
+def test_token_bucket_reserves_in_order():
+    """令牌耗尽后按预留顺序计算等待时间"""
+    bucket = TokenBucket(rate=10, capacity=2)
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == 0.0
+    assert bucket.reserve() == pytest.approx(0.1, abs=0.01)
+    assert bucket.reserve() == pytest.approx(0.2, abs=0.01)
+    assert TokenBucket(rate=0, capacity=0).reserve(1000) == 0.0
+
+@pytest.mark.asyncio
+async def test_concurrency_is_bounded():
+    """同时进行的调用数不超过并发上限"""
+    limit = AdaptiveConcurrencyLimit(initial=2, minimum=1, maximum=2)
+    running = 0
+    peak = 0
+
+    async def call():
+        nonlocal running, peak
+        await limit.acquire()
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        limit.release()
+
+    await asyncio.gather(*(call() for _ in range(6)))
+    assert peak == 2
+    assert limit.in_flight == 0
+
+def test_aimd_shrinks_and_recovers():
+    """过载时乘性收缩，成功时加性恢复"""
+    limit = AdaptiveConcurrencyLimit(initial=8, minimum=1, maximum=8)
+    limit.on_overload()
+    assert limit.limit == 4
+    for _ in range(4):
+        limit.on_success()
+    assert limit.limit == pytest.approx(5, abs=0.1)
+
+@pytest.mark.asyncio
+async def test_429_honours_retry_after():
+    """429 收缩并发，并在 Retry-After 期间暂停新请求"""
+    limiter = ProviderRateLimiter("test", max_rps=0, max_tpm=0, max_concurrency=4)
+    async with limiter.slot() as slot:
+        slot.fail(429, "0.05")
+    assert limiter.concurrency.limit == 2
+    assert limiter.throttled == 1
+
+    start = time.monotonic()
+    async with limiter.slot():
+        pass
+    assert time.monotonic() - start >= 0.04
+    assert limiter.stats()["queue_wait_count"] == 2
+
+@pytest.mark.asyncio
+async def test_stream_closed_early_is_not_a_failure():
+    """调用方拿到结果后提前关闭流，按成功释放名额；上游响应之前被取消则不调整上限"""
+    limiter = ProviderRateLimiter("test", max_rps=0, max_tpm=0, max_concurrency=8)
+    limiter.concurrency.limit = 4
+
+    async def stream(respond):
+        async with limiter.slot() as slot:
+            if respond:
+                slot.respond()
+            else:
+                await asyncio.sleep(1)  # 等待上游响应时被取消
+            while True:
+                yield "chunk"
+                await asyncio.sleep(0)
+
+    for _ in range(4):
+        gen = stream(respond=True)
+        await gen.__anext__()
+        await gen.aclose()
+    assert limiter.concurrency.limit == pytest.approx(5, abs=0.1)
+
+    task = asyncio.ensure_future(stream(respond=False).__anext__())
+    await asyncio.sleep(0)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    assert limiter.concurrency.limit == pytest.approx(5, abs=0.1)
+    assert limiter.concurrency.in_flight == 0
+    assert limiter.throttled == 0
@@ -0,0 +1,57 @@
+from app.core.llm.prompt_budget import (
+    apply_budget,
+    estimate_messages_tokens,
+    estimate_tokens,
+    get_budget_stats,
+    trim_messages,
+    truncate_text,
+)
+
+def test_estimate_tokens_is_cjk_aware():
+    """中文按约 0.6 token/字，英文按约 0.3 token/字符估算"""
+    assert estimate_tokens("") == 0
+    assert estimate_tokens("时间管理" * 10) == 24
+    assert estimate_tokens("a" * 100) == 30
+
+def test_truncate_text_respects_budget():
+    text = "课程内容" * 1000
+    truncated = truncate_text(text, 200)
+    assert estimate_tokens(truncated) <= 200
+    assert truncated.endswith("（内容过长，已截断）")
+    assert truncate_text("短文本", 200) == "短文本"
+
+def test_trim_drops_oldest_history_first():
+    """保留系统消息和最新一条消息，先丢弃最早的历史"""
+    messages = [
+        {"role": "system", "content": "系统提示"},
+        {"role": "user", "content": "旧问题" * 200},
+        {"role": "assistant", "content": "旧回答" * 200},
+        {"role": "user", "content": "新问题"},
+    ]
+    trimmed = trim_messages(messages, 400)
+    assert [m["content"] for m in trimmed] == ["系统提示", "旧回答" * 200, "新问题"]
+    assert len(messages) == 4
+
+def test_trim_truncates_single_oversized_message():
+    messages = [{"role": "system", "content": "系统提示"}, {"role": "user", "content": "文档" * 5000}]
+    trimmed = trim_messages(messages, 1000)
+    assert estimate_messages_tokens(trimmed) <= 1000
+    assert trimmed[0] == messages[0]
+
+def test_trim_never_truncates_system_prompt():
+    """系统提示词最长时也只截断最后一条用户消息"""
+    system = "请严格按 JSON 格式返回：" + "格式要求" * 300
+    messages = [{"role": "system", "content": system}, {"role": "user", "content": "问题" * 200}]
+    trimmed = trim_messages(messages, estimate_messages_tokens(messages) - 100)
+    assert trimmed[0]["content"] == system
+    assert trimmed[1]["content"].endswith("（内容过长，已截断）")
+    assert estimate_messages_tokens(trimmed) <= estimate_messages_tokens(messages) - 100
+
+def test_apply_budget_sets_max_tokens_and_records_savings():
+    messages = [{"role": "user", "content": "问题" * 5000}]
+    trimmed, max_tokens = apply_budget("intent", messages, None)
+    assert max_tokens == 1024
+    assert apply_budget("intent", messages, 64)[1] == 64
+    stats = get_budget_stats()["intent"]
+    assert stats["trimmed"] == 2
+    assert stats["tokens_saved"] > 0
@@ -0,0 +1,53 @@
+import pytest
+from app.core.llm import prompts
+from app.core.llm.prompts import PromptRegistry, parse_prompt_cache_usage, record_prompt_cache, get_prompt_cache_stats
+
+def test_register_is_idempotent_for_identical_text():
+    registry = PromptRegistry()
+    first = registry.register("intent", "v1", "系统提示词")
+    assert registry.register("intent", "v1", "系统提示词") is first
+    assert registry.get("intent") is first
+
+def test_changed_text_requires_new_version():
+    registry = PromptRegistry()
+    registry.register("intent", "v1", "系统提示词")
+    with pytest.raises(ValueError):
+        registry.register("intent", "v1", "系统提示词（修改后）")
+    v2 = registry.register("intent", "v2", "系统提示词（修改后）")
+    assert registry.get("intent") is v2
+    assert registry.get("intent", "v1").system == "系统提示词"
+    assert registry.versions()["intent"] == {"version": "v2", "fingerprint": v2.fingerprint}
+
+def test_fingerprint_tracks_content():
+    registry = PromptRegistry()
+    a = registry.register("a", "v1", "相同内容")
+    b = registry.register("b", "v1", "相同内容")
+    c = registry.register("c", "v1", "不同内容")
+    assert a.fingerprint == b.fingerprint != c.fingerprint
+    with pytest.raises(KeyError):
+        registry.get("missing")
+
+def test_parse_deepseek_usage():
+    usage = {"prompt_tokens": 1000, "prompt_cache_hit_tokens": 768, "prompt_cache_miss_tokens": 232}
+    assert parse_prompt_cache_usage(usage) == (1000, 768)
+    assert parse_prompt_cache_usage({"prompt_cache_hit_tokens": 64, "prompt_cache_miss_tokens": 36}) == (100, 64)
+
+def test_parse_openai_usage():
+    usage = {"prompt_tokens": 2000, "prompt_tokens_details": {"cached_tokens": 1024}}
+    assert parse_prompt_cache_usage(usage) == (2000, 1024)
+
+def test_parse_usage_without_cache_fields():
+    assert parse_prompt_cache_usage({"prompt_tokens": 10, "completion_tokens": 5}) is None
+    assert parse_prompt_cache_usage({"prompt_tokens": 10, "prompt_tokens_details": None}) is None
+    assert parse_prompt_cache_usage(None) is None
+
+def test_hit_ratio_per_agent(monkeypatch):
+    monkeypatch.setattr(prompts, "_stats", type(prompts._stats)(prompts._stats.default_factory))
+    record_prompt_cache("intent", {"prompt_tokens": 100, "prompt_cache_hit_tokens": 0})
+    record_prompt_cache("intent", {"prompt_tokens": 100, "prompt_cache_hit_tokens": 64})
+    record_prompt_cache("intent", {"prompt_tokens": 100})
+    stats = get_prompt_cache_stats()
+    assert stats["intent"]["responses"] == 2
+    assert stats["intent"]["prompt_tokens"] == 200
+    assert stats["intent"]["cached_tokens"] == 64
+    assert stats["intent"]["hit_ratio"] == pytest.approx(0.32)
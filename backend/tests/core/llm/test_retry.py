@@ -0,0 +1,84 @@
+import pytest
+from app.core.llm.retry import RetryPolicy, complete_with_retry, stream_with_retry, get_retry_stats
+
+FAST = RetryPolicy(max_attempts=3, base_delay=0.001, max_delay=0.002, max_elapsed=5)
+BAD_GATEWAY = {"error": {"message": "502 Bad Gateway", "type": "http_error", "status_code": 502}}
+
+def test_retryable_errors():
+    """只重试网络错误、429 和 5xx"""
+    assert FAST.is_retryable(BAD_GATEWAY)
+    assert FAST.is_retryable({"error": {"type": "request_error"}})
+    assert not FAST.is_retryable({"error": {"type": "http_error", "status_code": 400}})
+    assert not FAST.is_retryable({"choices": []})
+
+@pytest.mark.asyncio
+async def test_transient_error_is_retried():
+    """一次 502 之后成功返回"""
+    responses = [BAD_GATEWAY, {"choices": [{"message": {"content": "ok"}}]}]
+
+    async def attempt():
+        return responses.pop(0)
+
+    result = await complete_with_retry(FAST, "retry-test", attempt)
+    assert result["choices"][0]["message"]["content"] == "ok"
+    assert get_retry_stats()["retry-test"] == {"retry": 1, "success_after_retry": 1}
+
+@pytest.mark.asyncio
+async def test_gives_up_after_max_attempts():
+    """超过最大次数后返回最后一次的错误"""
+    calls = 0
+
+    async def attempt():
+        nonlocal calls
+        calls += 1
+        return BAD_GATEWAY
+
+    assert await complete_with_retry(FAST, "retry-exhausted", attempt) == BAD_GATEWAY
+    assert calls == 3
+
+@pytest.mark.asyncio
+async def test_retry_after_beyond_deadline_is_not_waited():
+    """Retry-After 超出截止时间时直接放弃"""
+    policy = RetryPolicy(max_attempts=3, base_delay=0.001, max_delay=0.002, max_elapsed=0.5)
+    throttled = {"error": {"type": "http_error", "status_code": 429, "retry_after": "60"}}
+    calls = 0
+
+    async def attempt():
+        nonlocal calls
+        calls += 1
+        return throttled
+
+    assert await complete_with_retry(policy, "retry-deadline", attempt) == throttled
+    assert calls == 1
+
+@pytest.mark.asyncio
+async def test_stream_retried_only_before_first_token():
+    """流在输出第一个数据块之前失败才重试，之后的错误直接交给调用方"""
+    attempts = [
+        [BAD_GATEWAY],
+        [{"choices": [{"delta": {"content": "a"}}]}, BAD_GATEWAY],
+    ]
+
+    def open_stream():
+        chunks = attempts.pop(0)
+
+        async def gen():
+            for chunk in chunks:
+                yield chunk
+        return gen()
+
+    received = [chunk async for chunk in stream_with_retry(FAST, "retry-stream", open_stream)]
+    assert received == [{"choices": [{"delta": {"content": "a"}}]}, BAD_GATEWAY]
+    assert attempts == []
+
+@pytest.mark.asyncio
+async def test_mid_stream_failure_is_not_counted_as_success():
+    def open_stream():
+        async def gen():
+            yield {"choices": [{"delta": {"content": "a"}}]}
+            yield BAD_GATEWAY
+        return gen()
+
+    received = [chunk async for chunk in stream_with_retry(FAST, "retry-mid-stream", open_stream)]
+    assert received[-1] == BAD_GATEWAY
+    assert get_retry_stats()["retry-mid-stream"] == {"failure_mid_stream": 1}
@@ -0,0 +1,93 @@
+import asyncio
+import pytest
+from app.core.llm.base import BaseLLMClient, LLMClientFactory, LLMProvider
+from app.core.llm.router import RoutingLLMClient, parse_agent_providers
+
+OK = {"choices": [{"message": {"content": "ok"}}]}
+UNAVAILABLE = {"error": {"message": "503", "type": "http_error", "status_code": 503}}
+BAD_REQUEST = {"error": {"message": "400", "type": "http_error", "status_code": 400}}
+
+class FakeClient(BaseLLMClient):
+    def __init__(self, response, delay=0.0, chunks=None):
+        self.response = response
+        self.delay = delay
+        self.chunks = chunks or []
+        self.calls = 0
+
+    async def create_chat_completion(self, messages, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        return self.response
+
+    async def create_chat_completion_stream(self, messages, **kwargs):
+        self.calls += 1
+        for chunk in self.chunks:
+            yield chunk
+
+def make_router(deepseek, wc_llm, preferred=None):
+    clients = {LLMProvider.DEEPSEEK: deepseek, LLMProvider.WC_LLM: wc_llm}
+    return RoutingLLMClient([LLMProvider.DEEPSEEK, LLMProvider.WC_LLM], preferred, clients=clients)
+
+def test_parse_agent_providers():
+    assert parse_agent_providers("intent:deepseek, chat:WC_LLM,bogus") == {
+        "intent": LLMProvider.DEEPSEEK,
+        "chat": LLMProvider.WC_LLM,
+    }
+
+@pytest.mark.asyncio
+async def test_fails_over_and_learns():
+    """失败的提供商被跳过，错误率上升后排到后面"""
+    deepseek, wc_llm = FakeClient(UNAVAILABLE), FakeClient(OK)
+    router = make_router(deepseek, wc_llm)
+    assert await router.create_chat_completion([]) == OK
+    assert router.health[LLMProvider.DEEPSEEK].error_rate > 0
+    assert router.candidates()[0] == LLMProvider.WC_LLM
+
+@pytest.mark.asyncio
+async def test_annotates_serving_provider():
+    """响应和数据块上标注实际处理请求的提供商，供指标打标签"""
+    chunk = {"choices": [{"delta": {"content": "a"}}]}
+    router = make_router(FakeClient(dict(UNAVAILABLE), chunks=[dict(UNAVAILABLE)]), FakeClient(dict(OK), chunks=[chunk]))
+    assert (await router.create_chat_completion([]))["provider"] == "wc_llm"
+    assert [c["provider"] async for c in router.create_chat_completion_stream([])] == ["wc_llm"]
+
+@pytest.mark.asyncio
+async def test_client_error_does_not_fail_over():
+    """400 是请求本身的问题，不切换提供商"""
+    deepseek, wc_llm = FakeClient(BAD_REQUEST), FakeClient(OK)
+    router = make_router(deepseek, wc_llm)
+    assert await router.create_chat_completion([]) == BAD_REQUEST
+    assert wc_llm.calls == 0
+
+@pytest.mark.asyncio
+async def test_agent_preference_shares_health():
+    """agent 偏好改变尝试顺序，但健康状态在各 agent 之间共享"""
+    router = make_router(FakeClient(OK), FakeClient(OK))
+    preferred = router.for_agent(LLMProvider.WC_LLM)
+    assert preferred.candidates()[0] == LLMProvider.WC_LLM
+    assert preferred.health is router.health
+
+@pytest.mark.asyncio
+async def test_stream_fails_over_before_first_chunk():
+    """首个数据块就是错误时切换提供商"""
+    chunk = {"choices": [{"delta": {"content": "a"}}]}
+    router = make_router(FakeClient(None, chunks=[UNAVAILABLE]), FakeClient(None, chunks=[chunk]))
+    assert [c async for c in router.create_chat_completion_stream([])] == [chunk]
+    assert all(h.in_flight == 0 for h in router.health.values())
+
+@pytest.mark.asyncio
+async def test_stream_counts_in_flight_until_closed():
+    """流式请求在读完之前一直计入负载"""
+    chunks = [{"choices": [{"delta": {"content": c}}]} for c in "ab"]
+    router = make_router(FakeClient(None, chunks=chunks), FakeClient(None, chunks=chunks))
+    stream = router.create_chat_completion_stream([])
+    await stream.__anext__()
+    assert sum(h.in_flight for h in router.health.values()) == 1
+    await stream.aclose()
+    assert all(h.in_flight == 0 for h in router.health.values())
+
+def test_routed_clients_do_not_retry_internally():
+    """重试交给提供商之间的切换，内层客户端只尝试一次"""
+    router = RoutingLLMClient([LLMProvider.DEEPSEEK])
+    assert router.client_for(LLMProvider.DEEPSEEK).retry_policy.max_attempts == 1
+    assert router.client_for(LLMProvider.DEEPSEEK) is not LLMClientFactory.get_client(LLMProvider.DEEPSEEK)
@@ -0,0 +1,85 @@
+import asyncio
+import pytest
+from app.core.llm.singleflight import SingleFlight, StreamFanout
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_calls_share_one_upstream():
+    """并发的相同请求只触发一次上游调用"""
+    flight = SingleFlight()
+    calls = 0
+
+    async def upstream():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return {"choices": [{"message": {"content": "0.9"}}]}
+
+    results = await asyncio.gather(*(flight.do("k", upstream) for _ in range(5)))
+    assert calls == 1
+    assert all(r == results[0] for r in results)
+    # 每个调用方拿到独立的对象
+    assert len({id(r) for r in results}) == 5
+    assert flight.stats() == {"executed": 1, "coalesced": 4, "in_flight": 0}
+
+@pytest.mark.asyncio
+async def test_sequential_calls_are_not_coalesced():
+    """已经完成的请求不会被复用"""
+    flight = SingleFlight()
+    calls = 0
+
+    async def upstream():
+        nonlocal calls
+        calls += 1
+        return calls
+
+    assert await flight.do("k", upstream) == 1
+    assert await flight.do("k", upstream) == 2
+
+@pytest.mark.asyncio
+async def test_stream_fanout_replays_to_late_subscribers():
+    """后加入的订阅者也能收到完整的流"""
+    fanout = StreamFanout()
+    opened = 0
+    gate = asyncio.Event()
+
+    async def upstream():
+        nonlocal opened
+        opened += 1
+        yield "a"
+        await gate.wait()
+        yield "b"
+        yield "c"
+
+    async def consume():
+        return [chunk async for chunk in fanout.subscribe("k", upstream)]
+
+    first = asyncio.ensure_future(consume())
+    await asyncio.sleep(0)
+    await asyncio.sleep(0)
+    second = asyncio.ensure_future(consume())
+    await asyncio.sleep(0)
+    gate.set()
+
+    assert await first == ["a", "b", "c"]
+    assert await second == ["a", "b", "c"]
+    assert opened == 1
+
+@pytest.mark.asyncio
+async def test_stream_fanout_cancels_upstream_when_all_subscribers_leave():
+    """所有订阅者离开后关闭上游流"""
+    fanout = StreamFanout()
+    closed = asyncio.Event()
+
+    async def upstream():
+        try:
+            yield "a"
+            await asyncio.sleep(10)
+            yield "b"
+        finally:
+            closed.set()
+
+    stream = fanout.subscribe("k", upstream)
+    assert await stream.__anext__() == "a"
+    await stream.aclose()
+    await asyncio.wait_for(closed.wait(), 1)
+    assert fanout.stats()["in_flight"] == 0
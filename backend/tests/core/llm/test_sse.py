@@ -0,0 +1,48 @@
+import pytest
+from app.core.llm.sse import ChatDelta, SSEDecoder, iter_chat_deltas
+
+def test_events_split_across_chunks():
+    """事件可以在任意字节处被切开"""
+    decoder = SSEDecoder()
+    payload = b'data: {"a": 1}\n\ndata: {"b": 2}\n\n'
+    events = []
+    for i in range(len(payload)):
+        events.extend(decoder.feed(payload[i:i + 1]))
+    assert [e.data for e in events] == [b'{"a": 1}', b'{"b": 2}']
+
+def test_multiline_data_comments_and_crlf():
+    decoder = SSEDecoder()
+    events = decoder.feed(b": keep-alive\r\n\r\nevent: message\r\ndata: line1\r\ndata:line2\r")
+    events += decoder.feed(b"\n\r\n")
+    assert len(events) == 1
+    assert events[0].data == b"line1\nline2"
+    assert events[0].event == "message"
+
+def test_flush_returns_unterminated_event():
+    decoder = SSEDecoder()
+    assert decoder.feed(b"data: tail") == []
+    assert [e.data for e in decoder.flush()] == [b"tail"]
+
+def test_chat_delta_to_chunk():
+    delta = ChatDelta.from_payload({
+        "id": "x", "model": "m",
+        "choices": [{"index": 0, "delta": {"content": "你好"}, "finish_reason": None}],
+    })
+    assert delta.content == "你好"
+    assert delta.to_chunk() == {"choices": [{"delta": {"content": "你好"}, "finish_reason": None}]}
+    assert ChatDelta.from_payload({"error": {"message": "boom"}}).to_chunk() == {"error": {"message": "boom"}}
+
+@pytest.mark.asyncio
+async def test_iter_chat_deltas_stops_at_done():
+    async def chunks():
+        yield b'data: {"choices": [{"delta": {"content": "a"}}]}\n\ndata: not json\n\n'
+        yield b'data: {"choices": [{"delta": {"content": "b"}}]}\n\ndata: [DONE]\n\n'
+        yield b'data: {"choices": [{"delta": {"content": "ignored"}}]}\n\n'
+
+    assert [d.content async for d in iter_chat_deltas(chunks())] == ["a", "b"]
+
+def test_crlf_split_between_chunks():
+    """\r 和 \n 分别落在两个数据块中"""
+    decoder = SSEDecoder()
+    assert decoder.feed(b"data: a\r\n\r") == []
+    assert [e.data for e in decoder.feed(b"\ndata: b\n\n")] == [b"a", b"b"]
@@ -0,0 +1,78 @@
+import json
+import os
+import threading
+import time
+from app.core.metrics import (
+    Counter, Histogram, REGISTRY, _merge, _read_snapshots, remove_snapshot, render, write_snapshot
+)
+
+requests_total = Counter("test_requests_total", "测试计数器", ("route",))
+latency = Histogram("test_latency_seconds", "测试直方图", buckets=(0.1, 1.0))
+
+def test_render_counter_and_histogram():
+    requests_total.labels("/a").inc()
+    requests_total.labels("/a").inc(2)
+    latency.observe(0.05)
+    latency.observe(0.5)
+    latency.observe(5)
+    text = render(REGISTRY.snapshot())
+    assert "# TYPE test_requests_total counter" in text
+    assert 'test_requests_total{route="/a"} 3.0' in text
+    assert 'test_latency_seconds_bucket{le="0.1"} 1' in text
+    assert 'test_latency_seconds_bucket{le="1.0"} 2' in text
+    assert 'test_latency_seconds_bucket{le="+Inf"} 3' in text
+    assert "test_latency_seconds_count 3" in text
+
+def test_thread_safe_histogram_counts_every_observation():
+    """工作线程并发记录时不丢计数"""
+    histogram = Histogram("test_threaded_seconds", "线程安全直方图", ("worker",), thread_safe=True)
+
+    def observe():
+        for _ in range(2000):
+            histogram.labels("a").observe(0.01)
+
+    threads = [threading.Thread(target=observe) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert 'test_threaded_seconds_count{worker="a"} 8000' in render(REGISTRY.snapshot())
+
+def test_label_values_are_escaped():
+    requests_total.labels('say "hi"\n').inc()
+    assert 'route="say \\"hi\\"\\n"' in render(REGISTRY.snapshot())
+
+def test_merge_sums_worker_snapshots(tmp_path):
+    """多 worker 的快照按标签相加"""
+    write_snapshot(str(tmp_path))
+    own = json.loads(next(tmp_path.glob("*.json")).read_text())
+    merged = _merge([(1, own), (2, own)])
+    counter = merged["test_requests_total"]["samples"][("/a",)]
+    assert counter == 2 * dict((tuple(k), v) for k, v in own["test_requests_total"]["samples"])[("/a",)]
+    counts, total, count = merged["test_latency_seconds"]["samples"][()]
+    assert count == 2 * own["test_latency_seconds"]["samples"][0][1][2]
+
+def test_gauges_are_reported_per_worker():
+    gauge = {"kind": "gauge", "help": "并发上限", "labelnames": ["provider"], "samples": [[["openai"], 8]]}
+    merged = _merge([(1, {"limit": gauge}), (2, {"limit": gauge})])
+    assert merged["limit"]["samples"] == {("openai", "1"): 8, ("openai", "2"): 8}
+    assert 'limit{provider="openai",pid="2"} 8.0' in render(merged)
+
+def test_dead_and_stale_snapshots_are_skipped(tmp_path):
+    write_snapshot(str(tmp_path))
+    own = next(tmp_path.glob("*.json")).read_text()
+    live = tmp_path / f"metrics-{os.getppid()}.json"
+    live.write_text(own)
+    (tmp_path / "metrics-1.json.tmp").write_text(own)
+    dead = tmp_path / "metrics-999999999.json"
+    dead.write_text(own)
+    assert [pid for pid, _ in _read_snapshots(str(tmp_path), max_age=60)] == [os.getppid()]
+    old = time.time() - 120
+    os.utime(live, (old, old))
+    assert _read_snapshots(str(tmp_path), max_age=60) == []
+
+def test_remove_snapshot_on_shutdown(tmp_path):
+    write_snapshot(str(tmp_path))
+    remove_snapshot(str(tmp_path))
+    remove_snapshot(str(tmp_path))
+    assert list(tmp_path.glob("*.json")) == []
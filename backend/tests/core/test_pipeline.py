@@ -0,0 +1,53 @@
+import asyncio
+import time
+import pytest
+from app.core.pipeline import run_concurrently
+
+def _stage(items, delay):
+    async def stage():
+        for item in items:
+            await asyncio.sleep(delay)
+            yield item
+    return stage
+
+@pytest.mark.asyncio
+async def test_stages_run_concurrently_and_events_are_tagged():
+    start = time.perf_counter()
+    events = [e async for e in run_concurrently({
+        "a": _stage(["a1", "a2"], 0.05),
+        "b": _stage(["b1", "b2"], 0.05),
+    })]
+    # 总耗时约等于最慢的阶段，而不是各阶段之和
+    assert time.perf_counter() - start < 0.18
+    assert sorted((e.stage, e.item) for e in events) == [("a", "a1"), ("a", "a2"), ("b", "b1"), ("b", "b2")]
+    assert [e.item for e in events if e.stage == "a"] == ["a1", "a2"]
+
+@pytest.mark.asyncio
+async def test_failed_stage_does_not_abort_siblings():
+    async def broken():
+        yield "partial"
+        raise ValueError("boom")
+
+    events = [e async for e in run_concurrently({"broken": broken, "ok": _stage(["done"], 0.02)})]
+    failures = [e for e in events if e.failed]
+    assert [(e.stage, str(e.error)) for e in failures] == [("broken", "boom")]
+    assert ("ok", "done") in [(e.stage, e.item) for e in events]
+    assert ("broken", "partial") in [(e.stage, e.item) for e in events]
+
+@pytest.mark.asyncio
+async def test_closing_consumer_cancels_running_stages():
+    closed = asyncio.Event()
+
+    async def slow():
+        try:
+            yield "first"
+            await asyncio.sleep(30)
+            yield "never"
+        finally:
+            closed.set()
+
+    stream = run_concurrently({"slow": slow})
+    event = await stream.__anext__()
+    assert event.item == "first"
+    await asyncio.wait_for(stream.aclose(), 1)
+    assert closed.is_set()
@@ -0,0 +1,108 @@
+import math
+import pytest
+from app.core.semantic_cache import SemanticCache
+from app.core.vector_store.qdrant import VectorQueryResult
+
+class FakeStore:
+    """按 filter_json 中的目录版本和写入时间过滤的内存向量库"""
+    def __init__(self):
+        self.nodes = []
+        self.collection_size = None
+        self.deleted_filters = []
+
+    def ensure_collection(self, vector_size):
+        self.collection_size = vector_size
+
+    def add(self, nodes):
+        self.nodes.extend(nodes)
+        return [node.id for node in nodes]
+
+    def delete_where(self, filter_json):
+        self.deleted_filters.append(filter_json)
+
+    def query(self, query):
+        must = {c["key"]: c for c in query.filter_json["must"]}
+        version = must["catalog_version"]["match"]["value"]
+        cutoff = must["created_at"]["range"]["gte"]
+        live = [
+            n for n in self.nodes
+            if n.metadata["catalog_version"] == version and n.metadata["created_at"] >= cutoff
+        ]
+        scored = sorted(((_cosine(query.query_embedding, n.embedding), n) for n in live), key=lambda x: -x[0])
+        scored = scored[:query.similarity_top_k]
+        return VectorQueryResult(nodes=[n for _, n in scored], similarities=[s for s, _ in scored])
+
+def _cosine(a, b):
+    dot = sum(x * y for x, y in zip(a, b))
+    return dot / (math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b)))
+
+VECTORS = {
+    "如何做好时间管理": [1.0, 0.0, 0.0],
+    "怎样管理好时间": [0.98, 0.2, 0.0],
+    "如何写周报": [0.0, 1.0, 0.0],
+}
+
+async def fake_embed(text):
+    return VECTORS[text]
+
+RESPONSE = {"chat_response": {"answer": "a"}, "course_recommendation": {"type": "course_recommendation", "data": {}}}
+
+def _cache(ttl=3600):
+    return SemanticCache(FakeStore(), fake_embed, threshold=0.9, ttl=ttl)
+
+@pytest.mark.asyncio
+async def test_miss_then_hit_for_similar_question():
+    cache = _cache()
+    lookup = await cache.lookup("如何做好时间管理", "v1")
+    assert not lookup.hit
+    assert cache.store.collection_size == 3
+
+    cache.store_later(lookup, "如何做好时间管理", "v1", RESPONSE)
+    await cache.drain()
+
+    similar = await cache.lookup("怎样管理好时间", "v1")
+    assert similar.hit
+    assert similar.response == RESPONSE
+    assert similar.similarity >= 0.9
+
+    assert not (await cache.lookup("如何写周报", "v1")).hit
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 2
+
+@pytest.mark.asyncio
+async def test_catalog_change_invalidates_and_purges():
+    cache = _cache()
+    lookup = await cache.lookup("如何做好时间管理", "v1")
+    cache.store_later(lookup, "如何做好时间管理", "v1", RESPONSE)
+    await cache.drain()
+
+    assert not (await cache.lookup("如何做好时间管理", "v2")).hit
+
+    lookup = await cache.lookup("如何写周报", "v2")
+    cache.store_later(lookup, "如何写周报", "v2", RESPONSE)
+    await cache.drain()
+    # 目录版本变化后的首次写入会清理其他版本和过期的条目
+    assert len(cache.store.deleted_filters) == 2
+
+@pytest.mark.asyncio
+async def test_expired_entries_do_not_hit():
+    cache = _cache(ttl=0)
+    lookup = await cache.lookup("如何做好时间管理", "v1")
+    cache.store_later(lookup, "如何做好时间管理", "v1", RESPONSE)
+    await cache.drain()
+    cache.store.nodes[0].metadata["created_at"] -= 1
+    assert not (await cache.lookup("如何做好时间管理", "v1")).hit
+
+@pytest.mark.asyncio
+async def test_embedding_failure_is_a_miss_without_write_back():
+    async def broken_embed(text):
+        raise RuntimeError("embedding service down")
+
+    cache = SemanticCache(FakeStore(), broken_embed, threshold=0.9, ttl=3600)
+    lookup = await cache.lookup("如何做好时间管理", "v1")
+    assert not lookup.hit
+    assert lookup.embedding is None
+    cache.store_later(lookup, "如何做好时间管理", "v1", RESPONSE)
+    await cache.drain()
+    assert cache.store.nodes == []
+    assert cache.stats()["errors"] == 1
@@ -0,0 +1,87 @@
+import asyncio
+import pytest
+from starlette.requests import Request
+from app.agents.base_agent import BaseAgent
+from app.core.streaming import stream_until_disconnect
+
+def _request(disconnected: asyncio.Event) -> Request:
+    async def receive():
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+    return Request({"type": "http", "method": "GET", "headers": []}, receive)
+
+@pytest.mark.asyncio
+async def test_forwards_all_items_until_source_ends():
+    async def source():
+        for i in range(3):
+            yield i
+
+    stream = stream_until_disconnect(_request(asyncio.Event()), source(), "test")
+    assert [item async for item in stream] == [0, 1, 2]
+
+@pytest.mark.asyncio
+async def test_disconnect_cancels_pending_upstream_read():
+    """客户端断开时，正在等待上游的读取被取消，上游流的 finally 立即执行"""
+    disconnected = asyncio.Event()
+    closed = asyncio.Event()
+
+    async def source():
+        try:
+            yield "first"
+            await asyncio.sleep(30)
+            yield "never"
+        finally:
+            closed.set()
+
+    received = []
+
+    async def consume():
+        async for item in stream_until_disconnect(_request(disconnected), source(), "test"):
+            received.append(item)
+
+    task = asyncio.ensure_future(consume())
+    await asyncio.sleep(0.01)
+    disconnected.set()
+    await asyncio.wait_for(task, 1)
+    assert received == ["first"]
+    assert closed.is_set()
+
+@pytest.mark.asyncio
+async def test_closing_wrapper_closes_source():
+    closed = asyncio.Event()
+
+    async def source():
+        try:
+            while True:
+                yield "chunk"
+        finally:
+            closed.set()
+
+    stream = stream_until_disconnect(_request(asyncio.Event()), source(), "test")
+    assert await stream.__anext__() == "chunk"
+    await stream.aclose()
+    assert closed.is_set()
+
+class _FakeLLMService:
+    def __init__(self, pieces):
+        self.pieces = pieces
+        self.read = 0
+        self.closed = False
+
+    async def create_chat_completion_stream(self, **kwargs):
+        try:
+            for piece in self.pieces:
+                self.read += 1
+                yield {"choices": [{"delta": {"content": piece}}]}
+        finally:
+            self.closed = True
+
+@pytest.mark.asyncio
+async def test_agent_stops_reading_after_complete_json():
+    """解析出完整的 JSON 后不再读取上游剩余的输出"""
+    agent = BaseAgent()
+    agent.llm_service = _FakeLLMService(['{"a": ', '1}', " 多余的输出"] + ["..."] * 50)
+    results = [r async for r in agent._handle_stream_response([]) if isinstance(r, dict)]
+    assert results == [{"a": 1}]
+    assert agent.llm_service.read == 2
+    assert agent.llm_service.closed
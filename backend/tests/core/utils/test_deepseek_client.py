@@ -86,4 +86,26 @@ async def test_deepseek_chat_completion_with_system_prompt():
         print("==============================\n")
         
     except Exception as e:
-        pytest.fail(f"DeepSeek API 系统提示词测试失败: {str(e)}") 
\ No newline at end of file
+        pytest.fail(f"DeepSeek API 系统提示词测试失败: {str(e)}") 
+@pytest.mark.asyncio
+async def test_mid_stream_error_is_reported_to_limiter_as_failure(monkeypatch):
+    """流中途的错误事件按失败反馈给限流器，并发上限不会因此增长"""
+    import httpx
+    from app.core.llm import http_client
+    from app.core.llm.base import LLMProvider
+    from app.core.llm.retry import RetryPolicy
+
+    body = (
+        'data: {"choices": [{"delta": {"content": "你好"}}]}\n\n'
+        'data: {"error": {"message": "upstream overloaded"}}\n\n'
+    ).encode("utf-8")
+    transport = httpx.MockTransport(lambda request: httpx.Response(200, content=body))
+    monkeypatch.setitem(http_client._clients, LLMProvider.DEEPSEEK, httpx.AsyncClient(transport=transport))
+    client = DeepSeekClient()
+    client.retry_policy = RetryPolicy(max_attempts=1)
+    slots = []
+    monkeypatch.setattr(client.limiter, "release", slots.append)
+
+    chunks = [chunk async for chunk in client.create_chat_completion_stream([{"role": "user", "content": "你好"}])]
+    assert "error" in chunks[-1]
+    assert len(slots) == 1 and slots[0].failed
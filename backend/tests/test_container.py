@@ -0,0 +1,48 @@
+import dataclasses
+import pytest
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+from app.api.routes import get_ai_response_agent, get_llm_agent
+from app.container import AppContainer, get_container
+
+def test_create_shares_one_service_per_provider():
+    container = AppContainer.create()
+    (service,) = container.llm_services.values()
+    bound = {
+        "intent": container.llm_agent.intent_agent.llm_service,
+        "chat": container.llm_agent.chat_agent.llm_service,
+        "ai_response": container.ai_response_agent.llm_service,
+        "course_recommendation": container.course_recommendation_agent.llm_service,
+    }
+    for agent, llm_service in bound.items():
+        assert llm_service.service is service
+        assert llm_service.agent == agent
+
+def _app(container):
+    app = FastAPI()
+    app.state.container = container
+
+    @app.get("/agents")
+    def agents(ai_response_agent=Depends(get_ai_response_agent), llm_agent=Depends(get_llm_agent)):
+        return {"ai_response": id(ai_response_agent), "llm": id(llm_agent)}
+
+    return app
+
+def test_requests_share_container_instances():
+    container = AppContainer.create()
+    client = TestClient(_app(container))
+    first, second = client.get("/agents").json(), client.get("/agents").json()
+    assert first == second == {"ai_response": id(container.ai_response_agent), "llm": id(container.llm_agent)}
+
+def test_implementations_can_be_swapped():
+    fake = object()
+    container = dataclasses.replace(AppContainer.create(), ai_response_agent=fake)
+    assert TestClient(_app(container)).get("/agents").json()["ai_response"] == id(fake)
+
+    app = _app(None)
+    app.dependency_overrides[get_container] = lambda: container
+    assert TestClient(app).get("/agents").json()["ai_response"] == id(fake)
+
+def test_missing_container_fails_loudly():
+    with pytest.raises(RuntimeError, match="lifespan"):
+        TestClient(_app(None)).get("/agents")
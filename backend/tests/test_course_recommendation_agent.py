@@ -1,3 +1,4 @@
+import asyncio
 import pytest
 import os
 from pathlib import Path
@@ -164,4 +165,57 @@ async def test_recommend_courses_stream(agent, sample_context, sample_intent, te
             assert any("课程推荐完成" in log for log in data["logs"])
             # 验证课程名出现在日志中
             course_name = test_pdf_file.stem
-            assert any(course_name in log for log in data["logs"]) 
\ No newline at end of file
+            assert any(course_name in log for log in data["logs"])
+
+@pytest.mark.asyncio
+async def test_recommend_courses_stream_uses_prefetched_retrieval(agent, sample_context, sample_intent, monkeypatch):
+    """传入提前开始的检索时直接使用其结果，不再重新检索"""
+    async def fail_search(query):
+        raise AssertionError("不应重新检索")
+
+    async def prefetched():
+        return [{"title": "课程A", "relevance_score": 0.9}], ["搜索完成，找到 1 个相关课程"]
+
+    monkeypatch.setattr(agent, "search_courses", fail_search)
+    results = [r async for r in agent.recommend_courses_stream(sample_context, sample_intent, retrieval=prefetched())]
+    data = results[0]["data"]
+    assert data["recommendations"] == [{"title": "课程A", "relevance_score": 0.9}]
+    assert data["metadata"]["query_context"]["intent"] == "AI培训咨询"
+    assert "搜索完成，找到 1 个相关课程" in data["logs"]
+
+@pytest.mark.asyncio
+async def test_concurrent_first_requests_load_courses_once(agent, monkeypatch):
+    """并发的首次请求只加载一次课程，加载完成前不会读到部分结果"""
+    calls = []
+
+    async def load():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        agent.course_contents = {"课程A": {"title": "课程A"}}
+
+    monkeypatch.setattr(agent, "_load_course_contents", load)
+    await asyncio.gather(*(agent._ensure_course_contents() for _ in range(5)))
+    assert len(calls) == 1
+    assert agent._loaded
+    await agent._ensure_course_contents()
+    assert len(calls) == 1
+
+@pytest.mark.asyncio
+async def test_cancelled_first_caller_does_not_abort_loading(agent, monkeypatch):
+    """第一个等待加载的请求被取消后加载继续进行，后续请求不会重新加载"""
+    calls = []
+
+    async def load():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        agent.course_contents = {"课程A": {"title": "课程A"}}
+
+    monkeypatch.setattr(agent, "_load_course_contents", load)
+    first = asyncio.ensure_future(agent._ensure_course_contents())
+    await asyncio.sleep(0.01)
+    first.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await first
+    await agent._ensure_course_contents()
+    assert len(calls) == 1
+    assert agent._loaded